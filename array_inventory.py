@@ -0,0 +1,327 @@
+import time
+import tracemalloc
+from array import array
+
+from composition_ex_oop import InventoryService, OutOfStockError
+from order_records import OrderBatch
+
+"""
+DefaultInventoryService always says the item is there, there is no stock model behind it.
+ArrayInventoryService is a real in-memory InventoryService that can hold millions of SKUs.
+
+Why not a dict of {item_name: count}?
+Every SKU then costs a dict entry, a str object for its name and an int object for its count,
+for millions of SKUs that per-entry object overhead is what runs the node out of memory.
+
+Instead NOTHING is kept as a Python object per SKU:
+    _SkuTable gives every SKU name an integer index (its sku id), the names live back to back
+    in ONE bytearray and the name -> id lookup is an open addressing hash table in a typed array
+    Stock counts live in ONE typed array, 8 bytes per SKU, indexed by sku id
+    check and reserve are a hash probe plus an array read / write -> O(1)
+
+BATCHES come with their SKUs already interned upstream (order_records.OrderBatch, order_file.OrderFile):
+    sku_ids(sku_names)              translates such a SKU table ONCE, not once per order
+    reserve_quantities(ids, qtys)   all or nothing for the whole batch, with numpy it is a few
+                                    vector operations over a zero copy view of the stock array
+                                    (np.add.at / np.subtract.at), without numpy a loop per distinct SKU
+    reserve_batch(order_batch)      both of the above for an OrderBatch
+
+Run this module for the measured bytes per SKU against a plain dict.
+
+It is still an InventoryService so OrderService does not change at all (Dependency Inversion).
+"""
+
+
+class _SkuTable:
+    # name -> sku id with no Python object per SKU, NOT safe to share between threads
+    #     names   bytearray, every name once as UTF-8, back to back
+    #     ends    array("q"), where name i ends in names (it starts where name i - 1 ends)
+    #     slots   array("i"), open addressing hash table of sku ids, -1 is empty, at most 2/3 full
+
+    def __init__(self):
+        self._names = bytearray()
+        self._ends = array("q")
+        self._slots = array("i", [-1]) * 8
+        self._mask = 7
+
+    def __len__(self):
+        return len(self._ends)
+
+    def _encoded(self, sku_id):
+        start = self._ends[sku_id - 1] if sku_id else 0
+        return self._names[start:self._ends[sku_id]]
+
+    def name(self, sku_id):
+        return self._encoded(sku_id).decode("utf-8")
+
+    def _probe(self, encoded):
+        # Index of the slot holding encoded's sku id, or of the empty slot it would go in
+        slots = self._slots
+        mask = self._mask
+        index = hash(encoded) & mask
+        while True:
+            sku_id = slots[index]
+            if sku_id < 0 or self._encoded(sku_id) == encoded:
+                return index
+            index = (index + 1) & mask
+
+    def get(self, item_name):
+        sku_id = self._slots[self._probe(item_name.encode("utf-8"))]
+        return None if sku_id < 0 else sku_id
+
+    def add(self, item_name):
+        encoded = item_name.encode("utf-8")
+        index = self._probe(encoded)
+        sku_id = self._slots[index]
+        if sku_id >= 0:
+            return sku_id
+        sku_id = len(self._ends)
+        self._names += encoded
+        self._ends.append(len(self._names))
+        self._slots[index] = sku_id
+        if 3 * len(self._ends) > 2 * len(self._slots):
+            self._grow()
+        return sku_id
+
+    def _grow(self):
+        self._slots = array("i", [-1]) * (2 * len(self._slots))
+        self._mask = len(self._slots) - 1
+        for sku_id in range(len(self._ends)):
+            self._slots[self._probe(bytes(self._encoded(sku_id)))] = sku_id
+
+    def memory_usage(self):
+        return len(self._names) + sum(column.itemsize * len(column) for column in (self._ends, self._slots))
+
+
+class ArrayInventoryService(InventoryService):
+    # "q" is a signed 64 bit count per SKU
+    STOCK_TYPECODE = "q"
+
+    def __init__(self, stock=None):
+        self._skus = _SkuTable()
+        self._stock = array(self.STOCK_TYPECODE)
+        if stock:
+            for item_name, quantity in stock.items():
+                self.add_stock(item_name, quantity)
+
+    # =========================
+    # SKU INTERNING
+    # =========================
+    def sku_id(self, item_name):
+        # Gives the name the next free slot in the stock array the first time it is seen
+        sku_id = self._skus.add(item_name)
+        if sku_id == len(self._stock):
+            self._stock.append(0)
+        return sku_id
+
+    def sku_name(self, sku_id):
+        return self._skus.name(sku_id)
+
+    def sku_ids(self, item_names):
+        # array("q") of sku ids for an upstream SKU table, -1 for a SKU this inventory does not stock
+        get = self._skus.get
+        sku_ids = array("q")
+        for item_name in item_names:
+            sku_id = get(item_name)
+            sku_ids.append(-1 if sku_id is None else sku_id)
+        return sku_ids
+
+    def __len__(self):
+        return len(self._stock)
+
+    # =========================
+    # STOCK
+    # =========================
+    def add_stock(self, item_name, quantity):
+        self._stock[self.sku_id(item_name)] += quantity
+
+    def stock_of(self, item_name):
+        sku_id = self._skus.get(item_name)
+        return 0 if sku_id is None else self._stock[sku_id]
+
+    def check_item(self, item_name, quantity=1):
+        sku_id = self._skus.get(item_name)
+        return sku_id is not None and self._stock[sku_id] >= quantity
+
+    def reserve_item(self, item_name, quantity=1):
+        sku_id = self._skus.get(item_name)
+        if sku_id is None or self._stock[sku_id] < quantity:
+            raise OutOfStockError(f"{item_name} does not have {quantity} in stock")
+        self._stock[sku_id] -= quantity
+
+    def try_reserve(self, item_name, quantity=1):
+        # One lookup instead of check + reserve, NOT safe to share between threads,
+        # see striped_inventory.StripedInventoryService for that
+        sku_id = self._skus.get(item_name)
+        if sku_id is None or self._stock[sku_id] < quantity:
+            return False
+        self._stock[sku_id] -= quantity
+        return True
+
+    def release_item(self, item_name, quantity=1):
+        self._stock[self.sku_id(item_name)] += quantity
+
+    def check_items(self, item_names, quantities=None):
+        stock = self._stock
+        get = self._skus.get
+        if quantities is None:
+            quantities = [1] * len(item_names)
+        results = []
+        for item_name, quantity in zip(item_names, quantities):
+            sku_id = get(item_name)
+            results.append(sku_id is not None and stock[sku_id] >= quantity)
+        return results
+
+    def reserve_items(self, item_names, quantities=None):
+        # Same order semantics as calling reserve_item one by one:
+        # when a SKU runs out half way through the batch the later orders for it fail
+        get = self._skus.get
+        stock = self._stock
+        if quantities is None:
+            quantities = [1] * len(item_names)
+        results = []
+        for item_name, quantity in zip(item_names, quantities):
+            sku_id = get(item_name)
+            if sku_id is None or stock[sku_id] < quantity:
+                results.append(OutOfStockError(f"{item_name} does not have {quantity} in stock"))
+            else:
+                stock[sku_id] -= quantity
+                results.append(None)
+        return results
+
+    def try_reserve_items(self, item_names, quantities=None):
+        # try_reserve for every item in batch order, a SKU that runs out half way fails its later orders
+        get = self._skus.get
+        stock = self._stock
+        if quantities is None:
+            quantities = [1] * len(item_names)
+        results = []
+        for item_name, quantity in zip(item_names, quantities):
+            sku_id = get(item_name)
+            if sku_id is None or stock[sku_id] < quantity:
+                results.append(False)
+            else:
+                stock[sku_id] -= quantity
+                results.append(True)
+        return results
+
+    # =========================
+    # VECTORIZED BATCH RESERVE
+    # =========================
+    def reserve_quantities(self, sku_ids, quantities):
+        """
+        Subtracts quantities[i] from sku_ids[i] for the whole batch in one call, all or nothing.
+        Repeated sku ids are summed first so thousands of orders for one hot SKU are one decrement.
+        Raises OutOfStockError without touching any stock if ANY SKU does not have enough
+        (a sku id of -1, a SKU this inventory does not stock, never has enough).
+        """
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is None:
+            self._reserve_quantities_loop(sku_ids, quantities)
+            return
+        sku_ids = numpy.asarray(sku_ids, dtype=numpy.int64)
+        quantities = numpy.asarray(quantities, dtype=numpy.int64)
+        if not sku_ids.size:
+            return
+        unknown = sku_ids < 0
+        if unknown.any():
+            raise OutOfStockError(f"Not enough stock for {int(unknown.sum())} order(s) of unknown SKUs")
+        distinct, positions = numpy.unique(sku_ids, return_inverse=True)
+        demand = numpy.zeros(len(distinct), dtype=numpy.int64)
+        numpy.add.at(demand, positions, quantities)
+        # Zero copy, the array cannot grow while the view is alive so it is dropped before returning
+        stock = numpy.frombuffer(self._stock, dtype=numpy.int64)
+        try:
+            short = distinct[stock[distinct] < demand]
+            if short.size:
+                self._raise_short(short.tolist())
+            numpy.subtract.at(stock, distinct, demand)
+        finally:
+            del stock
+
+    def _reserve_quantities_loop(self, sku_ids, quantities):
+        demand = {}
+        for sku_id, quantity in zip(sku_ids, quantities):
+            demand[sku_id] = demand.get(sku_id, 0) + quantity
+        if -1 in demand:
+            raise OutOfStockError("Not enough stock for orders of unknown SKUs")
+        stock = self._stock
+        short = [sku_id for sku_id, quantity in demand.items() if stock[sku_id] < quantity]
+        if short:
+            self._raise_short(short)
+        for sku_id, quantity in demand.items():
+            stock[sku_id] -= quantity
+
+    def _raise_short(self, short):
+        names = ", ".join(self.sku_name(sku_id) for sku_id in short[:5])
+        raise OutOfStockError(f"Not enough stock for {len(short)} SKU(s): {names}")
+
+    def reserve_batch(self, order_batch):
+        # All or nothing for an order_records.OrderBatch, its SKU table is translated once
+        table = self.sku_ids(order_batch.sku_names)
+        try:
+            import numpy
+        except ImportError:
+            sku_ids = [table[sku_id] for sku_id in order_batch.sku_id_column]
+        else:
+            sku_ids = numpy.asarray(table)[numpy.frombuffer(order_batch.sku_id_column, dtype=numpy.uint32)]
+        self.reserve_quantities(sku_ids, order_batch.quantity_column)
+
+    def memory_usage(self):
+        # Bytes held for every SKU, the stock counts plus the name -> id table
+        return self._stock.itemsize * len(self._stock) + self._skus.memory_usage()
+
+
+# =========================
+# MAIN
+# =========================
+def _measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, after - before
+
+
+def main():
+    sku_count = 300_000
+    batch_size = 10_000
+
+    # Names are built on the fly, whatever the store keeps of them is counted
+    def as_dict():
+        return {f"SKU-{number}": 100 for number in range(sku_count)}
+
+    def as_array_inventory():
+        inventory = ArrayInventoryService()
+        for number in range(sku_count):
+            inventory.add_stock(f"SKU-{number}", 100)
+        return inventory
+
+    print(f"{sku_count:,} SKUs, measured with tracemalloc")
+    print(f"{'store':<24} {'bytes/SKU':>10}")
+    for name, build in (("dict {name: count}", as_dict), ("ArrayInventoryService", as_array_inventory)):
+        kept, used = _measure(build)
+        print(f"{name:<24} {used / sku_count:>10.1f}")
+    inventory = kept
+
+    batch = OrderBatch()
+    for number in range(batch_size):
+        batch.append(f"SKU-{number * 7 % 1000}", "LOW_EXPENSIVE", "NORMAL", 1 + number % 3)
+    try:
+        import numpy  # noqa: F401  imported up front so the timing does not include it
+        how = "numpy"
+    except ImportError:
+        how = "no numpy, loop per distinct SKU"
+    started = time.perf_counter()
+    inventory.reserve_batch(batch)
+    elapsed = time.perf_counter() - started
+    print(f"Reserved a {len(batch):,} order OrderBatch in {elapsed * 1000:.2f}ms ({how})")
+    print(f"SKU-0 stock left: {inventory.stock_of('SKU-0')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import asyncio
+import contextlib
+import functools
+import io
+import time
+from abc import ABC, abstractmethod
+
+from composition_ex_oop import (
+    DefaultInventoryService,
+    DefaultPackagingService,
+    DelhiveryShippingService,
+    ETAChecker,
+    InventoryService,
+    OrderResult,
+    PackagingService,
+    ShippingService,
+    Trackable,
+)
+from order_codes import PackagingType, parse_quantity
+from order_events import EventSource
+
+"""
+Every stage of OrderService.process_order is blocking, one slow carrier call blocks the whole worker.
+AsyncOrderService is the same orchestrator on asyncio:
+    Thousands of orders can be in flight on ONE event loop
+    Steps that do not depend on each other overlap,
+    after ship_item the tracking and ETA lookups run at the same time
+
+Same Interface Segregation as the sync version, a carrier only implements what it supports:
+    AsyncShippingService, AsyncTrackable, AsyncETAChecker
+
+Existing SYNC services do not have to be rewritten, AsyncOrderService wraps them in an adapter
+that runs the blocking call in an executor so the event loop never blocks.
+"""
+
+
+# =========================
+# ASYNC ABSTRACTIONS
+# =========================
+class AsyncInventoryService(ABC):
+    @abstractmethod
+    async def check_item(self, item_name, quantity=1):
+        pass
+
+    @abstractmethod
+    async def reserve_item(self, item_name, quantity=1):
+        pass
+
+    # Same contract as InventoryService.try_reserve, override it to make it atomic
+    async def try_reserve(self, item_name, quantity=1):
+        if not await self.check_item(item_name, quantity):
+            return False
+        await self.reserve_item(item_name, quantity)
+        return True
+
+
+class AsyncPackagingService(ABC):
+    @abstractmethod
+    async def package_item(self, packaging_type):
+        pass
+
+
+# Same signatures as the sync Trackable / ETAChecker
+class AsyncTrackable(ABC):
+    @abstractmethod
+    async def track_service(self, shipment_id=None):
+        pass
+
+
+class AsyncETAChecker(ABC):
+    @abstractmethod
+    async def eta_service(self, origin=None, destination=None):
+        pass
+
+
+class AsyncShippingService(ABC):
+    # Returns the shipment id when the carrier gives one
+    @abstractmethod
+    async def ship_item(self):
+        pass
+
+
+# =========================
+# SYNC -> ASYNC ADAPTERS
+# =========================
+class _ExecutorAdapter:
+    # Runs the wrapped sync service's methods in an executor (None = the loop's default thread pool)
+    def __init__(self, service, executor=None):
+        self.service = service
+        self.executor = executor
+
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(method, *args))
+
+
+class AsyncInventoryAdapter(_ExecutorAdapter, AsyncInventoryService):
+    async def check_item(self, item_name, quantity=1):
+        return await self._call(self.service.check_item, item_name, quantity)
+
+    async def reserve_item(self, item_name, quantity=1):
+        return await self._call(self.service.reserve_item, item_name, quantity)
+
+    async def try_reserve(self, item_name, quantity=1):
+        # ONE executor hop, atomic when the wrapped inventory's try_reserve is
+        return await self._call(self.service.try_reserve, item_name, quantity)
+
+
+class AsyncPackagingAdapter(_ExecutorAdapter, AsyncPackagingService):
+    async def package_item(self, packaging_type):
+        return await self._call(self.service.package_item, packaging_type)
+
+
+class AsyncShippingAdapter(_ExecutorAdapter, AsyncShippingService):
+    async def ship_item(self):
+        return await self._call(self.service.ship_item)
+
+
+class _AsyncTrackingMixin(AsyncTrackable):
+    async def track_service(self, shipment_id=None):
+        return await self._call(self.service.track_service, shipment_id)
+
+
+class _AsyncETAMixin(AsyncETAChecker):
+    async def eta_service(self, origin=None, destination=None):
+        return await self._call(self.service.eta_service, origin, destination)
+
+
+# The adapter only claims the capabilities the wrapped carrier really has (Interface Segregation)
+class AsyncTrackableShippingAdapter(_AsyncTrackingMixin, AsyncShippingAdapter):
+    pass
+
+
+class AsyncETAShippingAdapter(_AsyncETAMixin, AsyncShippingAdapter):
+    pass
+
+
+class AsyncTrackableETAShippingAdapter(_AsyncTrackingMixin, _AsyncETAMixin, AsyncShippingAdapter):
+    pass
+
+
+def to_async_inventory(service, executor=None):
+    if isinstance(service, AsyncInventoryService):
+        return service
+    if not isinstance(service, InventoryService):
+        raise TypeError(f"{type(service).__name__} is not an InventoryService")
+    return AsyncInventoryAdapter(service, executor)
+
+
+def to_async_packaging(service, executor=None):
+    if isinstance(service, AsyncPackagingService):
+        return service
+    if not isinstance(service, PackagingService):
+        raise TypeError(f"{type(service).__name__} is not a PackagingService")
+    return AsyncPackagingAdapter(service, executor)
+
+
+def to_async_shipping(service, executor=None):
+    if isinstance(service, AsyncShippingService):
+        return service
+    if not isinstance(service, ShippingService):
+        raise TypeError(f"{type(service).__name__} is not a ShippingService")
+    trackable = isinstance(service, Trackable)
+    has_eta = isinstance(service, ETAChecker)
+    if trackable and has_eta:
+        return AsyncTrackableETAShippingAdapter(service, executor)
+    if trackable:
+        return AsyncTrackableShippingAdapter(service, executor)
+    if has_eta:
+        return AsyncETAShippingAdapter(service, executor)
+    return AsyncShippingAdapter(service, executor)
+
+
+# =========================
+# ASYNC ORDER SERVICE (Orchestrator)
+# =========================
+class AsyncOrderService(EventSource):
+    # Accepts async services or plain sync ones, sync ones are adapted automatically
+    def __init__(self, inventory_service, packaging_service, shipping_service, executor=None):
+        self.inventory_service = to_async_inventory(inventory_service, executor)
+        self.packaging_service = to_async_packaging(packaging_service, executor)
+        self.shipping_service = to_async_shipping(shipping_service, executor)
+        # The carrier's capabilities are looked at ONCE here, not with two isinstance checks per order
+        shipping_service = self.shipping_service
+        self._track = shipping_service.track_service if isinstance(shipping_service, AsyncTrackable) else None
+        self._eta = shipping_service.eta_service if isinstance(shipping_service, AsyncETAChecker) else None
+
+    async def process_order(self, item_name, packaging_type, quantity=1):
+        # Normalised before any stock is reserved, like OrderService.process_order
+        packaging_type = PackagingType.parse(packaging_type)
+        quantity = parse_quantity(quantity)
+        if not await self.inventory_service.try_reserve(item_name, quantity):
+            return False
+        await self.packaging_service.package_item(packaging_type)
+        shipment_id = await self.shipping_service.ship_item()
+
+        # Tracking and ETA only depend on the shipment, not on each other -> run them together
+        follow_ups = []
+        if self._track is not None:
+            follow_ups.append(self._track(shipment_id))
+        if self._eta is not None:
+            follow_ups.append(self._eta())
+        if follow_ups:
+            await asyncio.gather(*follow_ups)
+
+        self.event_sink.emit("order_processed", item_name=item_name)
+        return True
+
+    async def process_orders(self, orders, max_in_flight=1000):
+        """
+        Runs many orders concurrently on the running loop, at most max_in_flight at a time
+        orders use the same dict format as OrderService.process_orders
+        gives back one OrderResult per order in submission order, a failed order does not stop the others
+        """
+        limit = asyncio.Semaphore(max_in_flight)
+
+        async def run(order):
+            async with limit:
+                try:
+                    processed = await self.process_order(order["item_name"], order["packaging_type"],
+                                                         order.get("quantity", 1))
+                except Exception as error:
+                    return OrderResult(order["item_name"], False, error)
+                return OrderResult(order["item_name"], processed, None)
+
+        return await asyncio.gather(*(run(order) for order in orders))
+
+
+# =========================
+# MAIN
+# =========================
+class SlowAsyncDelhiveryShippingService(AsyncShippingService, AsyncTrackable, AsyncETAChecker):
+    # Pretends every carrier call takes 100ms of network time
+    async def ship_item(self):
+        await asyncio.sleep(0.1)
+
+    async def track_service(self, shipment_id=None):
+        await asyncio.sleep(0.1)
+
+    async def eta_service(self, origin=None, destination=None):
+        await asyncio.sleep(0.1)
+
+
+async def _run_demo():
+    print("---- Async Order Flow (sync services adapted) ----")
+    order_service = AsyncOrderService(DefaultInventoryService(), DefaultPackagingService(),
+                                      DelhiveryShippingService())
+    await order_service.process_order(item_name="iPhone 16", packaging_type="NORMAL")
+
+    print("---- 1000 orders against a 100ms carrier ----")
+    order_service = AsyncOrderService(DefaultInventoryService(), DefaultPackagingService(),
+                                      SlowAsyncDelhiveryShippingService())
+    orders = [{"item_name": "iPhone 16", "packaging_type": "GIFT"} for _ in range(1000)]
+    started = time.perf_counter()
+    # the sync inventory / packaging services print a lot, keep the terminal readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = await order_service.process_orders(orders)
+    elapsed = time.perf_counter() - started
+    processed = sum(result.processed for result in results)
+    print(f"{processed} orders processed in {elapsed:.2f}s "
+          f"(one after the other it would take at least {processed * 0.2:.0f}s)")
+
+
+def main():
+    asyncio.run(_run_demo())
+
+
+if __name__ == "__main__":
+    main()
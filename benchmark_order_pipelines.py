@@ -0,0 +1,223 @@
+import argparse
+import importlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+"""
+Every SOLID module implements the same order flow with a different design, this measures what each costs.
+
+    python benchmark_order_pipelines.py --orders 50000 --output results.json
+
+For every variant the same synthetic orders are pushed one by one through its
+OrderService.process_order (or SingleResponsibilityBadExample.place_order_with_delivery_partner)
+with stdout suppressed, and it reports orders/sec and p50 / p99 / p999 latency.
+
+OrderService objects are built ONCE per category before timing starts,
+only the per-order call is timed.
+liskov_substitution_bad_example.py is the Bird example and has no order flow, it is listed as skipped.
+"""
+
+ITEM_NAMES = [f"SKU-{number}" for number in range(1000)]
+CATEGORIES = ("ULTRA_EXPENSIVE", "LOW_EXPENSIVE")
+PACKAGING_TYPES = ("GIFT", "NORMAL")
+
+
+class _NullWriter(io.TextIOBase):
+    # Cheaper than StringIO, nothing is kept
+    def write(self, text):
+        return len(text)
+
+
+def synthetic_orders(count, seed=42):
+    randomizer = random.Random(seed)
+    return [(randomizer.choice(ITEM_NAMES), randomizer.choice(CATEGORIES), randomizer.choice(PACKAGING_TYPES))
+            for _ in range(count)]
+
+
+# =========================
+# VARIANTS
+# =========================
+# Each builder gets the imported module and returns place(item_name, category, packaging_type)
+# category always comes in as "ULTRA_EXPENSIVE" / "LOW_EXPENSIVE", builders translate it to the
+# spelling their module uses
+
+def _build_single_responsibility_bad(module):
+    spelling = {"ULTRA_EXPENSIVE": "ULTRA EXPENSIVE", "LOW_EXPENSIVE": "LOW EXPENSIVE"}
+
+    def place(item_name, category, packaging_type):
+        module.SingleResponsibilityBadExample(item_name, spelling[category],
+                                              packaging_type).place_order_with_delivery_partner()
+    return place
+
+
+def _build_category_argument(spelling):
+    # OrderService() with process_order(item_name, category, packaging_type)
+    def build(module):
+        order_service = module.OrderService()
+
+        def place(item_name, category, packaging_type):
+            order_service.process_order(item_name, spelling.get(category, category), packaging_type)
+        return place
+    return build
+
+
+def _build_category_constructor(spelling):
+    # OrderService(category) with process_order(item_name, packaging_type)
+    def build(module):
+        order_services = {category: module.OrderService(spelling.get(category, category))
+                          for category in CATEGORIES}
+
+        def place(item_name, category, packaging_type):
+            order_services[category].process_order(item_name, packaging_type)
+        return place
+    return build
+
+
+def _build_dependency_inversion_good(module):
+    carriers = {"ULTRA_EXPENSIVE": module.EkartShippingService(), "LOW_EXPENSIVE": module.DelhiveryShippingService()}
+    order_services = {category: module.OrderService(module.DefaultInventoryService(),
+                                                    module.DefaultPackagingService(), carrier)
+                      for category, carrier in carriers.items()}
+
+    def place(item_name, category, packaging_type):
+        order_services[category].process_order(item_name, packaging_type)
+    return place
+
+
+def _build_composition(module):
+    order_services = {category: module.OrderService(module.DefaultInventoryService(),
+                                                    module.DefaultPackagingService(),
+                                                    module.CARRIER_REGISTRY.carrier_for(category))
+                      for category in CATEGORIES}
+
+    def place(item_name, category, packaging_type):
+        order_services[category].process_order(item_name, packaging_type)
+    return place
+
+
+_SPACED = {"ULTRA_EXPENSIVE": "ULTRA EXPENSIVE", "LOW_EXPENSIVE": "LOW EXPENSIVE"}
+
+VARIANTS = [
+    ("single_responsibility (bad)", "single_responsibility", _build_single_responsibility_bad),
+    ("single_responsibility", "single_responsibility", _build_category_argument(_SPACED)),
+    ("open_closed_bad_example", "open_closed_bad_example", _build_category_argument(_SPACED)),
+    ("open_closed_good_example", "open_closed_good_example", _build_category_constructor(_SPACED)),
+    ("liskov_substitution_bad_example", "liskov_substitution_bad_example", None),
+    ("liskov_substitution_bad_example_adv", "liskov_substitution_bad_example_adv", _build_category_constructor({})),
+    ("liskov_substitution_good_example_adv", "liskov_substitution_good_example_adv", _build_category_constructor({})),
+    ("interface_segregation_bad_example", "interface_segregation_bad_example", _build_category_constructor({})),
+    ("interface_segregation_good_example", "interface_segregation_good_example", _build_category_constructor({})),
+    ("dependency_inversion_bad_example", "dependency_inversion_bad_example", _build_category_constructor({})),
+    ("dependency_inversion_good_example", "dependency_inversion_good_example", _build_dependency_inversion_good),
+    ("composition_ex_oop", "composition_ex_oop", _build_composition),
+]
+
+
+# =========================
+# MEASURING
+# =========================
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_variant(place, orders, warmup):
+    for item_name, category, packaging_type in orders[:warmup]:
+        place(item_name, category, packaging_type)
+
+    latencies = []
+    errors = 0
+    clock = time.perf_counter_ns
+    started = clock()
+    for item_name, category, packaging_type in orders:
+        order_started = clock()
+        try:
+            place(item_name, category, packaging_type)
+        except Exception:
+            errors += 1
+        latencies.append(clock() - order_started)
+    elapsed = (clock() - started) / 1e9
+
+    latencies.sort()
+    return {
+        "orders": len(orders),
+        "errors": errors,
+        "seconds": elapsed,
+        "orders_per_sec": len(orders) / elapsed if elapsed else 0.0,
+        "p50_us": percentile(latencies, 0.50) / 1000,
+        "p99_us": percentile(latencies, 0.99) / 1000,
+        "p999_us": percentile(latencies, 0.999) / 1000,
+    }
+
+
+def run_benchmarks(order_count, warmup, only=None, null_events=False):
+    orders = synthetic_orders(order_count)
+    if null_events:
+        from order_events import EventSource, NullEventSink
+        EventSource.event_sink = NullEventSink()
+
+    results = []
+    for name, module_name, build in VARIANTS:
+        if only and not any(pattern in name for pattern in only):
+            continue
+        if build is None:
+            results.append({"variant": name, "skipped": "no order pipeline in this module"})
+            continue
+        real_stdout = sys.stdout
+        sys.stdout = _NullWriter()
+        try:
+            module = importlib.import_module(module_name)
+            result = run_variant(build(module), orders, warmup)
+        finally:
+            sys.stdout = real_stdout
+        results.append({"variant": name, **result})
+    return results
+
+
+def print_table(results):
+    print(f"{'variant':<40} {'orders/sec':>12} {'p50 us':>9} {'p99 us':>9} {'p999 us':>9} {'errors':>7}")
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['variant']:<40} skipped: {result['skipped']}")
+            continue
+        print(f"{result['variant']:<40} {result['orders_per_sec']:>12,.0f} {result['p50_us']:>9.1f} "
+              f"{result['p99_us']:>9.1f} {result['p999_us']:>9.1f} {result['errors']:>7}")
+
+
+# =========================
+# MAIN
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput and latency of every order pipeline variant")
+    parser.add_argument("--orders", type=int, default=20000, help="timed orders per variant")
+    parser.add_argument("--warmup", type=int, default=1000, help="untimed orders run first")
+    parser.add_argument("--only", nargs="*", help="only run variants whose name contains one of these")
+    parser.add_argument("--null-events", action="store_true",
+                        help="send composition_ex_oop events to a NullEventSink instead of the console")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.orders, args.warmup, args.only, args.null_events)
+    print_table(results)
+
+    if args.output:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "orders": args.orders,
+            "warmup": args.warmup,
+            "null_events": args.null_events,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import threading
+
+"""
+Carrier selection used to be an if / else chain copied into every OrderService:
+
+    if category == "ULTRA_EXPENSIVE":
+        self.shipping_service = EkartShippingService()
+    else:
+        self.shipping_service = DelhiveryShippingService()
+
+That chain is a business rule (OCP violation, a new carrier means editing every copy)
+and it builds a NEW carrier object for every order.
+
+CarrierRegistry is the Registry-based Factory:
+    Carriers REGISTER for the categories they serve, nobody edits a chain to add one
+    Lookup is one dict access (O(1) dispatch table), no branches
+    Each carrier class is built ONCE and the same long-lived instance is handed out to every order
+
+    registry = CarrierRegistry()
+    registry.register("ULTRA_EXPENSIVE", EkartShippingService)
+
+    @registry.register("MEDIUM_EXPENSIVE")
+    class BluedartShippingService(ShippingService): ...
+
+    shipping_service = registry.carrier_for("ULTRA_EXPENSIVE")
+
+Pass normalize=Category.parse (order_codes.py) and every category is turned into its int enum
+on the way in, so "ULTRA EXPENSIVE" and "ULTRA_EXPENSIVE" are the same key and an unknown
+category raises instead of being routed anywhere.
+"""
+
+
+class UnknownCategoryError(LookupError):
+    pass
+
+
+class CarrierRegistry:
+
+    def __init__(self, default_carrier_class=None, normalize=None):
+        # default_carrier_class is used for categories nobody registered for,
+        # leave it as None to reject unknown categories
+        self._carrier_classes = {}
+        self._instances = {}
+        self._default_carrier_class = default_carrier_class
+        self._normalize = normalize
+        self._lock = threading.Lock()
+
+    def register(self, category, carrier_class=None):
+        # Works as a plain call or as a class decorator
+        if carrier_class is None:
+            def decorator(cls):
+                self.register(category, cls)
+                return cls
+            return decorator
+        if self._normalize is not None:
+            category = self._normalize(category)
+        self._carrier_classes[category] = carrier_class
+        return carrier_class
+
+    def carrier_class_for(self, category):
+        if self._normalize is not None:
+            category = self._normalize(category)
+        carrier_class = self._carrier_classes.get(category, self._default_carrier_class)
+        if carrier_class is None:
+            raise UnknownCategoryError(f"No carrier registered for category {category!r}")
+        return carrier_class
+
+    def carrier_for(self, category):
+        carrier_class = self.carrier_class_for(category)
+        carrier = self._instances.get(carrier_class)
+        if carrier is None:
+            # Only the first lookup of a carrier pays for building it, the lock makes sure
+            # two threads doing that first lookup at the same time still share ONE instance
+            with self._lock:
+                carrier = self._instances.get(carrier_class)
+                if carrier is None:
+                    carrier = carrier_class()
+                    self._instances[carrier_class] = carrier
+        return carrier
+
+    def categories(self):
+        return list(self._carrier_classes)
+
+    def carrier_classes(self):
+        # Every distinct carrier class registered, in registration order
+        return list(dict.fromkeys(self._carrier_classes.values()))
+
+    def carriers_with(self, required_capabilities):
+        # Routing query eg registry.carriers_with(Capability.TRACKING | Capability.ETA)
+        # uses the capabilities bitmask each carrier class got when it was created
+        return [carrier_class for carrier_class in self.carrier_classes()
+                if getattr(carrier_class, "capabilities", 0) & required_capabilities == required_capabilities]
@@ -0,0 +1,201 @@
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+"""
+Our carriers only print, so nothing measured real I/O before production.
+CarrierSimulator is a small local HTTP server that behaves like the carriers' booking APIs,
+with a CarrierProfile per carrier:
+
+    latency        ("fixed", seconds) / ("uniform", low, high) / ("lognormal", median_seconds, sigma)
+    error_rate     fraction of requests answered with 503
+    rate_limit     requests per second (token bucket), above it the answer is 429
+
+Endpoints (all JSON, HTTP/1.1 keep-alive):
+    POST /<carrier>/shipments                     book a parcel       -> {"shipment_id": ...}
+    GET  /<carrier>/shipments/<shipment_id>       track one parcel    -> {"status": ...}
+    POST /<carrier>/tracking {"shipment_ids": []} track many parcels  -> {"statuses": {...}}
+    GET  /<carrier>/eta?origin=..&destination=..  ETA quote           -> {"eta": ...}
+
+    with CarrierSimulator({"delhivery": CarrierProfile(latency=("fixed", 0.005))}) as simulator:
+        simulator.url  -> "http://127.0.0.1:<port>"
+"""
+
+
+class CarrierProfile:
+
+    def __init__(self, latency=("fixed", 0.0), error_rate=0.0, rate_limit=None, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._random = random.Random(seed)
+        self._tokens = float(rate_limit or 0)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        kind, *params = self.latency
+        with self._lock:
+            if kind == "fixed":
+                return params[0]
+            if kind == "uniform":
+                return self._random.uniform(params[0], params[1])
+            if kind == "lognormal":
+                median, sigma = params
+                return median * self._random.lognormvariate(0.0, sigma)
+        raise ValueError(f"Unknown latency distribution {kind!r}")
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def allow(self):
+        # Token bucket, refilled continuously up to one second worth of requests
+        if self.rate_limit is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.rate_limit), self._tokens + (now - self._refilled_at) * self.rate_limit)
+            self._refilled_at = now
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class _CarrierRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection open between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without TCP_NODELAY a kept-alive connection
+    # waits on the client's delayed ACK for every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        simulator = self.server.simulator
+        simulator.count_connection(self.client_address)
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        profile = simulator.profiles.get(parts[0]) if parts else None
+        if profile is None:
+            return self._reply(404, {"error": "unknown carrier"})
+        if not profile.allow():
+            return self._reply(429, {"error": "rate limited"})
+        time.sleep(profile.sample_latency())
+        if profile.should_fail():
+            return self._reply(503, {"error": "carrier unavailable"})
+
+        carrier, route = parts[0], parts[1:]
+        if method == "POST" and route == ["shipments"]:
+            return self._reply(201, {"shipment_id": simulator.book(carrier)})
+        if method == "GET" and len(route) == 2 and route[0] == "shipments":
+            return self._reply(200, {"status": simulator.status(route[1])})
+        if method == "POST" and route == ["tracking"]:
+            statuses = {shipment_id: simulator.status(shipment_id) for shipment_id in body.get("shipment_ids", [])}
+            return self._reply(200, {"statuses": statuses})
+        if method == "GET" and route == ["eta"]:
+            query = parse_qs(url.query)
+            destination = query.get("destination", [""])[0]
+            return self._reply(200, {"eta": f"{len(destination) % 4 + 1} DAYS"})
+        return self._reply(404, {"error": "unknown route"})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CarrierSimulator:
+    STATUSES = ("BOOKED", "PICKED_UP", "IN_TRANSIT", "OUT_FOR_DELIVERY", "DELIVERED")
+
+    def __init__(self, profiles, host="127.0.0.1", port=0):
+        self.profiles = profiles
+        self._server = ThreadingHTTPServer((host, port), _CarrierRequestHandler)
+        self._server.daemon_threads = True
+        self._server.simulator = self
+        self._thread = None
+        self._shipment_numbers = itertools.count(1)
+        self._polls = {}
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def connections_seen(self):
+        # Distinct client sockets so far, shows how well clients reuse connections
+        with self._lock:
+            return len(self._connections)
+
+    def count_connection(self, client_address):
+        with self._lock:
+            self._connections.add(client_address)
+
+    def book(self, carrier):
+        return f"{carrier.upper()}-{next(self._shipment_numbers)}"
+
+    def status(self, shipment_id):
+        with self._lock:
+            polls = self._polls.get(shipment_id, 0)
+            self._polls[shipment_id] = polls + 1
+        return self.STATUSES[min(polls, len(self.STATUSES) - 1)]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="carrier-simulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    profiles = {
+        "ekart": CarrierProfile(latency=("lognormal", 0.02, 0.5), error_rate=0.01),
+        "delhivery": CarrierProfile(latency=("uniform", 0.005, 0.015), rate_limit=200),
+        "bluedart": CarrierProfile(latency=("fixed", 0.01)),
+    }
+    with CarrierSimulator(profiles, port=8080) as simulator:
+        print(f"Carrier simulator listening on {simulator.url} for {', '.join(profiles)} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,15 @@
+import functools
+import threading
+import time
 from abc import ABC, abstractmethod
+from enum import IntFlag
+
+from carrier_registry import CarrierRegistry
+from order_batches import REQUIRED, OrderResult, call_per_item, run_batch_stage, split_orders
+from order_codes import Category, PackagingType, parse_quantity
+from order_events import EventSource
+from reservation_holds import HoldNotFoundError, ReservationHolds, check_releasable
+
 
 """
 Composition means:
@@ -30,6 +41,21 @@ Use composition when:
     Responsibilities are separable
 """
 
+# =========================
+# BATCH HELPERS
+# =========================
+# OrderResult, the per-item fallback and the batch stages are shared, see order_batches.py
+
+# Guards creating an inventory's ReservationHolds the first time it is used
+_HOLDS_LOCK = threading.Lock()
+
+
+def _with_quantities(item_names, quantities):
+    if quantities is None:
+        return [(item_name, 1) for item_name in item_names]
+    return list(zip(item_names, quantities))
+
+
 # =========================
 # INVENTORY RESPONSIBILITY
 # =========================
@@ -39,15 +65,76 @@ So that any new Inventory can be supported in future also helps in OCP (Open Clo
 """
 
 
-class InventoryService(ABC):
+class InventoryService(EventSource, ABC):
+    # quantity is part of the contract, checking / reserving N units of one item is ONE call
     @abstractmethod
-    def check_item(self, item_name):
+    def check_item(self, item_name, quantity=1):
         pass
 
     @abstractmethod
-    def reserve_item(self, item_name):
+    def reserve_item(self, item_name, quantity=1):
         pass
 
+    # check + reserve as ONE step, returns False when there is not enough stock
+    # this default is only as safe as the two calls it makes, an inventory shared between
+    # threads must override it so no other order can take the stock in between
+    def try_reserve(self, item_name, quantity=1):
+        if not self.check_item(item_name, quantity):
+            return False
+        self.reserve_item(item_name, quantity)
+        return True
+
+    # release_item(item_name, quantity=1) gives reserved stock back, it is OPTIONAL:
+    # an inventory that defines it supports holds, one that does not is refused up front
+
+    # HOLDS, a reservation that is given back by itself unless it is confirmed within ttl seconds
+    # reserve_hold returns a hold id (None when out of stock), see reservation_holds.py
+    # every inventory with a release_item gets them on top of its own try_reserve
+    def reserve_hold(self, item_name, quantity=1, ttl=None):
+        return self.holds.reserve(item_name, quantity, ttl)
+
+    def confirm_hold(self, hold_id):
+        self.holds.confirm(hold_id)
+
+    def release_hold(self, hold_id):
+        self.holds.release(hold_id)
+
+    @property
+    def holds(self):
+        holds = self.__dict__.get("_holds")
+        if holds is None:
+            with _HOLDS_LOCK:
+                holds = self.__dict__.get("_holds")
+                if holds is None:
+                    holds = self.__dict__["_holds"] = ReservationHolds(self)
+        return holds
+
+    # Batch entry points are NOT abstract so every existing inventory keeps working
+    # they fall back to one call per item, an inventory that can talk to its store
+    # once per batch should override them
+    # Each entry in the returned list belongs to the item at the same position,
+    # a failing item gives back its exception instead of aborting the whole batch
+    # quantities is optional and defaults to 1 unit per item
+    def check_items(self, item_names, quantities=None):
+        return call_per_item(lambda pair: self.check_item(*pair),
+                             _with_quantities(item_names, quantities))
+
+    def reserve_items(self, item_names, quantities=None):
+        return call_per_item(lambda pair: self.reserve_item(*pair),
+                             _with_quantities(item_names, quantities))
+
+    # The batch try_reserve, True / False per item, what process_orders reserves with so two orders
+    # for the last unit in one batch can never both get it, an inventory shared between threads
+    # should override it to take its lock once per batch
+    def try_reserve_items(self, item_names, quantities=None):
+        return call_per_item(lambda pair: self.try_reserve(*pair),
+                             _with_quantities(item_names, quantities))
+
+
+# Raised by inventories that keep a real stock count when there is not enough left to reserve
+class OutOfStockError(Exception):
+    pass
+
 
 """
 Created a default implementation
@@ -55,12 +142,16 @@ Created a default implementation
 
 
 class DefaultInventoryService(InventoryService):
-    def check_item(self, item_name):
-        print(f"Checking inventory for {item_name}")
+    # Services emit events instead of printing, see order_events.py
+    def check_item(self, item_name, quantity=1):
+        self.event_sink.emit("item_checked", item_name=item_name, quantity=quantity)
         return True
 
-    def reserve_item(self, item_name):
-        print(f"Reserving {item_name} from inventory")
+    def reserve_item(self, item_name, quantity=1):
+        self.event_sink.emit("item_reserved", item_name=item_name, quantity=quantity)
+
+    def release_item(self, item_name, quantity=1):
+        self.event_sink.emit("item_released", item_name=item_name, quantity=quantity)
 
 
 # =========================
@@ -72,11 +163,14 @@ So that any new Inventory can be supported in future also helps in OCP (Open Clo
 """
 
 
-class PackagingService(ABC):
+class PackagingService(EventSource, ABC):
     @abstractmethod
     def package_item(self, packaging_type):
         pass
 
+    def package_items(self, packaging_types):
+        return call_per_item(self.package_item, packaging_types)
+
 
 """
 In this case liskov substitution is not violated since parent commits that item will be packaged
@@ -110,12 +204,17 @@ class WoodenPackagingService(PackagingService):
 
 
 class DefaultPackagingService(PackagingService):
+    # Precomputed dispatch table keyed by PackagingType code instead of comparing strings per order
+    MATERIALS = {
+        PackagingType.GIFT: ("Using gift wrap", "Adding greeting card"),
+        PackagingType.NORMAL: ("Using normal wrap",),
+    }
+
     def package_item(self, packaging_type):
-        if packaging_type == "GIFT":
-            print("Using gift wrap")
-            print("Adding greeting card")
-        else:
-            print("Using normal wrap")
+        # parse is a single dict hit when OrderService already normalised the value
+        packaging_type = PackagingType.parse(packaging_type)
+        self.event_sink.emit("packaged", packaging_type=packaging_type.name,
+                             materials=self.MATERIALS[packaging_type])
 
 
 # =========================
@@ -124,28 +223,75 @@ class DefaultPackagingService(PackagingService):
 
 
 class Trackable(ABC):
+    # shipment_id is optional, returns the shipment's current status
     @abstractmethod
-    def track_service(self):
+    def track_service(self, shipment_id=None):
         pass
 
+    # Batch poll, {shipment_id: status}. Not abstract, falls back to one track_service call per shipment
+    # a carrier with a bulk tracking endpoint should override it
+    def track_shipments(self, shipment_ids):
+        return {shipment_id: self.track_service(shipment_id) for shipment_id in shipment_ids}
+
 
 class ETAChecker(ABC):
+    # origin / destination are optional, a carrier that quotes one ETA everywhere can ignore them
+    # returns the ETA so callers (eg eta_cache.CachedETAChecker) can reuse it
     @abstractmethod
-    def eta_service(self):
+    def eta_service(self, origin=None, destination=None):
         pass
 
 
-class ShippingService(ABC):
+"""
+isinstance(carrier, Trackable) on an ABC goes through __instancecheck__ and the subclass hook caches
+and OrderService used to pay that on EVERY order.
+Instead every carrier CLASS gets its capabilities worked out ONCE when the class is created
+and stored as a bitmask, the order pipeline only does an integer AND.
+"""
+
+
+class Capability(IntFlag):
+    NONE = 0
+    TRACKING = 1
+    ETA = 2
+
+
+# Plain ints for the per-order check, an AND between two IntFlag members builds a new enum object
+_TRACKING = int(Capability.TRACKING)
+_ETA = int(Capability.ETA)
+
+
+def capabilities_of(carrier_class):
+    capabilities = Capability.NONE
+    if issubclass(carrier_class, Trackable):
+        capabilities |= Capability.TRACKING
+    if issubclass(carrier_class, ETAChecker):
+        capabilities |= Capability.ETA
+    return capabilities
+
+
+class ShippingService(EventSource, ABC):
+    # Stored as a plain int, compare it against Capability members
+    capabilities = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.capabilities = int(capabilities_of(cls))
 
     @abstractmethod
     def ship_item(self):
         pass
 
+    # ship_item books one parcel and does not need the item name
+    # item_names are only passed so that a carrier overriding the batch call knows what it ships
+    def ship_items(self, item_names):
+        return call_per_item(lambda item_name: self.ship_item(), item_names)
+
 
 class EkartShippingService(ShippingService):
 
     def ship_item(self):
-        print("Shipping via Ekart")
+        self.event_sink.emit("shipped", carrier="Ekart")
     # # WE HAD TO IMPLEMENT BOTH TRACK AND ETA HERE SINCE BASE CLASS DEMANDS IT
     # # ITS UNNECESSARY! STILL HAVE TO IMPLEMENT IT
     # def track_service(self):
@@ -158,14 +304,33 @@ class EkartShippingService(ShippingService):
 
 class DelhiveryShippingService(ShippingService, ETAChecker, Trackable):
     def ship_item(self):
-        print("Shipping via Delhivery")
+        self.event_sink.emit("shipped", carrier="Delhivery")
 
     # SINCE DELHIVERY HAS THIS FEATURE ONLY DELHIVERY IMPLEMENTS
-    def track_service(self):
-        print("TRACKING IS ENABLED")
+    def track_service(self, shipment_id=None):
+        self.event_sink.emit("tracking_enabled", carrier="Delhivery", shipment_id=shipment_id)
+        return "IN_TRANSIT"
+
+    def eta_service(self, origin=None, destination=None):
+        eta = "2 HOURS"
+        self.event_sink.emit("eta_reported", carrier="Delhivery", eta=eta)
+        return eta
 
-    def eta_service(self):
-        print("ETA TO DELIVER IS 2 HOURS!")
+
+class BluedartShippingService(ShippingService):
+    def ship_item(self):
+        self.event_sink.emit("shipped", carrier="BlueDart")
+
+
+# =========================
+# CARRIER REGISTRY
+# =========================
+# Carriers register for their category ONCE, main / OrderService never branch on category again
+# categories are normalised to Category codes, an unknown category is rejected up front
+CARRIER_REGISTRY = CarrierRegistry(normalize=Category.parse)
+CARRIER_REGISTRY.register(Category.ULTRA_EXPENSIVE, EkartShippingService)
+CARRIER_REGISTRY.register(Category.MEDIUM_EXPENSIVE, BluedartShippingService)
+CARRIER_REGISTRY.register(Category.LOW_EXPENSIVE, DelhiveryShippingService)
 
 
 # =========================
@@ -199,34 +364,270 @@ InventoryService and PackagingService need to create ABCs
 """
 
 
-class OrderService:
+class OrderService(EventSource):
     # We are now injecting ABCs as object derived by main method
     # Thus making OrderService completely independent
     # of any changes to Inventory, Packaging or Shipping
+    # metrics is optional, pass a stage_metrics.StageMetrics to time every stage of process_order
+    # outbox is optional, pass a shipment_outbox.ShipmentOutbox to log shipments instead of
+    # calling the carrier inline, a ShipmentDispatcher ships them later
+    # category is the Category this OrderService ships for, outbox records carry it so the
+    # dispatcher books them with that category's carrier
+    # hold_ttl is optional, with it process_order / process_orders only HOLD the stock until the order
+    # made it through and give it back if packaging or shipping fails (see reservation_holds.py),
+    # the inventory needs a release_item for that, it works together with metrics and outbox
     def __init__(self, inventory_service: InventoryService,
                  packaging_service: PackagingService,
-                 shipping_service: ShippingService
+                 shipping_service: ShippingService,
+                 metrics=None,
+                 outbox=None,
+                 hold_ttl=None,
+                 category=None
                  ):
         self.inventory_service = inventory_service
         self.packaging_service = packaging_service
         self.shipping_service = shipping_service
-
-    def process_order(self, item_name, packaging_type):
-        if self.inventory_service.check_item(item_name):
-            self.inventory_service.reserve_item(item_name)
-            self.packaging_service.package_item(packaging_type)
-            self.shipping_service.ship_item()
-
-            """
-            THIS IS WHERE we are checking if the service provides TRACKABLE AND ETA feature
-            IN CASE OF DELHIVERY IT WILL show and in case of EKART it wont show!
-            """
-            if isinstance(self.shipping_service, Trackable):
-                self.shipping_service.track_service()
-            if isinstance(self.shipping_service, ETAChecker):
-                self.shipping_service.eta_service()
-
-            print("Order processed successfully")
+        self.metrics = metrics
+        self.outbox = outbox
+        self.category = None if category is None else Category.parse(category)
+        if hold_ttl is not None:
+            check_releasable(inventory_service)
+        self.hold_ttl = hold_ttl
+
+    def process_order(self, item_name, packaging_type, quantity=1):
+        # Normalised at ingestion, an unknown packaging type or a quantity below 1 is rejected
+        # before any stock is reserved
+        packaging_type = PackagingType.parse(packaging_type)
+        quantity = parse_quantity(quantity)
+        if self.hold_ttl is not None:
+            return self._process_order_held(item_name, packaging_type, quantity)
+        if self.metrics is not None:
+            return self._process_order_timed(item_name, packaging_type, quantity)
+        # ATOMIC check and reserve, two concurrent orders can never both get the last unit
+        if self.inventory_service.try_reserve(item_name, quantity):
+            self._fulfil_order(item_name, packaging_type)
+
+    def _fulfil_order(self, item_name, packaging_type):
+        # Everything that happens once the stock is reserved
+        self.packaging_service.package_item(packaging_type)
+        if self.outbox is not None:
+            # OUTBOX MODE, the order is done once the shipment is durably logged
+            self.outbox.append(item_name, packaging_type, category=self.category)
+            self.event_sink.emit("order_processed", item_name=item_name)
+            return
+        self.shipping_service.ship_item()
+
+        """
+        THIS IS WHERE we are checking if the service provides TRACKABLE AND ETA feature
+        IN CASE OF DELHIVERY IT WILL show and in case of EKART it wont show!
+        The check uses the capabilities worked out when the carrier class was created
+        instead of an isinstance on the ABCs for every order
+        """
+        capabilities = self.shipping_service.capabilities
+        if capabilities & _TRACKING:
+            self.shipping_service.track_service()
+        if capabilities & _ETA:
+            self.shipping_service.eta_service()
+
+        self.event_sink.emit("order_processed", item_name=item_name)
+
+    def _process_order_held(self, item_name, packaging_type, quantity):
+        # The stock is HELD while the order is packed and shipped, confirmed once it made it
+        # through and released at once if a stage raised, the ttl covers a process that dies half way
+        inventory_service = self.inventory_service
+        if self.metrics is None:
+            hold_id = inventory_service.reserve_hold(item_name, quantity, self.hold_ttl)
+            fulfil = self._fulfil_order
+        else:
+            started = time.perf_counter_ns()
+            hold_id = inventory_service.reserve_hold(item_name, quantity, self.hold_ttl)
+            self.metrics.record("reserve", type(self.shipping_service).__name__, time.perf_counter_ns() - started)
+            fulfil = self._fulfil_order_timed
+        if hold_id is None:
+            return
+        try:
+            fulfil(item_name, packaging_type)
+        except Exception:
+            try:
+                inventory_service.release_hold(hold_id)
+            except HoldNotFoundError:
+                # It expired in the meantime, the stock is already back
+                pass
+            raise
+        try:
+            inventory_service.confirm_hold(hold_id)
+        except HoldNotFoundError:
+            # The hold expired while the order was packed and shipped and its stock went back,
+            # the parcel is out so take the stock again, the order only fails if it is gone by now
+            if not inventory_service.try_reserve(item_name, quantity):
+                raise
+
+    def _process_order_timed(self, item_name, packaging_type, quantity):
+        # Same flow as process_order, every stage is timed into metrics per carrier class
+        clock = time.perf_counter_ns
+        started = clock()
+        reserved = self.inventory_service.try_reserve(item_name, quantity)
+        self.metrics.record("reserve", type(self.shipping_service).__name__, clock() - started)
+        if reserved:
+            self._fulfil_order_timed(item_name, packaging_type)
+
+    def _fulfil_order_timed(self, item_name, packaging_type):
+        # _fulfil_order with every stage timed
+        clock = time.perf_counter_ns
+        record = self.metrics.record
+        shipping_service = self.shipping_service
+        carrier = type(shipping_service).__name__
+
+        started = clock()
+        self.packaging_service.package_item(packaging_type)
+        finished = clock()
+        record("packaging", carrier, finished - started)
+
+        if self.outbox is not None:
+            self.outbox.append(item_name, packaging_type, category=self.category)
+            record("outbox_append", carrier, clock() - finished)
+            self.event_sink.emit("order_processed", item_name=item_name)
+            return
+
+        started = finished
+        shipping_service.ship_item()
+        finished = clock()
+        record("shipping", carrier, finished - started)
+
+        capabilities = shipping_service.capabilities
+        if capabilities & _TRACKING:
+            started = clock()
+            shipping_service.track_service()
+            record("tracking", carrier, clock() - started)
+        if capabilities & _ETA:
+            started = clock()
+            shipping_service.eta_service()
+            record("eta", carrier, clock() - started)
+
+        self.event_sink.emit("order_processed", item_name=item_name)
+
+    def process_orders(self, orders):
+        """
+        Batch version of process_order, orders is a list of dicts holding the same
+        keyword arguments as process_order eg {"item_name": "iPhone 16", "packaging_type": "GIFT"}
+        "quantity" is optional and defaults to 1
+        Every stage is called ONCE for the whole batch instead of once per order
+        and the carrier capabilities are looked at once per batch
+        One failed order does not abort the rest of the batch
+        """
+        orders = list(orders)
+        results = [None] * len(orders)
+        item_names, packaging_types, quantities, pending = self._parse_orders(orders, results)
+        if self.hold_ttl is not None:
+            hold_ids = {}
+            pending = self._hold_batch(pending, item_names, quantities, results, hold_ids)
+            self._fulfil_batch(pending, item_names, packaging_types, results)
+            self._settle_holds(hold_ids, item_names, quantities, results)
+            return results
+
+        # ATOMIC check and reserve per order, a check of the whole batch followed by a reserve of
+        # the whole batch would let two orders for the last unit both through
+        pending = run_batch_stage(self.inventory_service.try_reserve_items, (item_names, quantities),
+                                  pending, results, item_names, out_of_stock_on_false=True)
+        self._fulfil_batch(pending, item_names, packaging_types, results)
+        return results
+
+    def fulfil_reserved_orders(self, orders):
+        """
+        Packs, ships and tracks orders whose stock is ALREADY reserved (eg by the OrderCoalescer)
+        same order format and same OrderResult list as process_orders
+        With hold_ttl the stock of every order that did not make it through is given back
+        """
+        orders = list(orders)
+        results = [None] * len(orders)
+        item_names, packaging_types, quantities, pending = self._parse_orders(orders, results)
+        self._fulfil_batch(pending, item_names, packaging_types, results)
+        if self.hold_ttl is not None:
+            # An order rejected by _parse_orders has no valid quantity, its stock is left alone
+            failed = [(item_names[index], quantities[index])
+                      for index in range(len(orders)) if quantities[index] and not results[index].processed]
+            # A release that fails stays with the order's own error, the batch is done either way
+            call_per_item(lambda pair: self.inventory_service.release_item(*pair), failed)
+        return results
+
+    def _hold_batch(self, pending, item_names, quantities, results, hold_ids):
+        # The reserve stage under hold_ttl, one hold per order, returns the orders that got one
+        held = []
+        for index in pending:
+            try:
+                hold_id = self.inventory_service.reserve_hold(item_names[index], quantities[index], self.hold_ttl)
+            except Exception as error:
+                results[index] = OrderResult(item_names[index], False, error)
+                continue
+            if hold_id is None:
+                results[index] = OrderResult(item_names[index], False, None)
+                continue
+            hold_ids[index] = hold_id
+            held.append(index)
+        return held
+
+    def _settle_holds(self, hold_ids, item_names, quantities, results):
+        # Confirms the holds of the orders that made it through and gives the rest back
+        inventory_service = self.inventory_service
+        for index, hold_id in hold_ids.items():
+            try:
+                if results[index].processed:
+                    inventory_service.confirm_hold(hold_id)
+                else:
+                    inventory_service.release_hold(hold_id)
+            except HoldNotFoundError as error:
+                # Expired while the batch ran, its stock is back already, a processed order takes it
+                # again and only keeps the error when it is gone by now
+                if not results[index].processed:
+                    continue
+                try:
+                    if inventory_service.try_reserve(item_names[index], quantities[index]):
+                        continue
+                except Exception as retake_error:
+                    error = retake_error
+                results[index] = OrderResult(item_names[index], True, error)
+
+    @staticmethod
+    def _parse_orders(orders, results):
+        # Looks up and normalises every order once, an order that is not a dict, misses a field,
+        # has an unknown packaging type or a quantity below 1 fails here and goes no further
+        (item_names, packaging_types, quantities), pending = split_orders(orders, results, [
+            ("item_name", REQUIRED, None),
+            ("packaging_type", REQUIRED, PackagingType.parse),
+            ("quantity", 1, parse_quantity),
+        ])
+        return item_names, packaging_types, quantities, pending
+
+    def _fulfil_batch(self, pending, item_names, packaging_types, results):
+        pending = run_batch_stage(self.packaging_service.package_items, (packaging_types,),
+                                  pending, results, item_names)
+        if self.outbox is not None:
+            # The whole batch goes into ONE durable append, the dispatcher ships it
+            append_many = functools.partial(self.outbox.append_many, category=self.category)
+            pending = run_batch_stage(append_many, (item_names, packaging_types),
+                                      pending, results, item_names)
+            for index in pending:
+                self.event_sink.emit("order_processed", item_name=item_names[index])
+                results[index] = OrderResult(item_names[index], True, None)
+            return
+
+        pending = run_batch_stage(self.shipping_service.ship_items, (item_names,),
+                                  pending, results, item_names)
+
+        capabilities = self.shipping_service.capabilities
+        is_trackable = capabilities & _TRACKING
+        has_eta = capabilities & _ETA
+        for index in pending:
+            try:
+                if is_trackable:
+                    self.shipping_service.track_service()
+                if has_eta:
+                    self.shipping_service.eta_service()
+            except Exception as error:
+                results[index] = OrderResult(item_names[index], False, error)
+                continue
+            self.event_sink.emit("order_processed", item_name=item_names[index])
+            results[index] = OrderResult(item_names[index], True, None)
 
 
 # =========================
@@ -248,11 +649,11 @@ def main():
     → Introduce a Factory (or Registry-based Factory) (Its a design pattern covered in later part)
     → Let it decide shipping
     → Keep main as composition root only
+
+    CARRIER_REGISTRY is that Registry-based Factory, main only asks it for the carrier
+    and gets back the same long-lived instance every time
     """
-    if category == "ULTRA_EXPENSIVE":
-        shipping_service = EkartShippingService()
-    else:
-        shipping_service = DelhiveryShippingService()
+    shipping_service = CARRIER_REGISTRY.carrier_for(category)
 
     order_service = OrderService(inventory_service, packaging_service, shipping_service)
 
@@ -0,0 +1,240 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from composition_ex_oop import ShippingService
+from shipping_wrappers import DelegatingShippingService
+
+"""
+Nothing limited how many ship_item calls were in flight per carrier, so during peaks we
+overloaded the carriers, they throttled us and latency exploded.
+
+ConcurrencyLimiter keeps ONE CarrierLimiter per ShippingService CLASS:
+
+    limiter = ConcurrencyLimiter()
+    shipping = limiter.wrap(EkartShippingService())     -> a ShippingService, OrderService takes it as is
+
+AIMDLimit moves each carrier's limit from what it observes, no hand-tuned thread count:
+    a call failed (throttled)                     -> limit * backoff_ratio   (multiplicative decrease)
+    latency above tolerance * best seen latency   -> limit * backoff_ratio
+    otherwise, while the limit is actually used   -> +1 per `limit` calls    (additive increase)
+so the limit settles around the carrier's real capacity and follows it when it changes.
+
+Calls above the limit WAIT in a bounded queue:
+    more than max_queue waiting, or waiting longer than max_wait -> LimiterRejectedError
+
+metrics() -> {carrier class name: limit, in_flight, queued, completed, dropped, rejections}
+"""
+
+
+class LimiterRejectedError(Exception):
+    pass
+
+
+class AIMDLimit:
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=256, backoff_ratio=0.9, tolerance=2.0):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.tolerance = tolerance
+        self._best_latency = None
+        self._since_backoff = 0
+
+    def update(self, latency, in_flight, dropped):
+        # A throttled call fails fast, its latency says nothing about the carrier's real speed
+        if not dropped:
+            if self._best_latency is None or latency < self._best_latency:
+                self._best_latency = latency
+            else:
+                # Let an old best latency fade so a carrier that got slower for good is not punished forever
+                self._best_latency *= 1.001
+        self._since_backoff += 1
+        if dropped or (self._best_latency is not None and latency > self.tolerance * self._best_latency):
+            # At most ONE decrease per round of `limit` calls, the calls already in flight
+            # all saw the same overload and must not shrink the limit again
+            if self._since_backoff >= self.limit:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                self._since_backoff = 0
+        elif in_flight * 2 >= self.limit:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+
+class CarrierLimiter:
+
+    def __init__(self, name, limit_algorithm, max_queue=1000, max_wait=1.0):
+        self.name = name
+        self.limit_algorithm = limit_algorithm
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.dropped = 0
+        self.rejections = 0
+
+    @property
+    def limit(self):
+        return int(self.limit_algorithm.limit)
+
+    def acquire(self):
+        with self._condition:
+            if self.in_flight < self.limit and not self.queued:
+                self.in_flight += 1
+                return
+            if self.queued >= self.max_queue:
+                self.rejections += 1
+                raise LimiterRejectedError(f"{self.name}: {self.queued} calls already waiting")
+            self.queued += 1
+            try:
+                acquired = self._condition.wait_for(lambda: self.in_flight < self.limit, timeout=self.max_wait)
+            finally:
+                self.queued -= 1
+            if not acquired:
+                self.rejections += 1
+                raise LimiterRejectedError(f"{self.name}: no free slot within {self.max_wait}s")
+            self.in_flight += 1
+
+    def release(self, latency, dropped=False):
+        with self._condition:
+            self.limit_algorithm.update(latency, self.in_flight, dropped)
+            self.in_flight -= 1
+            self.completed += 1
+            if dropped:
+                self.dropped += 1
+            free_slots = self.limit - self.in_flight
+            if free_slots > 0 and self.queued:
+                self._condition.notify(free_slots)
+
+    def call(self, func, *args):
+        self.acquire()
+        started = time.perf_counter()
+        dropped = False
+        try:
+            return func(*args)
+        except Exception:
+            dropped = True
+            raise
+        finally:
+            # Only the carrier's own latency, time spent waiting for a slot is not the carrier's fault
+            self.release(time.perf_counter() - started, dropped)
+
+    def metrics(self):
+        with self._condition:
+            return {"limit": self.limit,
+                    "in_flight": self.in_flight,
+                    "queued": self.queued,
+                    "completed": self.completed,
+                    "dropped": self.dropped,
+                    "rejections": self.rejections}
+
+
+class ConcurrencyLimiter:
+
+    def __init__(self, limit_factory=AIMDLimit, max_queue=1000, max_wait=1.0):
+        self.limit_factory = limit_factory
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter_for(self, carrier):
+        # Keyed by the carrier CLASS, every instance of a carrier shares the carrier's capacity
+        carrier_class = carrier if isinstance(carrier, type) else type(carrier)
+        with self._lock:
+            limiter = self._limiters.get(carrier_class)
+            if limiter is None:
+                limiter = self._limiters[carrier_class] = CarrierLimiter(
+                    carrier_class.__name__, self.limit_factory(), self.max_queue, self.max_wait)
+            return limiter
+
+    def wrap(self, carrier: ShippingService):
+        return LimitedShippingService(carrier, self.limiter_for(carrier))
+
+    def metrics(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.name: limiter.metrics() for limiter in limiters}
+
+
+class LimitedShippingService(DelegatingShippingService):
+    # ship_item goes through the carrier's limiter, tracking and ETA are delegated as they are
+    def __init__(self, carrier: ShippingService, limiter: CarrierLimiter):
+        self.carrier = carrier
+        self.limiter = limiter
+
+    def ship_item(self):
+        return self.limiter.call(self.carrier.ship_item)
+
+    # Every parcel of a batch takes its own limiter slot
+    ship_items = ShippingService.ship_items
+
+
+# =========================
+# MAIN (CAPACITY DEMO)
+# =========================
+class ThrottlingCarrier(ShippingService):
+    # Serves `capacity` bookings at a time, more queue up on its side and past 2x capacity it throttles
+    def __init__(self, capacity=16, service_time=0.01):
+        self.capacity = capacity
+        self.service_time = service_time
+        self._servers = threading.Semaphore(capacity)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.throttled = 0
+
+    def ship_item(self):
+        with self._lock:
+            if self._in_flight >= 2 * self.capacity:
+                self.throttled += 1
+                raise ConnectionRefusedError("429 Too Many Requests")
+            self._in_flight += 1
+        try:
+            with self._servers:
+                time.sleep(self.service_time)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def _run(shipping, bookings, client_threads):
+    # Every parcel must get booked, a failed or rejected booking is retried like the pipeline would
+    def book(_):
+        failures = 0
+        while True:
+            try:
+                shipping.ship_item()
+                return failures
+            except Exception:
+                failures += 1
+                time.sleep(0.001)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=client_threads) as executor:
+        failures = sum(executor.map(book, range(bookings)))
+    return bookings / (time.perf_counter() - started), failures
+
+
+def main():
+    from order_events import EventSource, NullEventSink
+    EventSource.event_sink = NullEventSink()
+
+    bookings = 3000
+    client_threads = 128
+    print(f"carrier serves 16 bookings at a time, {client_threads} client threads book {bookings} parcels")
+    print(f"{'mode':<16} {'booked/sec':>11} {'failed calls':>13}")
+
+    rate, failures = _run(ThrottlingCarrier(), bookings, client_threads)
+    print(f"{'unlimited':<16} {rate:>11,.0f} {failures:>13,}")
+
+    limiter = ConcurrencyLimiter(max_wait=5.0)
+    rate, failures = _run(limiter.wrap(ThrottlingCarrier()), bookings, client_threads)
+    print(f"{'AIMD limiter':<16} {rate:>11,.0f} {failures:>13,}")
+    for name, metrics in limiter.metrics().items():
+        print(f"  {name}: {metrics}")
+
+
+if __name__ == "__main__":
+    main()
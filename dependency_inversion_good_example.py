@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from order_batches import REQUIRED, OrderResult, call_per_item, run_batch_stage, split_orders
+
 
 # =========================
 # INVENTORY RESPONSIBILITY
@@ -17,6 +19,17 @@ class InventoryService(ABC):
     def reserve_item(self,item_name):
         pass
 
+    # Batch entry points are NOT abstract so every existing inventory keeps working
+    # they fall back to one call per item, an inventory that can talk to its store
+    # once per batch should override them
+    # Each entry in the returned list belongs to the item at the same position,
+    # a failing item gives back its exception instead of aborting the whole batch
+    def check_items(self, item_names):
+        return call_per_item(self.check_item, item_names)
+
+    def reserve_items(self, item_names):
+        return call_per_item(self.reserve_item, item_names)
+
 """
 Created a default implementation
 """
@@ -42,6 +55,9 @@ class PackagingService(ABC):
     def package_item(self,packaging_type):
         pass
 
+    def package_items(self, packaging_types):
+        return call_per_item(self.package_item, packaging_types)
+
 """
 In this case liskov substitution is not violated since parent commits that item will be packaged
 and the child even in if else case does packaging as per commitment from parent
@@ -101,6 +117,11 @@ class ShippingService(ABC):
     def ship_item(self):
         pass
 
+    # ship_item books one parcel and does not need the item name
+    # item_names are only passed so that a carrier overriding the batch call knows what it ships
+    def ship_items(self, item_names):
+        return call_per_item(lambda item_name: self.ship_item(), item_names)
+
 
 class EkartShippingService(ShippingService):
 
@@ -187,6 +208,45 @@ class OrderService:
 
             print("Order processed successfully")
 
+    def process_orders(self, orders):
+        """
+        Batch version of process_order, orders is a list of dicts holding the same
+        keyword arguments as process_order eg {"item_name": "iPhone 16", "packaging_type": "GIFT"}
+        Every stage is called ONCE for the whole batch instead of once per order
+        and the Trackable / ETAChecker checks are done once per batch
+        One failed order does not abort the rest of the batch
+        """
+        orders = list(orders)
+        results = [None] * len(orders)
+        (item_names, packaging_types), pending = split_orders(orders, results, [
+            ("item_name", REQUIRED, None),
+            ("packaging_type", REQUIRED, None),
+        ])
+
+        pending = run_batch_stage(self.inventory_service.check_items, (item_names,),
+                                  pending, results, item_names, out_of_stock_on_false=True)
+        pending = run_batch_stage(self.inventory_service.reserve_items, (item_names,),
+                                  pending, results, item_names)
+        pending = run_batch_stage(self.packaging_service.package_items, (packaging_types,),
+                                  pending, results, item_names)
+        pending = run_batch_stage(self.shipping_service.ship_items, (item_names,),
+                                  pending, results, item_names)
+
+        is_trackable = isinstance(self.shipping_service, Trackable)
+        has_eta = isinstance(self.shipping_service, ETAChecker)
+        for index in pending:
+            try:
+                if is_trackable:
+                    self.shipping_service.track_service()
+                if has_eta:
+                    self.shipping_service.eta_service()
+            except Exception as error:
+                results[index] = OrderResult(item_names[index], False, error)
+                continue
+            print("Order processed successfully")
+            results[index] = OrderResult(item_names[index], True, None)
+        return results
+
 
 
 # =========================
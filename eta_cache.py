@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from composition_ex_oop import ETAChecker, ShippingService
+from shipping_wrappers import DelegatingShippingService
+
+"""
+eta_service is where we call the carrier for an ETA, our most expensive external call per order.
+Many orders to the same destination on the same carrier ask the SAME question within seconds.
+
+CachedETAChecker wraps ANY ETAChecker (Decorator pattern, the carrier does not change):
+    key              (carrier, origin, destination)
+    ttl              seconds an answer is fresh, served straight from the cache
+    stale_ttl        extra seconds an expired answer may still be served (stale-while-revalidate),
+                     the caller gets the stale ETA at once and ONE background refresh is started
+    max_entries      LRU bound, the least recently used key is evicted when full
+
+Counters: hits, stale_hits, misses, evictions, refreshes, refresh_errors (see stats())
+
+ETACachingShippingService puts the cache in front of a carrier so OrderService can use it
+like any other ShippingService.
+"""
+
+
+class _CacheEntry:
+    __slots__ = ("value", "fresh_until", "stale_until", "refreshing")
+
+    def __init__(self, value, fresh_until, stale_until):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.refreshing = False
+
+
+class CachedETAChecker(ETAChecker):
+
+    def __init__(self, eta_checker: ETAChecker, ttl=30.0, stale_ttl=30.0, max_entries=10000,
+                 carrier_name=None, refresh_executor=None, clock=time.monotonic):
+        self.eta_checker = eta_checker
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.carrier_name = carrier_name or type(eta_checker).__name__
+        self._refresh_executor = refresh_executor
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def eta_service(self, origin=None, destination=None):
+        key = (self.carrier_name, origin, destination)
+        now = self._clock()
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now < entry.fresh_until:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                if now < entry.stale_until:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    # Only the first stale reader starts a refresh, the others keep getting the stale value
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        refresh = True
+                    value = entry.value
+                else:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+
+        if refresh:
+            self._executor().submit(self._refresh, key, origin, destination)
+            return value
+
+        value = self.eta_checker.eta_service(origin, destination)
+        self._store(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+            }
+
+    def invalidate(self, origin=None, destination=None):
+        with self._lock:
+            self._entries.pop((self.carrier_name, origin, destination), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, key, value):
+        now = self._clock()
+        with self._lock:
+            self._entries[key] = _CacheEntry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _refresh(self, key, origin, destination):
+        try:
+            value = self.eta_checker.eta_service(origin, destination)
+        except Exception:
+            with self._lock:
+                self.refresh_errors += 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    # Let the next stale reader try again
+                    entry.refreshing = False
+            return
+        with self._lock:
+            self.refreshes += 1
+        self._store(key, value)
+
+    def _executor(self):
+        if self._refresh_executor is None:
+            with self._lock:
+                if self._refresh_executor is None:
+                    self._refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="eta-refresh")
+        return self._refresh_executor
+
+
+class ETACachingShippingService(DelegatingShippingService):
+    # Delegates shipping and tracking to the carrier, ETA lookups go through the cache
+    def __init__(self, carrier: ShippingService, eta_cache: CachedETAChecker):
+        self.carrier = carrier
+        self.eta_cache = eta_cache
+
+    def eta_service(self, origin=None, destination=None):
+        return self.eta_cache.eta_service(origin, destination)
+
+
+# =========================
+# MAIN
+# =========================
+class SlowETAChecker(ETAChecker):
+    # Pretends the carrier takes 20ms to answer
+    calls = 0
+
+    def eta_service(self, origin=None, destination=None):
+        SlowETAChecker.calls += 1
+        time.sleep(0.02)
+        return f"{len(destination or '') % 5 + 1} DAYS"
+
+
+def main():
+    cache = CachedETAChecker(SlowETAChecker(), ttl=60, stale_ttl=60, max_entries=10)
+    destinations = [f"PIN-{number}" for number in range(100)]
+
+    started = time.perf_counter()
+    for number in range(2000):
+        # most traffic goes to a few hot destinations
+        destination = destinations[(number * number) % 20 if number % 10 else number % 100]
+        cache.eta_service("BLR", destination)
+    elapsed = time.perf_counter() - started
+
+    print(f"2000 ETA lookups in {elapsed:.2f}s, {SlowETAChecker.calls} carrier calls "
+          f"(uncached it would be {2000 * 0.02:.0f}s)")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import http.client
+import json
+import queue
+import select
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlparse
+
+from carrier_simulator import CarrierProfile, CarrierSimulator
+from composition_ex_oop import ETAChecker, ShippingService, Trackable
+
+"""
+HTTP-backed carriers, the same ShippingService / Trackable / ETAChecker contracts
+as EkartShippingService & co, but every call really goes over the network.
+
+HTTPConnectionPool keeps up to `size` keep-alive connections per carrier host and reuses them,
+so a booking does not pay a TCP connect each time.
+A request that failed on a reused connection is sent again on a fresh one ONLY when that cannot do it
+twice: it never got out, or it is idempotent (GET / PUT / DELETE ..., or request(..., idempotent=True)).
+A POST /shipments whose answer was lost raises instead, sending it again could book the parcel twice.
+keep_alive=False opens and closes a connection per call, only there to compare against.
+
+Run this module to benchmark connection reuse against per-call connects on the local
+carrier_simulator, fully offline.
+"""
+
+
+class CarrierError(Exception):
+    def __init__(self, carrier, status, message):
+        super().__init__(f"{carrier} answered {status}: {message}")
+        self.carrier = carrier
+        self.status = status
+
+
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+_CONNECTION_LOST = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class HTTPConnectionPool:
+
+    def __init__(self, base_url, size=8, timeout=5.0, keep_alive=True):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._idle = queue.LifoQueue()
+        # Bounds how many connections can be open at the same time
+        self._slots = threading.BoundedSemaphore(size)
+        self.connects = 0
+        self._lock = threading.Lock()
+
+    def _new_connection(self):
+        with self._lock:
+            self.connects += 1
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    @contextmanager
+    def _connection(self):
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+                if _closed_by_server(connection):
+                    connection.close()
+                    connection = self._new_connection()
+            except queue.Empty:
+                connection = self._new_connection()
+            reusable = False
+            try:
+                yield connection
+                reusable = self.keep_alive
+            finally:
+                if reusable:
+                    self._idle.put(connection)
+                else:
+                    connection.close()
+
+    def request(self, method, path, payload=None, idempotent=None):
+        # idempotent defaults to what the method promises, pass True for a POST that only reads
+        if idempotent is None:
+            idempotent = method in _IDEMPOTENT_METHODS
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if not self.keep_alive:
+            headers["Connection"] = "close"
+        with self._connection() as connection:
+            # Only an idle keep-alive connection can have been closed by the server in the meantime
+            reused = connection.sock is not None
+            sent = False
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                sent = True
+                response = connection.getresponse()
+            except _CONNECTION_LOST:
+                # Once it was sent the server may have acted on it, only an idempotent request is safe to repeat
+                if not reused or (sent and not idempotent):
+                    raise
+                connection.close()
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+            data = response.read()
+        return response.status, json.loads(data or b"{}")
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _closed_by_server(connection):
+    # An idle connection with something to read has seen the server's FIN (or junk), it is not reusable
+    if connection.sock is None:
+        return True
+    readable, _, _ = select.select([connection.sock], [], [], 0)
+    return bool(readable)
+
+
+class HttpShippingService(ShippingService, Trackable, ETAChecker):
+
+    def __init__(self, carrier, pool: HTTPConnectionPool):
+        self.carrier = carrier
+        self.pool = pool
+
+    def _call(self, method, path, payload=None, idempotent=None):
+        status, body = self.pool.request(method, f"/{self.carrier}{path}", payload, idempotent)
+        if status >= 400:
+            raise CarrierError(self.carrier, status, body.get("error", ""))
+        return body
+
+    def ship_item(self):
+        shipment_id = self._call("POST", "/shipments")["shipment_id"]
+        self.event_sink.emit("shipped", carrier=self.carrier, shipment_id=shipment_id)
+        return shipment_id
+
+    def track_service(self, shipment_id=None):
+        return self._call("GET", f"/shipments/{shipment_id}")["status"]
+
+    def track_shipments(self, shipment_ids):
+        # A POST only because the ids do not fit a query string, it books nothing
+        return self._call("POST", "/tracking", {"shipment_ids": list(shipment_ids)}, idempotent=True)["statuses"]
+
+    def eta_service(self, origin=None, destination=None):
+        query = urlencode({"origin": origin or "", "destination": destination or ""})
+        eta = self._call("GET", f"/eta?{query}")["eta"]
+        self.event_sink.emit("eta_reported", carrier=self.carrier, eta=eta)
+        return eta
+
+
+# =========================
+# MAIN (BENCHMARK)
+# =========================
+def _benchmark(simulator, keep_alive, bookings, threads):
+    pool = HTTPConnectionPool(simulator.url, size=threads, keep_alive=keep_alive)
+    carrier = HttpShippingService("bluedart", pool)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: carrier.ship_item(), range(bookings)))
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return bookings / elapsed, pool.connects
+
+
+def main():
+    from order_events import EventSource, NullEventSink
+    EventSource.event_sink = NullEventSink()
+
+    bookings = 2000
+    threads = 8
+    profiles = {"bluedart": CarrierProfile(latency=("fixed", 0.0))}
+    with CarrierSimulator(profiles) as simulator:
+        print(f"{'mode':<18} {'bookings/sec':>13} {'TCP connects':>13}")
+        for name, keep_alive in (("per-call connect", False), ("keep-alive pool", True)):
+            rate, connects = _benchmark(simulator, keep_alive, bookings, threads)
+            print(f"{name:<18} {rate:>13,.0f} {connects:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
 
+from carrier_registry import CarrierRegistry
+from order_codes import Category
+
 
 # =========================
 # INVENTORY RESPONSIBILITY
@@ -101,6 +104,17 @@ class DelhiveryShippingService(ShippingService,ETAChecker,Trackable):
         print("ETA TO DELIVER IS 2 HOURS!")
 
 
+# =========================
+# CARRIER REGISTRY
+# =========================
+# Carriers register for their category ONCE here instead of an if / else chain inside OrderService
+# categories are normalised to Category codes, an unknown category is rejected instead of
+# silently going to the default carrier
+CARRIER_REGISTRY = CarrierRegistry(normalize=Category.parse)
+CARRIER_REGISTRY.register(Category.ULTRA_EXPENSIVE, EkartShippingService)
+CARRIER_REGISTRY.register(Category.LOW_EXPENSIVE, DelhiveryShippingService)
+
+
 # =========================
 # ORDER SERVICE (Orchestrator)
 # =========================
@@ -110,10 +124,7 @@ class OrderService:
         self.inventory_service = InventoryService()
         self.packaging_service = PackagingService()
 
-        if category == "ULTRA_EXPENSIVE":
-            self.shipping_service = EkartShippingService()
-        else:
-            self.shipping_service = DelhiveryShippingService()
+        self.shipping_service = CARRIER_REGISTRY.carrier_for(category)
 
     def process_order(self, item_name, packaging_type):
         if self.inventory_service.check_item(item_name):
@@ -0,0 +1,318 @@
+import datetime
+import threading
+import time
+from concurrent.futures import Future
+
+from composition_ex_oop import ShippingService
+from shipping_wrappers import DelegatingShippingService
+
+"""
+Every ship_item books ONE parcel with ONE carrier call, at peak that is thousands of calls a
+minute to Ekart, Delhivery and BlueDart, while all of them take bulk manifests.
+
+ManifestBuilder collects the parcels PER CARRIER and books them with one ship_items call per manifest:
+    submit(carrier, item_name) adds the parcel to that carrier's open manifest and returns a Future
+    with this parcel's own outcome, an exception only fails the parcels it belongs to
+
+A manifest is flushed when
+    it has max_manifest_size parcels                                (size limit)
+    its oldest parcel waited max_wait seconds                       (time limit, the bounded delay)
+    the carrier's daily cutoff is cutoff_margin away                (the last pickup of the day)
+The cutoff flush happens ONCE per pickup: everything buffered at cutoff - cutoff_margin goes, parcels
+arriving after that are batched by the size and time limits again until the next day's cutoff.
+Every carrier has its own flusher thread, a slow carrier never holds up another carrier's manifests.
+
+    cutoffs={EkartShippingService: datetime.time(18, 0)}            carrier class -> local time of day
+
+ManifestShippingService wraps one carrier as a plain ShippingService, so OrderService can ship
+through the builder without knowing about manifests: ship_item waits for its parcel's manifest.
+
+Run this module for the report, carrier calls per order with and without manifests.
+"""
+
+
+def _next_cutoff(now, cutoff):
+    # Timestamp of the next `cutoff` time of day after `now`, on the local calendar
+    today = datetime.datetime.fromtimestamp(now)
+    at = datetime.datetime.combine(today.date(), cutoff)
+    if at.timestamp() <= now:
+        at += datetime.timedelta(days=1)
+    return at.timestamp()
+
+
+class _ManifestLane:
+    # The open manifest of ONE carrier and the thread that flushes it
+    def __init__(self, builder, carrier, cutoff):
+        self.builder = builder
+        self.carrier = carrier
+        self.name = type(carrier).__name__
+        self.cutoff = cutoff
+        self.next_cutoff = None if cutoff is None else _next_cutoff(builder._clock(), cutoff)
+        # Parcels that still have to go with the cutoff flush
+        self.flush_now = 0
+        # (item_name, arrival, future)
+        self.parcels = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.orders = 0
+        self.manifests = 0
+        self.thread = threading.Thread(target=self._run, name=f"manifest-{self.name}", daemon=True)
+        self.thread.start()
+
+    def add(self, item_name):
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("ManifestBuilder is closed")
+            self.parcels.append((item_name, self.builder._clock(), future))
+            # Only wake the flusher when this parcel can change what is flushed next
+            if len(self.parcels) == 1 or len(self.parcels) >= self.builder.max_manifest_size:
+                self.condition.notify()
+        return future
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def _check_cutoff(self, now):
+        if self.next_cutoff is not None and now >= self.next_cutoff - self.builder.cutoff_margin:
+            # ONE flush for this pickup, whatever is buffered right now goes
+            self.flush_now = len(self.parcels)
+            self.next_cutoff = _next_cutoff(max(now, self.next_cutoff), self.cutoff)
+
+    def _take_manifest(self):
+        # Returns the next manifest that is due, or (None, seconds to wait) when nothing is due yet
+        builder = self.builder
+        max_size = builder.max_manifest_size
+        now = builder._clock()
+        self._check_cutoff(now)
+        if not self.parcels:
+            return None, None
+        due = self.parcels[0][1] + builder.max_wait
+        if not (self.closed or self.flush_now or len(self.parcels) >= max_size or due <= now):
+            if self.next_cutoff is not None:
+                due = min(due, self.next_cutoff - builder.cutoff_margin)
+            return None, due - now
+        manifest = self.parcels[:max_size]
+        del self.parcels[:max_size]
+        self.flush_now = max(0, self.flush_now - len(manifest))
+        return manifest, None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    manifest, wait = self._take_manifest()
+                    if manifest or (self.closed and not self.parcels):
+                        break
+                    self.condition.wait(wait)
+            if not manifest:
+                return
+            self._book(manifest)
+
+    def _book(self, manifest):
+        # Cancelled parcels are dropped, the rest of the manifest can no longer be cancelled
+        manifest = [parcel for parcel in manifest if parcel[2].set_running_or_notify_cancel()]
+        if not manifest:
+            return
+        try:
+            outcomes = self.carrier.ship_items([item_name for item_name, _, _ in manifest])
+        except Exception as error:
+            outcomes = [error] * len(manifest)
+        self.orders += len(manifest)
+        self.manifests += 1
+        for (_, _, future), outcome in zip(manifest, outcomes):
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+
+class ManifestBuilder:
+
+    def __init__(self, max_manifest_size=500, max_wait=1.0, cutoffs=None, cutoff_margin=300.0,
+                 clock=time.time):
+        self.max_manifest_size = max_manifest_size
+        self.max_wait = max_wait
+        self.cutoffs = cutoffs or {}
+        self.cutoff_margin = cutoff_margin
+        # Wall clock, cutoffs are times of day
+        self._clock = clock
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, carrier: ShippingService, item_name=None):
+        # Returns a Future with this parcel's ship_items outcome
+        return self._lane(carrier).add(item_name)
+
+    def shipping_service(self, carrier: ShippingService):
+        return ManifestShippingService(self, carrier)
+
+    def stats(self):
+        # {carrier class name: {"orders", "manifests", "orders_per_call"}}
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return {
+            lane.name: {"orders": lane.orders, "manifests": lane.manifests,
+                        "orders_per_call": lane.orders / lane.manifests if lane.manifests else 0.0}
+            for lane in lanes
+        }
+
+    def close(self):
+        # Flushes every open manifest and stops the flusher threads
+        with self._lock:
+            self._closed = True
+            lanes = list(self._lanes.values())
+        for lane in lanes:
+            lane.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _lane(self, carrier):
+        lane = self._lanes.get(carrier)
+        if lane is None:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("ManifestBuilder is closed")
+                lane = self._lanes.get(carrier)
+                if lane is None:
+                    lane = self._lanes[carrier] = _ManifestLane(self, carrier, self.cutoffs.get(type(carrier)))
+        return lane
+
+
+class ManifestShippingService(DelegatingShippingService):
+    # ship_item joins the carrier's next manifest and waits for it, tracking and ETA are delegated as they are
+    def __init__(self, builder: ManifestBuilder, carrier: ShippingService):
+        self.builder = builder
+        self.carrier = carrier
+
+    @staticmethod
+    def _delegate(builder, carrier, *args, **kwargs):
+        return carrier
+
+    def ship_item(self):
+        return self.builder.submit(self.carrier).result()
+
+    def ship_items(self, item_names):
+        futures = [self.builder.submit(self.carrier, item_name) for item_name in item_names]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as error:
+                results.append(error)
+        return results
+
+
+# =========================
+# MAIN (CARRIER CALLS PER ORDER)
+# =========================
+class BulkCarrier(ShippingService):
+    # One API call costs `per_call` seconds however many parcels it books, plus `per_parcel` each
+    def __init__(self, per_call=0.01, per_parcel=0.00002):
+        self.per_call = per_call
+        self.per_parcel = per_parcel
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def ship_item(self):
+        return self.ship_items([None])[0]
+
+    def ship_items(self, item_names):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.per_call + self.per_parcel * len(item_names))
+        self.event_sink.emit("shipped", carrier=type(self).__name__, parcels=len(item_names))
+        return [None] * len(item_names)
+
+
+class BulkEkart(BulkCarrier):
+    pass
+
+
+class BulkDelhivery(BulkCarrier):
+    pass
+
+
+class BulkBluedart(BulkCarrier):
+    pass
+
+
+def _ship_each(carriers, orders, threads):
+    # `threads` checkout threads call ship_item, every parcel is its own carrier call
+    from concurrent.futures import ThreadPoolExecutor
+
+    def one(number):
+        started = time.perf_counter()
+        carriers[number % len(carriers)].ship_item()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(one, range(orders)))
+    return orders / (time.perf_counter() - started), latencies[int(len(latencies) * 0.99)]
+
+
+def _ship_manifests(builder, carriers, orders, threads):
+    # `threads` checkout threads submit and move on, the latency is submit -> parcel booked
+    latencies = []
+
+    def produce(first):
+        for number in range(first, orders, threads):
+            submitted = time.perf_counter()
+            future = builder.submit(carriers[number % len(carriers)], f"SKU-{number % 100}")
+            future.add_done_callback(lambda _, submitted=submitted: latencies.append(time.perf_counter() - submitted))
+
+    started = time.perf_counter()
+    producers = [threading.Thread(target=produce, args=(first,)) for first in range(threads)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    builder.close()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return orders / elapsed, latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    from order_events import EventSource, NullEventSink
+    EventSource.event_sink = NullEventSink()
+
+    orders = 50_000
+    threads = 256
+    print(f"{orders} orders from {threads} checkout threads over 3 carriers, 10ms per carrier call")
+    print(f"{'mode':<16} {'orders/sec':>11} {'p99 ms':>8} {'calls':>7} {'orders/call':>12}")
+
+    carriers = [BulkEkart(), BulkDelhivery(), BulkBluedart()]
+    rate, p99 = _ship_each(carriers, orders, threads)
+    calls = sum(carrier.calls for carrier in carriers)
+    print(f"{'ship_item each':<16} {rate:>11,.0f} {p99 * 1000:>8.1f} {calls:>7} {orders / calls:>12.1f}")
+
+    carriers = [BulkEkart(), BulkDelhivery(), BulkBluedart()]
+    builder = ManifestBuilder(max_manifest_size=500, max_wait=0.2)
+    rate, p99 = _ship_manifests(builder, carriers, orders, threads)
+    calls = sum(carrier.calls for carrier in carriers)
+    print(f"{'manifests':<16} {rate:>11,.0f} {p99 * 1000:>8.1f} {calls:>7} {orders / calls:>12.1f}")
+
+    # Off peak: a long time limit, the carrier's cutoff is what sends the manifest
+    carrier = BulkEkart()
+    cutoff = (datetime.datetime.now() + datetime.timedelta(seconds=1.5)).time()
+    with ManifestBuilder(max_wait=3600, cutoffs={BulkEkart: cutoff}, cutoff_margin=1.0) as builder:
+        started = time.perf_counter()
+        futures = [builder.submit(carrier, f"SKU-{number}") for number in range(40)]
+        for future in futures:
+            future.result()
+        print(f"off peak: 40 parcels, 1 hour time limit, cutoff in 1.5s with 1s margin -> "
+              f"booked after {time.perf_counter() - started:.2f}s in {carrier.calls} call(s)")
+
+
+if __name__ == "__main__":
+    main()
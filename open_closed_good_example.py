@@ -1,5 +1,8 @@
 from abc import ABC,abstractmethod
 
+from carrier_registry import CarrierRegistry
+from order_codes import Category
+
 # =========================
 # INVENTORY RESPONSIBILITY
 # =========================
@@ -75,6 +78,19 @@ class DelhiveryShippingService(ShippingService):
         print("Shipping via Delhivery")
 
 
+# =========================
+# CARRIER REGISTRY
+# =========================
+# Carriers register for their category ONCE here instead of an if / else chain inside OrderService
+# categories are normalised to Category codes so "ULTRA EXPENSIVE" and "ULTRA_EXPENSIVE" are the same,
+# an unknown category is rejected instead of silently going to the default carrier
+CARRIER_REGISTRY = CarrierRegistry(normalize=Category.parse)
+CARRIER_REGISTRY.register(Category.ULTRA_EXPENSIVE, EkartShippingService)
+CARRIER_REGISTRY.register(Category.LOW_EXPENSIVE, DelhiveryShippingService)
+# A NEW category is only a new registration, nothing else is modified (OCP)
+CARRIER_REGISTRY.register(Category.MEDIUM_EXPENSIVE, BluedartShippingService)
+
+
 # =========================
 # ORDER RESPONSIBILITY KIND OF ACT AS A ORCHESTRATOR SINCE WE ARE DEALING WITH MULTIPLE SERVICES
 # Why we can't do this in main itself? Its not correct main should only act as an entry point
@@ -87,10 +103,8 @@ class OrderService:
         self.inventory_service = InventoryService()
         self.packaging_service = PackagingService()
         # IN THIS CASE NOW SHIPPING SERVICE WILL BE DECIDED BASED ON CATEGORY in ORDER SERVICE
-        if category == "ULTRA EXPENSIVE":
-            self.shipping_service = EkartShippingService()
-        else:
-            self.shipping_service = DelhiveryShippingService()
+        # the registry hands back the long-lived carrier registered for the category
+        self.shipping_service = CARRIER_REGISTRY.carrier_for(category)
 
     def process_order(self, item_name, packaging_type):
         if self.inventory_service.check_item(item_name):
@@ -0,0 +1,76 @@
+from collections import namedtuple
+
+"""
+The batch machinery every OrderService.process_orders shares
+(composition_ex_oop, dependency_inversion_good_example):
+
+    OrderResult         one per order, in the order they were submitted
+                        processed is False when the item was out of stock or any stage raised,
+                        error holds that exception
+    call_per_item       default fallback for the batch methods of the service ABCs, one call per item
+    split_orders        pulls the order dicts apart into one column per field, an order that is not a
+                        dict, misses a field or has a value that does not parse fails on its own
+    run_batch_stage     runs one stage for the orders still pending, failed orders drop out
+
+One failed order never aborts the rest of the batch.
+"""
+
+OrderResult = namedtuple("OrderResult", ["item_name", "processed", "error"])
+
+# split_orders default for a field every order must have
+REQUIRED = object()
+
+
+def call_per_item(func, items):
+    # an exception is kept as that item's result so the rest of the batch still runs
+    results = []
+    for item in items:
+        try:
+            results.append(func(item))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+def split_orders(orders, results, fields):
+    """
+    fields is [(name, default, parse)], default is REQUIRED for a field every order must have and
+    parse (None to keep the value as it is) normalises it, the FIRST field names the order in its OrderResult
+    Returns one column per field and the indexes of the orders that made it, the others get their
+    failed OrderResult in results
+    """
+    columns = [[None] * len(orders) for _ in fields]
+    pending = []
+    for index, order in enumerate(orders):
+        try:
+            for column, (name, default, parse) in zip(columns, fields):
+                value = order[name] if default is REQUIRED else order.get(name, default)
+                column[index] = value if parse is None else parse(value)
+        except (LookupError, TypeError, ValueError, AttributeError) as error:
+            results[index] = OrderResult(columns[0][index], False, error)
+            continue
+        pending.append(index)
+    return columns, pending
+
+
+def run_batch_stage(stage, columns, pending, results, item_names, out_of_stock_on_false=False):
+    # Runs one batch stage for the orders still pending and returns the ones that made it through
+    # columns are the per-order argument lists of the stage, only the pending rows are passed on
+    # failed orders get their OrderResult filled in here and drop out of the later stages
+    if not pending:
+        return pending
+    try:
+        outcomes = stage(*([column[index] for index in pending] for column in columns))
+    except Exception as error:
+        # A batch override blew up as a whole, every order in this stage failed with it
+        outcomes = [error] * len(pending)
+
+    survivors = []
+    for index, outcome in zip(pending, outcomes):
+        if isinstance(outcome, Exception):
+            results[index] = OrderResult(item_names[index], False, outcome)
+        elif out_of_stock_on_false and not outcome:
+            results[index] = OrderResult(item_names[index], False, None)
+        else:
+            survivors.append(index)
+    return survivors
@@ -0,0 +1,285 @@
+import argparse
+import csv
+import json
+import queue
+import sys
+import threading
+import time
+
+from order_codes import InvalidOrderError
+from order_records import Order
+
+"""
+Every main() so far places ONE hard coded "iPhone 16" order. This is the entry point for real
+order files, eg replaying an order dump after an outage:
+
+    python order_cli.py orders.jsonl more_orders.csv --workers 8
+    zcat dump.jsonl.gz | python order_cli.py - --format jsonl
+
+One order per JSON line or CSV row, with the fields
+    item_name, category, packaging_type, quantity (optional, default 1)
+
+STREAMING, memory stays flat however big the input is:
+    read_orders       a generator, reads one line / row at a time and yields Orders, files are
+                      opened one after the other, nothing is loaded whole
+    batched           groups the stream into lists of --batch-size orders
+    bounded queue     at most --max-pending batches wait between the reader and the workers,
+                      when it is full the reader BLOCKS (backpressure) instead of reading ahead
+    workers           --workers threads take batches and push them through OrderService.process_orders,
+                      one OrderService per category with the carrier from CARRIER_REGISTRY
+
+A malformed line (bad JSON / CSV, not UTF-8, unknown codes, quantity below 1) is reported on stderr
+with its file and line number and skipped, the replay goes on. Input is read as bytes and decoded
+line by line so one bad byte only costs its own line.
+At the end a summary with orders/sec is printed.
+"""
+
+# A line / row that is not an order, reported but not fatal
+MALFORMED_REPORT_LIMIT = 20
+
+
+# =========================
+# READING (GENERATORS)
+# =========================
+def _open_input(path):
+    if path == "-":
+        return sys.stdin.buffer
+    return open(path, "rb")
+
+
+def _format_of(path, requested):
+    if requested != "auto":
+        return requested
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+# Both yield (line_number, row dict or the exception that made the line malformed)
+def _jsonl_rows(source):
+    for line_number, line in enumerate(source, 1):
+        if not line.strip():
+            continue
+        try:
+            # Bytes in, a line that is not UTF-8 raises UnicodeDecodeError, a ValueError like bad JSON
+            yield line_number, json.loads(line)
+        except ValueError as error:
+            yield line_number, error
+
+
+def _csv_rows(source):
+    position = [0]
+    undecodable = []
+
+    def decoded_lines():
+        for line_number, line in enumerate(source, 1):
+            position[0] = line_number
+            try:
+                yield line.decode("utf-8")
+            except UnicodeDecodeError as error:
+                # Left out of the CSV stream, reported in line order below
+                undecodable.append((line_number, error))
+
+    reader = csv.DictReader(decoded_lines())
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as error:
+            row = error
+        while undecodable:
+            yield undecodable.pop(0)
+        # The line the row ENDS on, a quoted field may span several lines
+        yield position[0], row
+    yield from undecodable
+
+
+def read_orders(paths, input_format="auto", on_malformed=None):
+    """
+    Yields one Order per line / row of every path in turn, "-" reads stdin
+    on_malformed(path, line_number, error) is called for every line that is not a valid order
+    """
+    for path in paths:
+        rows = _csv_rows if _format_of(path, input_format) == "csv" else _jsonl_rows
+        source = _open_input(path)
+        try:
+            for line_number, row in rows(source):
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    if not isinstance(row, dict):
+                        raise InvalidOrderError(f"Expected an object, got {type(row).__name__}")
+                    quantity = row.get("quantity")
+                    if quantity in (None, ""):
+                        quantity = 1
+                    elif isinstance(quantity, str):
+                        # CSV fields are text, JSON numbers are checked as they are (2.5 is refused, not cut to 2)
+                        quantity = int(quantity)
+                    yield Order(row["item_name"], row["category"], row["packaging_type"], quantity)
+                except (KeyError, ValueError, TypeError) as error:
+                    if on_malformed is not None:
+                        on_malformed(path, line_number, error)
+        finally:
+            if path != "-":
+                source.close()
+
+
+def batched(orders, batch_size):
+    batch = []
+    for order in orders:
+        batch.append(order)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# =========================
+# PROCESSING
+# =========================
+class IngestSummary:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.read = 0
+        self.processed = 0
+        self.failed = 0
+        self.malformed = 0
+        self.seconds = 0.0
+
+    def add(self, processed, failed):
+        with self._lock:
+            self.processed += processed
+            self.failed += failed
+
+    @property
+    def orders_per_sec(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def report(self):
+        return (f"read {self.read:,} orders in {self.seconds:.2f}s ({self.orders_per_sec:,.0f} orders/sec): "
+                f"{self.processed:,} processed, {self.failed:,} failed, {self.malformed:,} malformed lines skipped")
+
+
+def _process_batch(order_services, batch, summary):
+    by_category = {}
+    for order in batch:
+        by_category.setdefault(order.category, []).append(order.to_dict())
+    processed = failed = 0
+    for category, orders in by_category.items():
+        try:
+            results = order_services[category].process_orders(orders)
+        except Exception:
+            failed += len(orders)
+            continue
+        for result in results:
+            if result.processed:
+                processed += 1
+            else:
+                failed += 1
+    summary.add(processed, failed)
+
+
+def ingest(orders, order_services, workers=4, batch_size=256, max_pending=8, summary=None):
+    """
+    Pushes an iterable of Orders through order_services ({Category: OrderService}) on `workers` threads
+    At most max_pending batches are read ahead of the workers, returns the IngestSummary
+    """
+    summary = summary or IngestSummary()
+    pending = queue.Queue(maxsize=max_pending)
+
+    def work():
+        while True:
+            batch = pending.get()
+            if batch is None:
+                return
+            _process_batch(order_services, batch, summary)
+
+    threads = [threading.Thread(target=work, name=f"ingest-{number}", daemon=True) for number in range(workers)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    try:
+        for batch in batched(orders, batch_size):
+            summary.read += len(batch)
+            # BACKPRESSURE, blocks while max_pending batches are already waiting
+            pending.put(batch)
+    finally:
+        for _ in threads:
+            pending.put(None)
+        for thread in threads:
+            thread.join()
+        summary.seconds = time.perf_counter() - started
+    return summary
+
+
+def build_order_services():
+    # Composition root, same wiring as composition_ex_oop.main but one OrderService per category
+    from composition_ex_oop import CARRIER_REGISTRY, DefaultInventoryService, DefaultPackagingService, OrderService
+    from order_codes import Category
+
+    inventory_service = DefaultInventoryService()
+    packaging_service = DefaultPackagingService()
+    return {category: OrderService(inventory_service, packaging_service, CARRIER_REGISTRY.carrier_for(category),
+                                   category=category)
+            for category in Category}
+
+
+def _peak_memory_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# =========================
+# MAIN
+# =========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream orders from JSON Lines / CSV files or stdin into OrderService")
+    parser.add_argument("paths", nargs="*", default=["-"], help='order files, "-" (the default) reads stdin')
+    parser.add_argument("--format", choices=("auto", "jsonl", "csv"), default="auto",
+                        help="input format, auto picks csv for *.csv and jsonl for everything else")
+    parser.add_argument("--workers", type=int, default=4, help="threads processing batches")
+    parser.add_argument("--batch-size", type=int, default=256, help="orders per process_orders call")
+    parser.add_argument("--max-pending", type=int, default=8,
+                        help="batches read ahead of the workers before reading blocks")
+    parser.add_argument("--console-events", action="store_true",
+                        help="print every service event, by default events go to a NullEventSink")
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.batch_size < 1 or args.max_pending < 1:
+        parser.error("--workers, --batch-size and --max-pending must be at least 1")
+
+    if not args.console_events:
+        from order_events import EventSource, NullEventSink
+        EventSource.event_sink = NullEventSink()
+
+    summary = IngestSummary()
+
+    def on_malformed(path, line_number, error):
+        summary.malformed += 1
+        if summary.malformed <= MALFORMED_REPORT_LIMIT:
+            print(f"{path}:{line_number}: skipped, {error}", file=sys.stderr)
+        elif summary.malformed == MALFORMED_REPORT_LIMIT + 1:
+            print("more malformed lines, not reporting them anymore", file=sys.stderr)
+
+    orders = read_orders(args.paths, args.format, on_malformed)
+    exit_code = 0
+    try:
+        ingest(orders, build_order_services(), args.workers, args.batch_size, args.max_pending, summary)
+    except KeyboardInterrupt:
+        print("interrupted, the summary covers the orders read so far", file=sys.stderr)
+        exit_code = 130
+    print(summary.report(), file=sys.stderr)
+    peak = _peak_memory_mb()
+    if peak is not None:
+        print(f"peak memory {peak:.1f} MB", file=sys.stderr)
+    # Failed orders (eg out of stock) are part of a normal replay, malformed input is not
+    return exit_code or (1 if summary.malformed else 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from array_inventory import ArrayInventoryService
+from composition_ex_oop import (
+    DefaultPackagingService,
+    DelhiveryShippingService,
+    OrderResult,
+    OrderService,
+)
+from order_codes import PackagingType, parse_quantity
+
+"""
+Ten orders for the same "iPhone 16" used to be ten check_item + ten reserve_item round trips.
+OrderCoalescer sits in FRONT of OrderService:
+    Orders submitted at (almost) the same time are collected for a short window
+    Orders for the same SKU are merged, the inventory gets ONE try_reserve
+    with the total quantity
+    The result is split back so every original order gets its own OrderResult through a Future
+
+If the merged quantity is not available the SKU falls back to one reservation per order
+in the order they arrived, so earlier orders still get the stock that is left.
+
+The coalescer only talks to the InventoryService contract, packing and shipping
+is handed back to OrderService.fulfil_reserved_orders.
+"""
+
+
+class OrderCoalescer:
+
+    def __init__(self, order_service: OrderService, max_batch_size=1000, max_wait=0.005):
+        self.order_service = order_service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="order-coalescer", daemon=True)
+        self._worker.start()
+
+    def submit(self, item_name, packaging_type, quantity=1):
+        # Returns a Future that resolves to this order's OrderResult
+        # An unknown packaging type or a quantity below 1 raises here, before the order joins a batch
+        packaging_type = PackagingType.parse(packaging_type)
+        quantity = parse_quantity(quantity)
+        future = Future()
+        order = {"item_name": item_name, "packaging_type": packaging_type, "quantity": quantity}
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("OrderCoalescer is closed")
+            self._pending.append((order, future))
+            self._condition.notify()
+        return future
+
+    def close(self):
+        # Flushes whatever is still waiting and stops the background thread
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # =========================
+    # BACKGROUND FLUSHING
+    # =========================
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending and self._closed:
+                    return
+                # The first order opened the window, wait for more until it is full or timed out
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        # A cancelled order is dropped before any stock is reserved for it, the rest can no longer be cancelled
+        batch = [(order, future) for order, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            reserved, failed = self._reserve_coalesced([order for order, _ in batch])
+            results = dict(failed)
+            if reserved:
+                fulfilled = self.order_service.fulfil_reserved_orders([batch[i][0] for i in reserved])
+                results.update(zip(reserved, fulfilled))
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for index, (_, future) in enumerate(batch):
+            future.set_result(results[index])
+
+    def _reserve_coalesced(self, orders):
+        # Returns the indexes of the orders that got stock, and {index: OrderResult} for the ones that did not
+        inventory = self.order_service.inventory_service
+        by_sku = {}
+        for index, order in enumerate(orders):
+            by_sku.setdefault(order["item_name"], []).append(index)
+
+        reserved = []
+        failed = {}
+        for item_name, indexes in by_sku.items():
+            total = sum(orders[index]["quantity"] for index in indexes)
+            try:
+                if inventory.try_reserve(item_name, total):
+                    # Happy path, ONE round trip for every order of this SKU
+                    reserved.extend(indexes)
+                    continue
+            except Exception:
+                pass
+            # Not enough for all of them, hand out what is left in arrival order
+            for index in indexes:
+                quantity = orders[index]["quantity"]
+                try:
+                    if inventory.try_reserve(item_name, quantity):
+                        reserved.append(index)
+                    else:
+                        failed[index] = OrderResult(item_name, False, None)
+                except Exception as error:
+                    failed[index] = OrderResult(item_name, False, error)
+        reserved.sort()
+        return reserved, failed
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    class CountingInventoryService(ArrayInventoryService):
+        round_trips = 0
+
+        def try_reserve(self, item_name, quantity=1):
+            CountingInventoryService.round_trips += 1
+            return super().try_reserve(item_name, quantity)
+
+    inventory = CountingInventoryService({"iPhone 16": 12})
+    order_service = OrderService(inventory, DefaultPackagingService(), DelhiveryShippingService())
+
+    with OrderCoalescer(order_service, max_wait=0.05) as coalescer:
+        futures = [coalescer.submit("iPhone 16", "GIFT") for _ in range(10)]
+        results = [future.result() for future in futures]
+
+    print(f"{sum(result.processed for result in results)} of {len(results)} orders processed, "
+          f"{CountingInventoryService.round_trips} reserve round trips, "
+          f"{inventory.stock_of('iPhone 16')} left in stock")
+
+
+if __name__ == "__main__":
+    main()
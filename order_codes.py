@@ -0,0 +1,62 @@
+from enum import IntEnum
+
+"""
+Categories and packaging types used to be compared as strings all over the code
+with two spellings, "ULTRA EXPENSIVE" and "ULTRA_EXPENSIVE".
+Because of that OrderService(category="LOW_EXPENSIVE") silently fell into the else branch.
+
+Now a value is normalised ONCE when the order comes in:
+    Category.parse("ultra expensive") -> Category.ULTRA_EXPENSIVE
+    PackagingType.parse("GIFT")       -> PackagingType.GIFT
+and everything after that dispatches on the small int through precomputed tables.
+
+Spaces, dashes and case do not matter, an already parsed member or its int code is accepted too.
+Anything else raises InvalidOrderError up front instead of being routed to a default carrier.
+"""
+
+
+class InvalidOrderError(ValueError):
+    pass
+
+
+def parse_quantity(value):
+    # A quantity is a whole number of units, at least 1, a negative one would ADD stock
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise InvalidOrderError(f"Quantity must be a whole number of at least 1, got {value!r}")
+    return value
+
+
+class _ParsableIntEnum(IntEnum):
+
+    @classmethod
+    def parse(cls, value):
+        member = cls._lookup_table.get(value)
+        if member is None:
+            if isinstance(value, str):
+                member = cls._lookup_table.get(value.strip().upper().replace(" ", "_").replace("-", "_"))
+            if member is None:
+                names = ", ".join(member.name for member in cls)
+                raise InvalidOrderError(f"Unknown {cls.__name__} {value!r}, expected one of {names}")
+        return member
+
+
+class Category(_ParsableIntEnum):
+    ULTRA_EXPENSIVE = 0
+    MEDIUM_EXPENSIVE = 1
+    LOW_EXPENSIVE = 2
+
+
+class PackagingType(_ParsableIntEnum):
+    NORMAL = 0
+    GIFT = 1
+
+
+# parse() is one dict lookup for the usual spellings:
+# the member itself, its int code, "NAME" and "NAME WITH SPACES"
+for _enum_class in (Category, PackagingType):
+    _enum_class._lookup_table = {}
+    for _member in _enum_class:
+        _enum_class._lookup_table[_member] = _member
+        _enum_class._lookup_table[_member.name] = _member
+        _enum_class._lookup_table[_member.name.replace("_", " ")] = _member
+del _enum_class, _member
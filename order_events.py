@@ -0,0 +1,136 @@
+import json
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+
+"""
+Every service method used to print(), a blocking stdout write (several per order) on the hot path.
+Services now EMIT typed events into an EventSink and the sink decides what happens to them.
+
+Event types:
+    item_checked, item_reserved, item_released, hold_expired,
+    packaged, shipped, tracking_enabled, eta_reported, order_processed
+
+Sinks:
+    ConsoleEventSink         prints the same lines the services used to print (the default)
+    NullEventSink            fully disabled, emit does nothing
+    RingBufferEventSink      keeps the last N events in memory, read them in batches with drain()
+    BackgroundFileEventSink  a background thread writes JSON lines to a file from a BOUNDED queue,
+                             when the queue is full events are dropped and counted, never waited on
+
+Services get their sink from EventSource.event_sink:
+    EventSource.event_sink = NullEventSink()     -> every service, everywhere
+    shipping_service.event_sink = RingBufferEventSink()  -> only that one instance
+"""
+
+OrderEvent = namedtuple("OrderEvent", ["event_type", "timestamp", "fields"])
+
+
+class EventSink(ABC):
+    @abstractmethod
+    def emit(self, event_type, **fields):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullEventSink(EventSink):
+    def emit(self, event_type, **fields):
+        pass
+
+
+class ConsoleEventSink(EventSink):
+    # Same wording the services printed before they emitted events
+    def emit(self, event_type, **fields):
+        if event_type == "item_checked":
+            print(f"Checking inventory for {fields['quantity']} x {fields['item_name']}")
+        elif event_type == "item_reserved":
+            print(f"Reserving {fields['quantity']} x {fields['item_name']} from inventory")
+        elif event_type == "item_released":
+            print(f"Releasing {fields['quantity']} x {fields['item_name']} back to inventory")
+        elif event_type == "hold_expired":
+            print(f"Hold on {fields['quantity']} x {fields['item_name']} expired")
+        elif event_type == "hold_release_failed":
+            print(f"Could not give {fields['quantity']} x {fields['item_name']} back, retrying: {fields['error']}")
+        elif event_type == "packaged":
+            for material in fields["materials"]:
+                print(material)
+        elif event_type == "shipped":
+            print(f"Shipping via {fields['carrier']}")
+        elif event_type == "tracking_enabled":
+            print("TRACKING IS ENABLED")
+        elif event_type == "eta_reported":
+            print(f"ETA TO DELIVER IS {fields['eta']}!")
+        elif event_type == "order_processed":
+            print("Order processed successfully")
+        else:
+            print(event_type, fields)
+
+
+class RingBufferEventSink(EventSink):
+    # Keeps the newest `capacity` events, older ones are overwritten
+    def __init__(self, capacity=65536):
+        self._events = deque(maxlen=capacity)
+
+    def emit(self, event_type, **fields):
+        self._events.append(OrderEvent(event_type, time.time(), fields))
+
+    def drain(self):
+        # Hands back everything buffered so far and empties the buffer
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+    def __len__(self):
+        return len(self._events)
+
+
+class BackgroundFileEventSink(EventSink):
+
+    def __init__(self, path, max_queue=65536, batch_size=1024):
+        self.path = path
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="event-file-writer", daemon=True)
+        self._writer.start()
+
+    def emit(self, event_type, **fields):
+        try:
+            self._queue.put_nowait(OrderEvent(event_type, time.time(), fields))
+        except queue.Full:
+            # Order throughput never waits for the disk
+            self.dropped += 1
+
+    def close(self):
+        self._stopped.set()
+        self._writer.join()
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as output:
+            while not (self._stopped.is_set() and self._queue.empty()):
+                try:
+                    batch = [self._queue.get(timeout=0.1)]
+                except queue.Empty:
+                    continue
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                output.writelines(
+                    json.dumps({"event": event.event_type, "timestamp": event.timestamp, **event.fields},
+                               default=str) + "\n"
+                    for event in batch
+                )
+                output.flush()
+
+
+class EventSource:
+    # Mixin for every service, the class level sink is shared, an instance can override it
+    event_sink = ConsoleEventSink()
@@ -0,0 +1,303 @@
+import mmap
+import struct
+import sys
+import time
+
+from order_codes import Category, InvalidOrderError, PackagingType, parse_quantity
+from order_records import Order
+
+"""
+Replaying historical orders from JSON Lines for a capacity test spends most of its time in
+json.loads and string handling, not in OrderService.
+
+ORDER FILE, a compact binary format that is read without parsing:
+
+    header      32 bytes   magic "ORDBIN01", version, record size, SKU count, record count,
+                           offset of the SKU table
+    records     16 bytes per order, fixed width, little endian:
+                    timestamp_us    int64   microseconds since the epoch
+                    sku_id          uint32  index into the SKU table
+                    quantity        uint16
+                    category        uint8   a Category code
+                    packaging_type  uint8   a PackagingType code
+    SKU table   every SKU name once, uint16 length + UTF-8 bytes, sku_id is its position
+
+OrderFileWriter streams orders to disk and writes the SKU table and the header on close(),
+a file that was never closed has no header and is refused by the reader. So is a file whose
+`with OrderFileWriter(...)` block raised, it is closed WITHOUT a header.
+append() refuses an order that does not fit its record (a quantity above 65535, a SKU name
+longer than 65535 bytes) with InvalidOrderError instead of writing a corrupt file.
+
+OrderFile memory-maps the file, nothing is read until it is used:
+    records(start, stop)    decodes a slice straight from the mapping with struct.iter_unpack
+    replay(order_services)  pushes the records through OrderService.process_order, an order that
+                            raises is counted as failed and the replay goes on
+    as_numpy(start, stop)   ZERO COPY numpy structured array over the mapping, slicing it gives
+                            views, not copies (numpy is optional and only imported here)
+
+Run this module to compare replaying from JSON Lines against replaying from an order file.
+"""
+
+MAGIC = b"ORDBIN01"
+VERSION = 1
+_HEADER = struct.Struct("<8sHHIQQ")
+_RECORD = struct.Struct("<qIHBB")
+_SKU_LENGTH = struct.Struct("<H")
+RECORD_SIZE = _RECORD.size
+# Both are uint16 on disk
+MAX_QUANTITY = 0xFFFF
+_MAX_SKU_BYTES = 0xFFFF
+
+# Codes are 0..n-1 so the member is a tuple index away, cheaper than calling the enum
+_CATEGORIES = tuple(Category)
+_PACKAGING_TYPES = tuple(PackagingType)
+
+
+def numpy_dtype():
+    # The record layout as a numpy structured dtype, same field names as the format description
+    import numpy
+    return numpy.dtype([("timestamp_us", "<i8"), ("sku_id", "<u4"), ("quantity", "<u2"),
+                        ("category", "u1"), ("packaging_type", "u1")])
+
+
+# =========================
+# WRITER
+# =========================
+class OrderFileWriter:
+
+    # Records are written in chunks of this many
+    BUFFER_RECORDS = 4096
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+        # Placeholder, the real header is written by close()
+        self._file.write(bytes(_HEADER.size))
+        self._sku_ids = {}
+        self.sku_names = []
+        self._buffer = bytearray()
+        self._buffered = 0
+        self.count = 0
+
+    def sku_id(self, item_name):
+        sku_id = self._sku_ids.get(item_name)
+        if sku_id is None:
+            if len(item_name.encode("utf-8")) > _MAX_SKU_BYTES:
+                raise InvalidOrderError(f"SKU name is longer than {_MAX_SKU_BYTES} bytes: {item_name[:40]!r}...")
+            sku_id = self._sku_ids[sys.intern(item_name)] = len(self.sku_names)
+            self.sku_names.append(item_name)
+        return sku_id
+
+    def append(self, item_name, category, packaging_type, quantity=1, timestamp=None):
+        # timestamp is epoch seconds like time.time(), now when it is not given
+        if timestamp is None:
+            timestamp = time.time()
+        # Everything is checked BEFORE the record is packed, a refused order leaves nothing behind
+        quantity = parse_quantity(quantity)
+        if quantity > MAX_QUANTITY:
+            raise InvalidOrderError(f"Quantity must be at most {MAX_QUANTITY} in an order file, got {quantity}")
+        category = Category.parse(category)
+        packaging_type = PackagingType.parse(packaging_type)
+        self._buffer += _RECORD.pack(round(timestamp * 1_000_000), self.sku_id(item_name), quantity,
+                                     category, packaging_type)
+        self._buffered += 1
+        self.count += 1
+        if self._buffered == self.BUFFER_RECORDS:
+            self._flush()
+
+    def append_order(self, order, timestamp=None):
+        self.append(order.item_name, order.category, order.packaging_type, order.quantity, timestamp)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._flush()
+        sku_table_offset = self._file.tell()
+        for item_name in self.sku_names:
+            encoded = item_name.encode("utf-8")
+            self._file.write(_SKU_LENGTH.pack(len(encoded)) + encoded)
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, RECORD_SIZE, len(self.sku_names), self.count,
+                                      sku_table_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # The orders that did get written may not be all of them, no header so no reader takes it as complete
+            self._file.close()
+
+    def _flush(self):
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+        self._buffered = 0
+
+
+# =========================
+# READER
+# =========================
+class OrderFile:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, sku_count, self.count, sku_table_offset = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            if magic == bytes(len(MAGIC)):
+                raise ValueError(f"{path} was never closed by its OrderFileWriter")
+            raise ValueError(f"{path} is not an order file")
+        if version != VERSION or record_size != RECORD_SIZE:
+            self._mmap.close()
+            raise ValueError(f"{path} is order file version {version}, this reader knows version {VERSION}")
+        self.sku_names = self._read_sku_table(sku_table_offset, sku_count)
+        self._records = memoryview(self._mmap)[_HEADER.size:_HEADER.size + self.count * RECORD_SIZE]
+
+    def _read_sku_table(self, offset, sku_count):
+        sku_names = []
+        for _ in range(sku_count):
+            (length,) = _SKU_LENGTH.unpack_from(self._mmap, offset)
+            offset += _SKU_LENGTH.size
+            sku_names.append(sys.intern(self._mmap[offset:offset + length].decode("utf-8")))
+            offset += length
+        return sku_names
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("order index out of range")
+        _, sku_id, quantity, category, packaging_type = _RECORD.unpack_from(self._records, index * RECORD_SIZE)
+        return Order(self.sku_names[sku_id], category, packaging_type, quantity)
+
+    def _span(self, start, stop):
+        stop = self.count if stop is None else min(stop, self.count)
+        return self._records[start * RECORD_SIZE:stop * RECORD_SIZE]
+
+    def records(self, start=0, stop=None):
+        # Yields (timestamp_us, item_name, Category, PackagingType, quantity), decoded straight from the mapping
+        sku_names = self.sku_names
+        for timestamp_us, sku_id, quantity, category, packaging_type in _RECORD.iter_unpack(self._span(start, stop)):
+            yield timestamp_us, sku_names[sku_id], _CATEGORIES[category], _PACKAGING_TYPES[packaging_type], quantity
+
+    def order_dicts(self, start=0, stop=None):
+        # Feeds OrderService.process_orders a slice of the file, same format as OrderBatch.order_dicts
+        for _, item_name, _, packaging_type, quantity in self.records(start, stop):
+            yield {"item_name": item_name, "packaging_type": packaging_type, "quantity": quantity}
+
+    def replay(self, order_services, start=0, stop=None, on_failed=None):
+        # order_services is {Category: OrderService} (eg order_cli.build_order_services())
+        # returns (replayed, failed), on_failed(index, error) is called for every order that raised
+        replayed = failed = 0
+        for index, (_, item_name, category, packaging_type, quantity) in enumerate(self.records(start, stop), start):
+            try:
+                order_services[category].process_order(item_name, packaging_type, quantity)
+            except Exception as error:
+                failed += 1
+                if on_failed is not None:
+                    on_failed(index, error)
+                continue
+            replayed += 1
+        return replayed, failed
+
+    def as_numpy(self, start=0, stop=None):
+        """
+        Zero copy numpy structured array over records start..stop, fields as in numpy_dtype()
+        Slicing it gives views, the file is never copied into memory
+        Every array has to be dropped before close(), a mapping with live views cannot be closed
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("OrderFile.as_numpy needs numpy, records() works without it") from None
+        stop = self.count if stop is None else min(stop, self.count)
+        return numpy.frombuffer(self._mmap, dtype=numpy_dtype(), count=max(0, stop - start),
+                                offset=_HEADER.size + start * RECORD_SIZE)
+
+    def close(self):
+        self._records.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# =========================
+# MAIN (REPLAY BENCHMARK)
+# =========================
+def main():
+    import json
+    import os
+    import random
+    import tempfile
+    from order_cli import build_order_services, read_orders
+    from order_events import EventSource, NullEventSink
+    EventSource.event_sink = NullEventSink()
+
+    order_count = 500_000
+    randomizer = random.Random(7)
+    item_names = [f"SKU-{number}" for number in range(10_000)]
+    started_at = time.time()
+
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "orders.jsonl")
+        binary_path = os.path.join(directory, "orders.bin")
+        with open(text_path, "w", encoding="utf-8") as text, OrderFileWriter(binary_path) as writer:
+            for number in range(order_count):
+                row = (randomizer.choice(item_names), randomizer.choice(_CATEGORIES).name,
+                       randomizer.choice(_PACKAGING_TYPES).name, 1 + number % 3)
+                text.write(json.dumps(dict(zip(("item_name", "category", "packaging_type", "quantity"), row))) + "\n")
+                writer.append(*row, timestamp=started_at + number * 0.001)
+
+        print(f"{order_count:,} orders")
+        print(f"{'source':<14} {'bytes/order':>12} {'decode/sec':>12} {'replay/sec':>12}")
+        order_services = build_order_services()
+
+        started = time.perf_counter()
+        for _ in read_orders([text_path]):
+            pass
+        decode_rate = order_count / (time.perf_counter() - started)
+        started = time.perf_counter()
+        for order in read_orders([text_path]):
+            order_services[order.category].process_order(order.item_name, order.packaging_type, order.quantity)
+        replay_rate = order_count / (time.perf_counter() - started)
+        print(f"{'JSON Lines':<14} {os.path.getsize(text_path) / order_count:>12.1f} "
+              f"{decode_rate:>12,.0f} {replay_rate:>12,.0f}")
+
+        with OrderFile(binary_path) as order_file:
+            started = time.perf_counter()
+            for _ in order_file.records():
+                pass
+            decode_rate = order_count / (time.perf_counter() - started)
+            started = time.perf_counter()
+            _, failed = order_file.replay(order_services)
+            replay_rate = order_count / (time.perf_counter() - started)
+            print(f"{'order file':<14} {os.path.getsize(binary_path) / order_count:>12.1f} "
+                  f"{decode_rate:>12,.0f} {replay_rate:>12,.0f}")
+            if failed:
+                print(f"{failed:,} orders failed during the replay")
+
+            try:
+                view = order_file.as_numpy()
+            except ImportError:
+                print("numpy not installed, skipping the structured array view")
+            else:
+                gift_wrapped = int((view["packaging_type"] == PackagingType.GIFT).sum())
+                print(f"numpy view: {gift_wrapped:,} gift wrapped orders, first timestamp_us {view[0]['timestamp_us']}")
+                del view
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import sys
+import tracemalloc
+from array import array
+
+from order_codes import Category, PackagingType, parse_quantity
+
+"""
+Orders only existed as loose keyword arguments, a queue of pending orders held a dict
+and full strings for every order. We keep MILLIONS of pending orders in memory at peak.
+
+Order
+    one order as a small value object with __slots__ (no per-instance __dict__)
+    the SKU name is interned so a million orders for "iPhone 16" share ONE string
+    category and packaging type are parsed into their Category / PackagingType codes on the way in
+
+OrderBatch
+    many orders stored COLUMN by column in parallel typed arrays:
+        sku_ids         array("I")  4 bytes, index into the batch's SKU table
+        category codes  array("B")  1 byte, a Category value
+        packaging codes array("B")  1 byte, a PackagingType value
+        quantities      array("I")  4 bytes
+    -> about 10 bytes per order instead of a few hundred
+
+Run this module for the per-order memory footprint of each representation.
+"""
+
+# Codes are 0..n-1 so the member is a tuple index away, cheaper than calling the enum
+_PACKAGING_TYPES = tuple(PackagingType)
+
+
+class Order:
+    __slots__ = ("item_name", "category", "packaging_type", "quantity")
+
+    def __init__(self, item_name, category, packaging_type, quantity=1):
+        self.item_name = sys.intern(item_name)
+        self.category = Category.parse(category)
+        self.packaging_type = PackagingType.parse(packaging_type)
+        self.quantity = parse_quantity(quantity)
+
+    def to_dict(self):
+        # Same dict format OrderService.process_orders takes
+        return {"item_name": self.item_name, "packaging_type": self.packaging_type,
+                "quantity": self.quantity}
+
+    def __eq__(self, other):
+        if not isinstance(other, Order):
+            return NotImplemented
+        return (self.item_name, self.category, self.packaging_type, self.quantity) == \
+            (other.item_name, other.category, other.packaging_type, other.quantity)
+
+    def __repr__(self):
+        return (f"Order(item_name={self.item_name!r}, category={self.category.name}, "
+                f"packaging_type={self.packaging_type.name}, quantity={self.quantity})")
+
+
+class OrderBatch:
+
+    def __init__(self):
+        self._sku_ids = {}
+        self.sku_names = []
+        self.sku_id_column = array("I")
+        self.category_column = array("B")
+        self.packaging_column = array("B")
+        self.quantity_column = array("I")
+
+    def sku_id(self, item_name):
+        sku_id = self._sku_ids.get(item_name)
+        if sku_id is None:
+            sku_id = len(self.sku_names)
+            item_name = sys.intern(item_name)
+            self._sku_ids[item_name] = sku_id
+            self.sku_names.append(item_name)
+        return sku_id
+
+    def append(self, item_name, category, packaging_type, quantity=1):
+        self.sku_id_column.append(self.sku_id(item_name))
+        self.category_column.append(Category.parse(category))
+        self.packaging_column.append(PackagingType.parse(packaging_type))
+        self.quantity_column.append(parse_quantity(quantity))
+
+    def append_order(self, order):
+        self.append(order.item_name, order.category, order.packaging_type, order.quantity)
+
+    def __len__(self):
+        return len(self.sku_id_column)
+
+    def __getitem__(self, index):
+        # Rebuilds the Order at one row, the batch itself never holds Order objects
+        return Order(self.sku_names[self.sku_id_column[index]],
+                     self.category_column[index],
+                     self.packaging_column[index],
+                     self.quantity_column[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def order_dicts(self, start=0, stop=None):
+        # Feeds OrderService.process_orders a slice of the batch without materialising all of it
+        stop = len(self) if stop is None else min(stop, len(self))
+        for index in range(start, stop):
+            yield {"item_name": self.sku_names[self.sku_id_column[index]],
+                   "packaging_type": _PACKAGING_TYPES[self.packaging_column[index]],
+                   "quantity": self.quantity_column[index]}
+
+    def memory_usage(self):
+        # Bytes held by the columns, the SKU table is shared by every order and reported separately
+        return sum(column.itemsize * len(column) for column in
+                   (self.sku_id_column, self.category_column, self.packaging_column, self.quantity_column))
+
+
+# =========================
+# MAIN (MEMORY BENCHMARK)
+# =========================
+def _measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, after - before
+
+
+def main():
+    order_count = 1_000_000
+    item_names = [f"SKU-{number}" for number in range(10_000)]
+
+    def rows():
+        for number in range(order_count):
+            yield (item_names[number % len(item_names)], Category(number % 3).name,
+                   PackagingType(number % 2).name, 1 + number % 3)
+
+    def as_dicts():
+        return [{"item_name": item_name, "category": category, "packaging_type": packaging_type,
+                 "quantity": quantity} for item_name, category, packaging_type, quantity in rows()]
+
+    def as_orders():
+        return [Order(*row) for row in rows()]
+
+    def as_batch():
+        batch = OrderBatch()
+        for row in rows():
+            batch.append(*row)
+        return batch
+
+    print(f"{'representation':<22} {'bytes/order':>12}")
+    for name, build in (("dict per order", as_dicts), ("slotted Order", as_orders), ("columnar OrderBatch", as_batch)):
+        kept, used = _measure(build)
+        print(f"{name:<22} {used / order_count:>12.1f}")
+        del kept
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from composition_ex_oop import PackagingService
+from order_codes import PackagingType
+
+"""
+package_item packs one order at a time, so the station switches between gift wrap + greeting card
+and normal wrap on almost every call, and every switch costs a material changeover.
+
+PackagingWaveScheduler sits in FRONT of a PackagingService:
+    submit(packaging_type, carrier, pickup_deadline) buffers the order and returns a Future
+    orders are grouped into WAVES by (packaging_type, carrier), every wave is ONE package_items
+    call with a single packaging type, so the station changes material once per wave
+
+A wave is released when
+    it has max_wave_size orders                                     (size limit)
+    its oldest order waited max_wait seconds                        (time limit)
+    its earliest pickup deadline is less than deadline_margin away  (the carrier truck is coming)
+Ready waves go out earliest pickup deadline first, and inside a group the most urgent orders
+go into the wave first.
+
+Run this module for the throughput report, wave mode against one by one.
+"""
+
+
+class _WaveGroup:
+    __slots__ = ("orders", "oldest_arrival", "earliest_deadline")
+
+    def __init__(self):
+        self.orders = []
+        self.oldest_arrival = None
+        self.earliest_deadline = None
+
+    def add(self, order):
+        self.orders.append(order)
+        arrival, deadline = order[1], order[2]
+        if self.oldest_arrival is None or arrival < self.oldest_arrival:
+            self.oldest_arrival = arrival
+        if deadline is not None and (self.earliest_deadline is None or deadline < self.earliest_deadline):
+            self.earliest_deadline = deadline
+
+    def recompute(self):
+        self.oldest_arrival = min((order[1] for order in self.orders), default=None)
+        self.earliest_deadline = min((order[2] for order in self.orders if order[2] is not None), default=None)
+
+
+class PackagingWaveScheduler:
+
+    def __init__(self, packaging_service: PackagingService, max_wave_size=200, max_wait=0.5,
+                 deadline_margin=1.0, clock=time.monotonic):
+        self.packaging_service = packaging_service
+        self.max_wave_size = max_wave_size
+        self.max_wait = max_wait
+        self.deadline_margin = deadline_margin
+        self._clock = clock
+        self._groups = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self.waves = 0
+        self.packed = 0
+        self._worker = threading.Thread(target=self._run, name="packaging-waves", daemon=True)
+        self._worker.start()
+
+    def submit(self, packaging_type, carrier=None, pickup_deadline=None):
+        # Returns a Future with this order's package_items outcome
+        # pickup_deadline is on the scheduler's clock (time.monotonic by default), None = no deadline
+        packaging_type = PackagingType.parse(packaging_type)
+        future = Future()
+        # (packaging_type, arrival, pickup_deadline, future)
+        order = (packaging_type, self._clock(), pickup_deadline, future)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("PackagingWaveScheduler is closed")
+            group = self._groups.get((packaging_type, carrier))
+            if group is None:
+                group = self._groups[(packaging_type, carrier)] = _WaveGroup()
+            group.add(order)
+            # Only wake the scheduler when this order can change what is released next
+            if len(group.orders) >= self.max_wave_size or pickup_deadline is not None or len(group.orders) == 1:
+                self._condition.notify()
+        return future
+
+    def close(self):
+        # Releases every buffered order and stops the background thread
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # =========================
+    # WAVE FORMING
+    # =========================
+    def _release_at(self, group):
+        # The moment this group has to go, whichever limit comes first
+        due = group.oldest_arrival + self.max_wait
+        if group.earliest_deadline is not None:
+            due = min(due, group.earliest_deadline - self.deadline_margin)
+        return due
+
+    def _ready_waves(self):
+        # Takes every wave that is due now out of the buffer, most urgent first
+        now = self._clock()
+        ready = []
+        next_due = None
+        for key, group in list(self._groups.items()):
+            while group.orders:
+                due = self._release_at(group)
+                if not (self._closed or len(group.orders) >= self.max_wave_size or due <= now):
+                    next_due = due if next_due is None else min(next_due, due)
+                    break
+                if len(group.orders) > self.max_wave_size:
+                    group.orders.sort(key=lambda order: (order[2] is None, order[2] or 0.0, order[1]))
+                wave = group.orders[:self.max_wave_size]
+                group.orders = group.orders[self.max_wave_size:]
+                group.recompute()
+                earliest = min((order[2] for order in wave if order[2] is not None), default=float("inf"))
+                ready.append((earliest, key[0], wave))
+            if not group.orders:
+                del self._groups[key]
+        # Equally urgent waves of the same packaging type go back to back, one changeover for all of them
+        ready.sort(key=lambda entry: entry[:2])
+        return [wave for _, _, wave in ready], next_due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    waves, next_due = self._ready_waves()
+                    if waves or (self._closed and not self._groups):
+                        break
+                    timeout = None if next_due is None else max(0.0, next_due - self._clock())
+                    self._condition.wait(timeout)
+            for wave in waves:
+                self._package(wave)
+            if not waves:
+                return
+
+    def _package(self, wave):
+        # Cancelled orders are dropped, the rest of the wave can no longer be cancelled
+        wave = [order for order in wave if order[3].set_running_or_notify_cancel()]
+        if not wave:
+            return
+        try:
+            outcomes = self.packaging_service.package_items([order[0] for order in wave])
+        except Exception as error:
+            outcomes = [error] * len(wave)
+        self.waves += 1
+        self.packed += len(wave)
+        for order, outcome in zip(wave, outcomes):
+            if isinstance(outcome, Exception):
+                order[3].set_exception(outcome)
+            else:
+                order[3].set_result(outcome)
+
+
+# =========================
+# MAIN (THROUGHPUT REPORT)
+# =========================
+class PackingStationService(PackagingService):
+    # Switching material costs `changeover` seconds, packing one parcel `per_item` seconds
+    def __init__(self, changeover=0.002, per_item=0.0002):
+        self.changeover = changeover
+        self.per_item = per_item
+        self.changeovers = 0
+        self._loaded = None
+
+    def _load(self, packaging_type):
+        if packaging_type != self._loaded:
+            time.sleep(self.changeover)
+            self.changeovers += 1
+            self._loaded = packaging_type
+
+    def package_item(self, packaging_type):
+        packaging_type = PackagingType.parse(packaging_type)
+        self._load(packaging_type)
+        time.sleep(self.per_item)
+        self.event_sink.emit("packaged", packaging_type=packaging_type.name, materials=())
+
+    def package_items(self, packaging_types):
+        # A wave is ONE packaging type, the station loads the material once and packs straight through
+        results = []
+        for packaging_type in packaging_types:
+            packaging_type = PackagingType.parse(packaging_type)
+            self._load(packaging_type)
+            self.event_sink.emit("packaged", packaging_type=packaging_type.name, materials=())
+            results.append(None)
+        time.sleep(self.per_item * len(packaging_types))
+        return results
+
+
+def main():
+    from order_events import EventSource, NullEventSink
+    EventSource.event_sink = NullEventSink()
+
+    order_count = 5000
+    rng = random.Random(7)
+    carriers = ("Ekart", "Bluedart", "Delhivery")
+    orders = [("GIFT" if rng.random() < 0.3 else "NORMAL", rng.choice(carriers)) for _ in range(order_count)]
+
+    print(f"{order_count} orders, 30% gift wrap, 3 carriers, 2ms changeover, 0.2ms per parcel")
+    print(f"{'mode':<14} {'orders/sec':>11} {'changeovers':>12} {'waves':>6}")
+
+    station = PackingStationService()
+    started = time.perf_counter()
+    for packaging_type, _ in orders:
+        station.package_item(packaging_type)
+    elapsed = time.perf_counter() - started
+    print(f"{'one by one':<14} {order_count / elapsed:>11,.0f} {station.changeovers:>12} {'-':>6}")
+
+    station = PackingStationService()
+    started = time.perf_counter()
+    with PackagingWaveScheduler(station, max_wave_size=200, max_wait=0.05) as scheduler:
+        # Every carrier's truck leaves at its own time, the deadlines spread the waves over carriers
+        pickups = {carrier: time.monotonic() + 0.5 * (number + 1) for number, carrier in enumerate(carriers)}
+        futures = [scheduler.submit(packaging_type, carrier, pickups[carrier]) for packaging_type, carrier in orders]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+    print(f"{'waves':<14} {order_count / elapsed:>11,.0f} {station.changeovers:>12} {scheduler.waves:>6}")
+
+
+if __name__ == "__main__":
+    main()
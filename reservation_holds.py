@@ -0,0 +1,210 @@
+import sys
+import threading
+import time
+from array import array
+
+from order_events import EventSource
+from timing_wheel import HierarchicalTimingWheel
+
+"""
+reserve_item is permanent: when packaging or ship_item failed afterwards nothing gave the stock
+back, and in a flash sale abandoned checkouts kept their stock forever.
+
+A HOLD is a reservation that gives its stock back by itself unless it is confirmed in time:
+
+    hold_id = inventory.reserve_hold("iPhone 16", quantity=1, ttl=600)   # None if out of stock
+    inventory.confirm_hold(hold_id)     # the reservation becomes permanent
+    inventory.release_hold(hold_id)     # the stock goes back right away
+    ...neither within ttl seconds       # the stock goes back when the hold expires
+
+Every InventoryService that can give stock back (has release_item) gets these through
+ReservationHolds, built on its own try_reserve and release_item. An inventory without
+release_item is refused when its holds are created, not when the first hold expires.
+If release_item raises, the stock is kept aside and given back on the next expire_due. The
+failure is reported as a "hold_release_failed" event, and it never breaks the call that
+ran into it.
+
+Expiry runs on a HierarchicalTimingWheel: no timer per hold, no periodic scan over all holds,
+O(1) amortized per hold. Due holds are expired on every hold call, and by a background
+thread every `interval` seconds after start().
+
+Holds are stored COLUMN by column in typed arrays, a slot per live hold that is reused once the
+hold is done (~28 bytes per outstanding hold including the wheel):
+    sku id "I", quantity "I", generation "I"
+A hold id is (generation << 32) | slot, the generation is bumped every time a slot is freed,
+so an id of a finished hold can never confirm or release the hold that reuses its slot.
+"""
+
+
+class HoldNotFoundError(LookupError):
+    pass
+
+
+def check_releasable(inventory):
+    if not callable(getattr(inventory, "release_item", None)):
+        raise TypeError(f"{type(inventory).__name__} has no release_item, holds need an inventory "
+                        f"that can give stock back")
+
+
+class ReservationHolds(EventSource):
+
+    def __init__(self, inventory, default_ttl=900.0, tick=0.05, clock=time.monotonic):
+        check_releasable(inventory)
+        self.inventory = inventory
+        self.default_ttl = default_ttl
+        self._wheel = HierarchicalTimingWheel(tick, clock=clock)
+        self._lock = threading.Lock()
+        self._sku_ids = {}
+        self._sku_names = []
+        self._sku = array("I")
+        self._quantity = array("I")
+        self._generation = array("I")
+        self._free = array("I")
+        # (item_name, quantity) whose release_item raised, retried by expire_due
+        self._unreleased = []
+        self._ticker = None
+        self._stopped = threading.Event()
+        self.outstanding = 0
+        self.confirmed = 0
+        self.released = 0
+        self.expired = 0
+        self.release_failures = 0
+
+    def reserve(self, item_name, quantity=1, ttl=None):
+        self.expire_due()
+        if not self.inventory.try_reserve(item_name, quantity):
+            return None
+        with self._lock:
+            sku_id = self._sku_ids.get(item_name)
+            if sku_id is None:
+                sku_id = self._sku_ids[sys.intern(item_name)] = len(self._sku_names)
+                self._sku_names.append(item_name)
+            if self._free:
+                slot = self._free.pop()
+                self._sku[slot] = sku_id
+                self._quantity[slot] = quantity
+            else:
+                slot = len(self._sku)
+                self._sku.append(sku_id)
+                self._quantity.append(quantity)
+                self._generation.append(0)
+            hold_id = (self._generation[slot] << 32) | slot
+            self._wheel.schedule(hold_id, self.default_ttl if ttl is None else ttl)
+            self.outstanding += 1
+        return hold_id
+
+    def confirm(self, hold_id):
+        self.expire_due()
+        with self._lock:
+            if self._take(hold_id) is None:
+                raise HoldNotFoundError(f"Hold {hold_id} expired, was released or does not exist")
+            self.confirmed += 1
+
+    def release(self, hold_id):
+        self.expire_due()
+        with self._lock:
+            taken = self._take(hold_id)
+            if taken is None:
+                raise HoldNotFoundError(f"Hold {hold_id} expired, was released or does not exist")
+            self.released += 1
+        self._give_back(*taken)
+
+    def expire_due(self, now=None):
+        # Gives back the stock of every hold whose ttl ran out, returns how many expired
+        with self._lock:
+            expired = []
+            for hold_id in self._wheel.advance(now):
+                # Confirmed or released holds stay on the wheel until their ttl, they are skipped here
+                taken = self._take(hold_id)
+                if taken is not None:
+                    expired.append(taken)
+            self.expired += len(expired)
+            retries, self._unreleased = self._unreleased, []
+        for item_name, quantity in retries:
+            self._give_back(item_name, quantity)
+        # Every hold is given back on its own, one failing release_item does not stop the others
+        for item_name, quantity in expired:
+            self.event_sink.emit("hold_expired", item_name=item_name, quantity=quantity)
+            self._give_back(item_name, quantity)
+        return len(expired)
+
+    def _give_back(self, item_name, quantity):
+        try:
+            self.inventory.release_item(item_name, quantity)
+        except Exception as error:
+            # The hold is already gone, keep the stock aside so it is not lost
+            with self._lock:
+                self._unreleased.append((item_name, quantity))
+                self.release_failures += 1
+            self.event_sink.emit("hold_release_failed", item_name=item_name, quantity=quantity, error=repr(error))
+
+    def start(self, interval=1.0):
+        self._ticker = threading.Thread(target=self._tick_loop, args=(interval,), name="hold-expiry", daemon=True)
+        self._ticker.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._ticker is not None:
+            self._ticker.join()
+
+    def memory_usage(self):
+        # Bytes held by the hold columns and the timing wheel
+        columns = (self._sku, self._quantity, self._generation, self._free)
+        return sum(column.itemsize * len(column) for column in columns) + self._wheel.memory_usage()
+
+    def _take(self, hold_id):
+        # Frees the hold's slot and returns (item_name, quantity), None if the hold is not live
+        slot = hold_id & 0xFFFFFFFF
+        if slot >= len(self._generation) or self._generation[slot] != hold_id >> 32:
+            return None
+        self._generation[slot] = (self._generation[slot] + 1) & 0xFFFFFFFF
+        self._free.append(slot)
+        self.outstanding -= 1
+        return self._sku_names[self._sku[slot]], self._quantity[slot]
+
+    def _tick_loop(self, interval):
+        while not self._stopped.wait(interval):
+            self.expire_due()
+
+
+# =========================
+# MAIN (A MILLION HOLDS)
+# =========================
+def main():
+    from array_inventory import ArrayInventoryService
+    from order_events import NullEventSink
+    EventSource.event_sink = NullEventSink()
+
+    hold_count = 1_000_000
+    sku_count = 1000
+    now = [0.0]
+    inventory = ArrayInventoryService({f"SKU-{number}": 2000 for number in range(sku_count)})
+    holds = ReservationHolds(inventory, clock=lambda: now[0])
+    # Flash sale checkouts, held for 1 to 10 minutes
+    item_names = [f"SKU-{number % sku_count}" for number in range(hold_count)]
+
+    started = time.perf_counter()
+    hold_ids = [holds.reserve(item_name, 1, 60 + number % 540) for number, item_name in enumerate(item_names)]
+    elapsed = time.perf_counter() - started
+    print(f"{hold_count:,} holds placed in {elapsed:.2f}s, "
+          f"{holds.memory_usage() / hold_count:.1f} bytes per outstanding hold")
+
+    for hold_id in hold_ids[::10]:
+        holds.confirm(hold_id)
+    for hold_id in hold_ids[1::10]:
+        holds.release(hold_id)
+    del hold_ids
+
+    now[0] = 601.0
+    started = time.perf_counter()
+    expired = holds.expire_due()
+    elapsed = time.perf_counter() - started
+    print(f"{expired:,} holds expired in {elapsed:.2f}s ({elapsed / expired * 1e9:.0f} ns/hold)")
+
+    left = sum(inventory.stock_of(f"SKU-{number}") for number in range(sku_count))
+    print(f"stock left {left:,} = {sku_count * 2000:,} - {holds.confirmed:,} confirmed, "
+          f"outstanding holds {holds.outstanding}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+import itertools
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from composition_ex_oop import ShippingService
+from shipping_wrappers import DelegatingShippingService
+from stage_metrics import LogHistogram
+
+"""
+ship_item had no timeout, no fallback and no breaker: if Ekart's booking endpoint stalls,
+every ULTRA_EXPENSIVE order stalls with it.
+
+ResilientShippingService wraps an ORDERED list of carriers (the first one is the primary)
+and is itself a ShippingService, so OrderService uses it like any carrier:
+
+    shipping = ResilientShippingService([EkartShippingService(), BluedartShippingService()], hedge=True,
+                                        compensate=cancel_booking)
+    OrderService(inventory, packaging, shipping)
+
+    deadline / deadlines   seconds a booking may take, per carrier CLASS, after that we move on
+    CircuitBreaker         per carrier, trips OPEN on too many errors OR too many slow calls in
+                           the last `window` calls, skips the carrier for `open_seconds`, then lets
+                           ONE probe through (HALF_OPEN) to decide whether to close again
+    hedge=True             if the carrier has not answered within its own p95 latency, the booking
+                           is also sent to the next carrier, the first success wins
+    max_workers            BULKHEAD, every carrier has its own thread pool of this size, when all of
+                           them are busy (a stalled carrier) the carrier is skipped like an open
+                           circuit, so a stall never queues up another carrier's bookings and a
+                           deadline always measures the carrier call itself
+
+A parcel is never kept booked twice: when a hedged or timed out booking ALSO succeeds, the
+losing booking is compensated. compensate(carrier, result) is called when given, otherwise the
+carrier must be Cancellable and gets cancel_shipment(result). With hedging or failover (more than
+one carrier) a carrier that can be neither is refused up front with a ValueError. A single carrier
+without hedging can only lose a booking that came back after its deadline, that one is reported
+as a "duplicate_booking" event so it can be cancelled by hand.
+
+Tracking and ETA are delegated to the primary carrier.
+"""
+
+
+class CarrierTimeoutError(TimeoutError):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class BulkheadFullError(Exception):
+    pass
+
+
+class AllCarriersFailedError(Exception):
+    def __init__(self, errors):
+        super().__init__("No carrier could book the parcel: " +
+                         ", ".join(f"{carrier}: {error!r}" for carrier, error in errors.items()))
+        self.errors = errors
+
+
+class Cancellable(ABC):
+    @abstractmethod
+    def cancel_shipment(self, shipment_id):
+        pass
+
+
+class CircuitBreaker:
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, failure_rate=0.5, slow_call_rate=0.5, slow_call_seconds=1.0,
+                 window=20, min_calls=10, open_seconds=30.0, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._clock = clock
+        # (failed, slow) for the last `window` calls
+        self._calls = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.open_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if self._clock() - self._opened_at < self.open_seconds:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probing = False
+            # HALF_OPEN, only one probe at a time
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, success, seconds):
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probing = False
+                if success and not slow:
+                    self._state = self.CLOSED
+                    self._calls.clear()
+                else:
+                    self._open()
+                return
+            if self._state == self.OPEN:
+                # A call started before the breaker tripped, it does not change anything
+                return
+            self._calls.append((not success, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            failed = sum(1 for call_failed, _ in self._calls if call_failed)
+            slow_calls = sum(1 for _, call_slow in self._calls if call_slow)
+            if failed >= self.failure_rate * len(self._calls) or slow_calls >= self.slow_call_rate * len(self._calls):
+                self._open()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._calls.clear()
+        self.trips += 1
+
+
+class _CarrierLane:
+    # One carrier with its breaker, deadline and latency histogram
+
+    def __init__(self, carrier, deadline, breaker, max_workers):
+        self.carrier = carrier
+        self.name = type(carrier).__name__
+        self.deadline = deadline
+        self.breaker = breaker
+        # Taken before a booking is submitted, so the executor never has a queue
+        self.slots = threading.BoundedSemaphore(max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"resilient-{self.name}")
+        self._latencies = LogHistogram()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.timeouts = 0
+        self.hedges = 0
+
+    def record_latency(self, nanoseconds):
+        with self._lock:
+            self.calls += 1
+            self._latencies.record(nanoseconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def p95_seconds(self, min_samples):
+        with self._lock:
+            if self._latencies.count < min_samples:
+                return None
+            return self._latencies.percentile(0.95) / 1e9
+
+
+class _Booking:
+    # One ship_item call, decides which carrier's booking is kept and compensates the others
+
+    def __init__(self, dispatcher):
+        self._dispatcher = dispatcher
+        self._lock = threading.Lock()
+        self._settled = False
+        self._winner = None
+        self._succeeded = []
+        self._reported = set()
+
+    def succeeded(self, lane, result):
+        with self._lock:
+            if not self._settled:
+                self._succeeded.append((lane, result))
+                return
+        # Finished after the booking was already decided, it lost
+        self._dispatcher._compensate(lane, result)
+
+    def settle(self, winner):
+        with self._lock:
+            self._settled = True
+            self._winner = winner
+            losers = [(lane, result) for lane, result in self._succeeded if lane is not winner]
+        for lane, result in losers:
+            self._dispatcher._compensate(lane, result)
+
+    def report_once(self, lane):
+        # The dispatching thread times a lane out while the lane's own thread may be finishing it,
+        # only the first of the two reports the call to the breaker
+        with self._lock:
+            if lane in self._reported:
+                return False
+            self._reported.add(lane)
+            return True
+
+
+class ResilientShippingService(DelegatingShippingService):
+    # Bookings fail over between the carriers, tracking and ETA are delegated to the primary as they are
+
+    @staticmethod
+    def _delegate(carriers, *args, **kwargs):
+        if not carriers:
+            raise ValueError("ResilientShippingService needs at least one carrier")
+        return carriers[0]
+
+    def __init__(self, carriers, deadline=2.0, deadlines=None, hedge=False, min_hedge_samples=20,
+                 breaker_factory=CircuitBreaker, compensate=None, max_workers=32):
+        if compensate is None and (hedge or len(carriers) > 1):
+            # A second booking of the same parcel would be kept with nobody able to undo it
+            stuck = [type(carrier).__name__ for carrier in carriers if not isinstance(carrier, Cancellable)]
+            if stuck:
+                raise ValueError(f"{', '.join(stuck)} cannot be cancelled, pass compensate= or make them "
+                                 f"Cancellable to use hedging or failover")
+        deadlines = deadlines or {}
+        self._lanes = [_CarrierLane(carrier, deadlines.get(type(carrier), deadline), breaker_factory(), max_workers)
+                       for carrier in carriers]
+        self.primary = self.carrier = carriers[0]
+        self.hedge = hedge
+        self.min_hedge_samples = min_hedge_samples
+        self.compensate = compensate
+        self._lock = threading.Lock()
+        self.compensations = 0
+
+    def ship_item(self):
+        booking = _Booking(self)
+        candidates = iter(self._lanes)
+        in_flight = {}
+        errors = {}
+
+        def launch():
+            # Starts the next carrier whose breaker lets the call through
+            for lane in candidates:
+                if not lane.slots.acquire(blocking=False):
+                    errors[lane.name] = BulkheadFullError(f"every {lane.name} thread is busy")
+                    continue
+                if not lane.breaker.allow():
+                    lane.slots.release()
+                    errors[lane.name] = CircuitOpenError(f"{lane.name} circuit is open")
+                    continue
+                future = lane.executor.submit(self._attempt, lane, booking)
+                in_flight[future] = (lane, time.monotonic() + lane.deadline)
+                return lane
+            return None
+
+        first_lane = launch()
+        hedge_at = None
+        if self.hedge and first_lane is not None:
+            p95 = first_lane.p95_seconds(self.min_hedge_samples)
+            if p95 is not None:
+                hedge_at = time.monotonic() + p95
+
+        try:
+            while in_flight:
+                wake_at = min(deadline for _, deadline in in_flight.values())
+                if hedge_at is not None:
+                    wake_at = min(wake_at, hedge_at)
+                done, _ = wait(in_flight, timeout=max(0.0, wake_at - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    lane, _ = in_flight.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        booking.settle(lane)
+                        return future.result()
+                    errors[lane.name] = error
+
+                now = time.monotonic()
+                for future, (lane, deadline) in list(in_flight.items()):
+                    if now >= deadline:
+                        # Still running in its thread, a late success gets compensated
+                        del in_flight[future]
+                        self._timed_out(lane, booking)
+                        errors[lane.name] = CarrierTimeoutError(f"{lane.name} did not answer in {lane.deadline}s")
+
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    if in_flight:
+                        hedged_lane = launch()
+                        if hedged_lane is not None:
+                            hedged_lane.hedges += 1
+                            self.event_sink.emit("booking_hedged", carrier=hedged_lane.name)
+                if not in_flight:
+                    # FAILOVER to the next carrier
+                    launch()
+        except BaseException:
+            booking.settle(None)
+            raise
+        booking.settle(None)
+        raise AllCarriersFailedError(errors)
+
+    # Every parcel of a batch is its own booking with failover
+    ship_items = ShippingService.ship_items
+
+    def stats(self):
+        return {lane.name: {"state": lane.breaker.state,
+                            "calls": lane.calls,
+                            "timeouts": lane.timeouts,
+                            "hedges": lane.hedges,
+                            "trips": lane.breaker.trips,
+                            "p95_ms": (lane.p95_seconds(1) or 0.0) * 1000}
+                for lane in self._lanes}
+
+    def close(self):
+        for lane in self._lanes:
+            lane.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _attempt(self, lane, booking):
+        started = time.perf_counter_ns()
+        try:
+            result = lane.carrier.ship_item()
+        except Exception:
+            self._finished(lane, booking, False, time.perf_counter_ns() - started)
+            raise
+        finally:
+            lane.slots.release()
+        self._finished(lane, booking, True, time.perf_counter_ns() - started)
+        booking.succeeded(lane, result)
+        return result
+
+    @staticmethod
+    def _finished(lane, booking, success, nanoseconds):
+        lane.record_latency(nanoseconds)
+        # A call that already timed out was reported to the breaker back then
+        if booking.report_once(lane):
+            lane.breaker.record(success, nanoseconds / 1e9)
+
+    @staticmethod
+    def _timed_out(lane, booking):
+        if booking.report_once(lane):
+            lane.record_timeout()
+            lane.breaker.record(False, lane.deadline)
+
+    def _compensate(self, lane, result):
+        with self._lock:
+            self.compensations += 1
+        try:
+            if self.compensate is not None:
+                self.compensate(lane.carrier, result)
+            elif isinstance(lane.carrier, Cancellable):
+                lane.carrier.cancel_shipment(result)
+            else:
+                self.event_sink.emit("duplicate_booking", carrier=lane.name, shipment_id=result)
+        except Exception as error:
+            self.event_sink.emit("compensation_failed", carrier=lane.name, shipment_id=result, error=repr(error))
+
+
+# =========================
+# MAIN (TAIL LATENCY DEMO)
+# =========================
+class StallingCarrier(ShippingService, Cancellable):
+    # Usually answers in `latency` seconds, `stall_rate` of the bookings take `stall` seconds instead
+    def __init__(self, name, latency=0.005, stall=0.5, stall_rate=0.0, error_rate=0.0, seed=None):
+        self.name = name
+        self.latency = latency
+        self.stall = stall
+        self.stall_rate = stall_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+        self.booked = 0
+        self.cancelled = 0
+
+    def ship_item(self):
+        with self._lock:
+            roll = self._random.random()
+            failed = self._random.random() < self.error_rate
+        time.sleep(self.stall if roll < self.stall_rate else self.latency)
+        if failed:
+            raise ConnectionError(f"{self.name} booking failed")
+        with self._lock:
+            self.booked += 1
+        return f"{self.name.upper()}-{next(self._numbers)}"
+
+    def cancel_shipment(self, shipment_id):
+        with self._lock:
+            self.cancelled += 1
+
+
+class SimulatedEkart(StallingCarrier):
+    pass
+
+
+class SimulatedBluedart(StallingCarrier):
+    pass
+
+
+def _run(shipping, bookings):
+    latencies = []
+    failures = 0
+    for _ in range(bookings):
+        started = time.perf_counter()
+        try:
+            shipping.ship_item()
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], latencies[-1], failures
+
+
+def main():
+    from order_events import EventSource, NullEventSink
+    EventSource.event_sink = NullEventSink()
+
+    bookings = 400
+    print(f"{'dispatch':<28} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'failed':>7} {'kept':>6}")
+
+    def report(name, shipping, carriers):
+        p50, p99, worst, failures = _run(shipping, bookings)
+        # let stalled bookings finish so their compensation is counted
+        time.sleep(0.6)
+        kept = sum(carrier.booked - carrier.cancelled for carrier in carriers)
+        print(f"{name:<28} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f} {worst * 1000:>8.1f} {failures:>7} {kept:>6}")
+
+    # Ekart stalls on 3% of its bookings
+    ekart = SimulatedEkart("Ekart", stall_rate=0.03, seed=1)
+    report("direct ship_item", ekart, [ekart])
+
+    ekart, bluedart = SimulatedEkart("Ekart", stall_rate=0.03, seed=1), SimulatedBluedart("Bluedart", seed=2)
+    shipping = ResilientShippingService([ekart, bluedart], deadline=0.2)
+    report("deadline + failover", shipping, [ekart, bluedart])
+    shipping.close()
+
+    ekart, bluedart = SimulatedEkart("Ekart", stall_rate=0.03, seed=1), SimulatedBluedart("Bluedart", seed=2)
+    shipping = ResilientShippingService([ekart, bluedart], deadline=0.2, hedge=True)
+    report("deadline + p95 hedging", shipping, [ekart, bluedart])
+    shipping.close()
+    print(f"  late duplicate bookings cancelled: {ekart.cancelled + bluedart.cancelled}")
+
+    # Ekart is down, the breaker stops paying for its failures
+    ekart, bluedart = SimulatedEkart("Ekart", error_rate=1.0, seed=1), SimulatedBluedart("Bluedart", seed=2)
+    shipping = ResilientShippingService([ekart, bluedart], deadline=0.2)
+    report("Ekart down, breaker", shipping, [ekart, bluedart])
+    for name, stats in shipping.stats().items():
+        print(f"  {name}: {stats}")
+    shipping.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import traceback
+import zlib
+
+from array_inventory import ArrayInventoryService
+from composition_ex_oop import (
+    DefaultPackagingService,
+    DelhiveryShippingService,
+    OrderResult,
+    OrderService,
+)
+
+"""
+OrderService runs in the calling thread, under the GIL we never get past one core.
+ShardedOrderService partitions orders by a hash of item_name across worker PROCESSES:
+    Every worker builds its OWN OrderService from order_service_factory(shard_index),
+    including its own InventoryService shard
+    A SKU always hashes to the same worker so reservations never contend across processes
+    Orders travel to the workers in batches and are run with OrderService.process_orders
+    Results stream back to the caller in SUBMISSION order
+
+order_service_factory must be picklable (a module level function) so it can reach the workers.
+
+A worker that cannot build its OrderService or dies for any other reason fails the caller with
+ShardFailedError instead of leaving it waiting for results that never come, the service is
+unusable after that.
+"""
+
+_STOP = None
+# How often a caller waiting for results checks that every worker is still alive
+_LIVENESS_INTERVAL = 0.1
+
+
+class ShardFailedError(RuntimeError):
+    pass
+
+
+def shard_for(item_name, shard_count):
+    # crc32 instead of hash() because str hashes are randomised per process
+    return zlib.crc32(item_name.encode("utf-8")) % shard_count
+
+
+def _shard_worker(shard_index, order_service_factory, inbox, outbox, quiet):
+    # Messages to the caller: ("results", run_id, [(sequence_number, OrderResult)]) or ("failed", shard_index, traceback)
+    try:
+        if quiet:
+            sys.stdout = open(os.devnull, "w")
+        order_service = order_service_factory(shard_index)
+        while True:
+            batch = inbox.get()
+            if batch is _STOP:
+                return
+            run_id, sequence_numbers, orders = batch
+            try:
+                results = order_service.process_orders(orders)
+            except Exception as error:
+                results = [OrderResult(order["item_name"], False, error) for order in orders]
+            outbox.put(("results", run_id, list(zip(sequence_numbers, results))))
+    except Exception:
+        outbox.put(("failed", shard_index, traceback.format_exc()))
+
+
+class ShardedOrderService:
+
+    def __init__(self, order_service_factory, shard_count=None, batch_size=256,
+                 max_batches_in_flight=None, quiet=False):
+        self.shard_count = shard_count or os.cpu_count() or 1
+        self.batch_size = batch_size
+        # Bounds how far the producer can run ahead of the results it yielded, so memory stays bounded
+        self.max_batches_in_flight = max_batches_in_flight or self.shard_count * 4
+        self._outbox = multiprocessing.Queue()
+        self._inboxes = []
+        self._workers = []
+        # Results of a process_orders call that was abandoned half way are told apart by run id
+        self._run_id = 0
+        self._failure = None
+        for shard_index in range(self.shard_count):
+            inbox = multiprocessing.Queue()
+            worker = multiprocessing.Process(
+                target=_shard_worker,
+                args=(shard_index, order_service_factory, inbox, self._outbox, quiet),
+                name=f"order-shard-{shard_index}",
+                daemon=True,
+            )
+            worker.start()
+            self._inboxes.append(inbox)
+            self._workers.append(worker)
+
+    def process_orders(self, orders):
+        """
+        Generator, takes any iterable of order dicts (same format as OrderService.process_orders)
+        and yields one OrderResult per order in the order they were submitted
+        Raises ShardFailedError when a worker fails
+        """
+        if self._failure is not None:
+            raise self._failure
+        self._run_id += 1
+        run_id = self._run_id
+        buffers = [([], []) for _ in range(self.shard_count)]
+        finished = {}
+        next_to_yield = 0
+        submitted = 0
+        # EVERY order read and not yielded yet counts against the bound: buffered, in a worker,
+        # or finished but waiting behind an earlier one
+        max_ahead = self.max_batches_in_flight * self.batch_size
+        # A partial buffer this many orders old is sent anyway, it would hold back every later result
+        max_age = self.batch_size * self.shard_count
+
+        def send(shard_index):
+            sequence_numbers, shard_orders = buffers[shard_index]
+            self._inboxes[shard_index].put((run_id, sequence_numbers, shard_orders))
+            buffers[shard_index] = ([], [])
+
+        def send_older_than(oldest_allowed):
+            for shard_index, (sequence_numbers, _) in enumerate(buffers):
+                if sequence_numbers and sequence_numbers[0] < oldest_allowed:
+                    send(shard_index)
+
+        def receive(block):
+            # Takes one message off the outbox, False when there was none (only when not blocking)
+            message = self._receive(block)
+            if message is None:
+                return False
+            if message[1] == run_id:
+                finished.update(message[2])
+            return True
+
+        for order in orders:
+            shard_index = shard_for(order["item_name"], self.shard_count)
+            sequence_numbers, shard_orders = buffers[shard_index]
+            sequence_numbers.append(submitted)
+            shard_orders.append(order)
+            submitted += 1
+            if len(shard_orders) >= self.batch_size:
+                send(shard_index)
+            if submitted % self.batch_size == 0:
+                send_older_than(submitted - max_age)
+                while receive(block=False):
+                    pass
+            while True:
+                while next_to_yield in finished:
+                    yield finished.pop(next_to_yield)
+                    next_to_yield += 1
+                if submitted - next_to_yield < max_ahead:
+                    break
+                # At the bound, nothing more is read until the oldest result is yielded
+                send_older_than(submitted)
+                receive(block=True)
+
+        send_older_than(submitted)
+        while next_to_yield < submitted:
+            while next_to_yield not in finished:
+                receive(block=True)
+            yield finished.pop(next_to_yield)
+            next_to_yield += 1
+
+    def _receive(self, block):
+        while True:
+            try:
+                message = self._outbox.get(timeout=_LIVENESS_INTERVAL) if block else self._outbox.get_nowait()
+            except queue.Empty:
+                if not block:
+                    return None
+                for worker in self._workers:
+                    if not worker.is_alive():
+                        self._fail(f"{worker.name} exited with code {worker.exitcode}")
+                continue
+            if message[0] == "failed":
+                self._fail(f"order-shard-{message[1]} failed:\n{message[2]}")
+            return message
+
+    def _fail(self, reason):
+        self._failure = ShardFailedError(reason)
+        raise self._failure
+
+    def close(self):
+        for inbox in self._inboxes:
+            if self._failure is not None:
+                # A dead worker never reads its inbox, do not wait on flushing it at exit
+                inbox.cancel_join_thread()
+            inbox.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# =========================
+# MAIN (SCALING BENCHMARK)
+# =========================
+class CpuBoundPackagingService(DefaultPackagingService):
+    # Stands in for real per-order CPU work (pricing, label rendering ...) so the scaling is visible
+    def package_item(self, packaging_type):
+        sum(number * number for number in range(2000))
+        super().package_item(packaging_type)
+
+
+def build_benchmark_order_service(shard_index):
+    inventory = ArrayInventoryService({f"SKU-{number}": 10**9 for number in range(1000)})
+    return OrderService(inventory, CpuBoundPackagingService(), DelhiveryShippingService())
+
+
+def _run(shard_count, orders):
+    with ShardedOrderService(build_benchmark_order_service, shard_count, quiet=True) as service:
+        started = time.perf_counter()
+        processed = sum(result.processed for result in service.process_orders(orders))
+        elapsed = time.perf_counter() - started
+    return processed, elapsed
+
+
+def main():
+    orders = [{"item_name": f"SKU-{number % 1000}", "packaging_type": "NORMAL"} for number in range(40_000)]
+    _, baseline = _run(1, orders)
+    print(f"{'shards':>6} {'orders/sec':>12} {'speedup':>8}")
+    print(f"{1:>6} {len(orders) / baseline:>12,.0f} {1.0:>8.2f}")
+    shard_count = 2
+    while shard_count <= (os.cpu_count() or 1):
+        processed, elapsed = _run(shard_count, orders)
+        print(f"{shard_count:>6} {processed / elapsed:>12,.0f} {baseline / elapsed:>8.2f}")
+        shard_count *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from composition_ex_oop import _ETA, _TRACKING, ShippingService
+from order_codes import Category, PackagingType
+from order_events import EventSource, NullEventSink
+
+"""
+process_order reserved stock and then called ship_item inline: a slow carrier held the order
+open, and a crash between reserving and shipping lost the shipment.
+
+OUTBOX MODE, OrderService(..., outbox=ShipmentOutbox(path)):
+    process_order appends a "ship" record to a local append-only log and returns as soon as
+    the record is on disk, the carrier is NOT called on the order path anymore
+
+ShipmentOutbox
+    one JSON line per record {"seq": .., "item_name": .., "packaging_type": .., "category": .., "attempt": ..}
+    category is the order's Category name (OrderService(..., category=...)), null if it was not given
+    GROUP COMMIT: a writer thread takes every record appended while the previous fsync ran
+    and writes + fsyncs them together, so concurrent orders share one fsync
+    append() returns only after its record is durable
+    on open, a torn last line from a crash is cut off and numbering continues after the last record
+
+ShipmentDispatcher
+    reads the durable records after its checkpoint, ships them in batches with ship_items
+    (plus tracking / ETA like process_order did), then saves the byte offset it reached
+    in <log>.checkpoint (write to temp file, fsync, rename)
+    ShipmentDispatcher(outbox, shipping_service) ships every record with that one carrier
+    ShipmentDispatcher(outbox, carriers=carriers_of(order_services)) ships a record with the carrier
+    of the OrderService that logged it (by category), so one outbox can be shared by the OrderServices
+    of every category, limiters / failover / manifests wrapped around their carriers included
+    a booking that fails is appended again with attempt + 1, after max_attempts, or when it cannot be
+    appended again, a "shipment_failed" event is emitted instead
+    once the outbox is closed or failed nothing more is shipped from it, a failed booking could not
+    be logged again, the next dispatcher on the same log goes on from the checkpoint
+
+Delivery is AT LEAST ONCE: a crash after shipping but before the checkpoint ships that batch again.
+"""
+
+
+class ShipmentOutbox:
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._next_seq, self.durable_size = self._recover()
+        self._file = open(path, "ab")
+        self._pending = []
+        # One condition for the writer (new records) and the dispatchers (new durable records)
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.commits = 0
+        self._writer = threading.Thread(target=self._write_loop, name="outbox-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, item_name, packaging_type, attempt=0, category=None):
+        return self.append_many([item_name], [packaging_type], attempt, category)[0]
+
+    def append_many(self, item_names, packaging_types, attempt=0, category=None):
+        # Durably logs one record per item and gives back their sequence numbers
+        # category is shared by the whole batch, it decides the carrier the dispatcher ships with
+        category = None if category is None else Category.parse(category).name
+        future = Future()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("ShipmentOutbox is closed")
+            first_seq = self._next_seq
+            self._next_seq += len(item_names)
+            data = b"".join(
+                json.dumps({"seq": seq, "item_name": item_name,
+                            "packaging_type": PackagingType.parse(packaging_type).name,
+                            "category": category, "attempt": attempt}).encode("utf-8") + b"\n"
+                for seq, item_name, packaging_type in zip(range(first_seq, self._next_seq),
+                                                          item_names, packaging_types)
+            )
+            self._pending.append((data, future))
+            self._condition.notify_all()
+        future.result()
+        return list(range(first_seq, first_seq + len(item_names)))
+
+    @property
+    def stopped(self):
+        # Closed or failed, no record will become durable anymore
+        return self._stopped
+
+    def wait_for_records(self, offset, timeout=None):
+        # Blocks until the log is durable past `offset` or the timeout runs out
+        with self._condition:
+            return self._condition.wait_for(lambda: self.durable_size > offset or self._stopped, timeout)
+
+    def close(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._writer.join()
+        self._file.close()
+
+    def _recover(self):
+        if not os.path.exists(self.path):
+            return 1, 0
+        last_seq = 0
+        good_size = 0
+        with open(self.path, "rb") as log:
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    last_seq = json.loads(line)["seq"]
+                except ValueError:
+                    break
+                good_size += len(line)
+        if good_size != os.path.getsize(self.path):
+            # TORN WRITE from a crash, the record was never acknowledged so it is dropped
+            with open(self.path, "r+b") as log:
+                log.truncate(good_size)
+        return last_seq + 1, good_size
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopped)
+                if not self._pending:
+                    return
+                batch = self._pending
+                self._pending = []
+            try:
+                self._file.write(b"".join(data for data, _ in batch))
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except Exception as error:
+                # The log may now end in a partial write, stop taking records, reopening recovers it
+                with self._condition:
+                    self._stopped = True
+                    failed, self._pending = batch + self._pending, []
+                for _, future in failed:
+                    future.set_exception(error)
+                return
+            with self._condition:
+                self.durable_size += sum(len(data) for data, _ in batch)
+                self.commits += 1
+                self._condition.notify_all()
+            for _, future in batch:
+                future.set_result(None)
+
+
+def carriers_of(order_services):
+    # {Category: ShippingService} for ShipmentDispatcher, keyed by the category each OrderService logs
+    if isinstance(order_services, dict):
+        order_services = order_services.values()
+    return {order_service.category: order_service.shipping_service for order_service in order_services
+            if order_service.category is not None}
+
+
+class ShipmentDispatcher(EventSource):
+
+    def __init__(self, outbox: ShipmentOutbox, shipping_service: ShippingService = None,
+                 checkpoint_path=None, batch_size=256, max_attempts=5, carriers=None):
+        self.outbox = outbox
+        # Without carriers it ships everything, with carriers only the records that have no category
+        self.shipping_service = shipping_service
+        self.carriers = None if carriers is None else {Category.parse(category): carrier
+                                                        for category, carrier in carriers.items()}
+        self.checkpoint_path = checkpoint_path or outbox.path + ".checkpoint"
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.offset = self._load_checkpoint()
+        self._reader = open(outbox.path, "rb")
+        self._stopped = threading.Event()
+        self._thread = None
+        self.dispatched = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def lag(self):
+        # Bytes of durable records not shipped yet
+        return self.outbox.durable_size - self.offset
+
+    def run_once(self):
+        # Ships at most one batch, returns how many records it handled
+        if self.outbox.stopped:
+            return 0
+        records, offset = self._read_batch()
+        if not records:
+            return 0
+        self._dispatch(records)
+        self._save_checkpoint(offset)
+        self.offset = offset
+        return len(records)
+
+    def drain(self):
+        while self.run_once():
+            pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="shipment-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._reader.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self.run_once():
+                continue
+            if self.outbox.stopped:
+                # Closed or failed, the next dispatcher on this log goes on from the checkpoint
+                return
+            self.outbox.wait_for_records(self.offset, timeout=0.1)
+
+    def _read_batch(self):
+        durable_size = self.outbox.durable_size
+        self._reader.seek(self.offset)
+        records = []
+        offset = self.offset
+        while len(records) < self.batch_size and offset < durable_size:
+            line = self._reader.readline()
+            offset += len(line)
+            records.append(json.loads(line))
+        return records, offset
+
+    def _dispatch(self, records):
+        # Every carrier gets ONE ship_items call for its records in this batch
+        by_carrier = {}
+        retries = []
+        for record in records:
+            try:
+                carrier = self._carrier_for(record)
+            except Exception as error:
+                self._failed(record, error)
+                continue
+            by_carrier.setdefault(carrier, []).append(record)
+        for carrier, carrier_records in by_carrier.items():
+            retries.extend(self._ship(carrier, carrier_records))
+
+        for attempt, category in sorted({(record["attempt"], record.get("category") or "") for record in retries}):
+            again = [record for record in retries
+                     if record["attempt"] == attempt and (record.get("category") or "") == category]
+            try:
+                self.outbox.append_many([record["item_name"] for record in again],
+                                        [record["packaging_type"] for record in again], attempt + 1, category or None)
+            except Exception as error:
+                # Closed or failed meanwhile, the checkpoint still has to move past the parcels that did book
+                for record in again:
+                    self._failed(record, error)
+                continue
+            self.retried += len(again)
+
+    def _carrier_for(self, record):
+        category = record.get("category")
+        if self.carriers is not None and category is not None:
+            carrier = self.carriers.get(Category.parse(category))
+            if carrier is None:
+                raise LookupError(f"no carrier for category {category}")
+            return carrier
+        if self.shipping_service is None:
+            raise LookupError("record has no category and the dispatcher has no shipping_service")
+        return self.shipping_service
+
+    def _ship(self, shipping_service, records):
+        # Ships the records with one carrier, returns the ones to try again
+        try:
+            outcomes = shipping_service.ship_items([record["item_name"] for record in records])
+        except Exception as error:
+            outcomes = [error] * len(records)
+
+        capabilities = shipping_service.capabilities
+        retries = []
+        for record, outcome in zip(records, outcomes):
+            if isinstance(outcome, Exception):
+                if record["attempt"] + 1 < self.max_attempts:
+                    retries.append(record)
+                else:
+                    self._failed(record, outcome)
+                continue
+            self.dispatched += 1
+            try:
+                if capabilities & _TRACKING:
+                    shipping_service.track_service()
+                if capabilities & _ETA:
+                    shipping_service.eta_service()
+            except Exception:
+                # The parcel IS booked, retrying it would book it twice
+                pass
+        return retries
+
+    def _failed(self, record, error):
+        self.failed += 1
+        self.event_sink.emit("shipment_failed", seq=record["seq"], item_name=record["item_name"], error=repr(error))
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as checkpoint:
+                return json.load(checkpoint)["offset"]
+        except FileNotFoundError:
+            return 0
+
+    def _save_checkpoint(self, offset):
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as checkpoint:
+            json.dump({"offset": offset}, checkpoint)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+
+
+# =========================
+# MAIN
+# =========================
+class SlowCarrier(ShippingService):
+    # Every booking takes 20ms, like a carrier API on a bad day
+    def __init__(self):
+        self.booked = 0
+        self._lock = threading.Lock()
+
+    def ship_item(self):
+        time.sleep(0.02)
+        with self._lock:
+            self.booked += 1
+
+
+def _accept_orders(order_service, orders, threads):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def accept(number):
+        started = time.perf_counter()
+        order_service.process_order(f"SKU-{number % 100}", "NORMAL")
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(accept, range(orders)))
+    elapsed = time.perf_counter() - started
+    return orders / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    import tempfile
+    from composition_ex_oop import DefaultInventoryService, DefaultPackagingService, OrderService
+    EventSource.event_sink = NullEventSink()
+
+    orders = 1000
+    threads = 16
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "shipments.log")
+        print(f"{'mode':<16} {'orders/sec':>11} {'p50 ms':>8} {'p99 ms':>8}")
+
+        inline = OrderService(DefaultInventoryService(), DefaultPackagingService(), SlowCarrier())
+        rate, p50, p99 = _accept_orders(inline, orders, threads)
+        print(f"{'inline ship':<16} {rate:>11,.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f}")
+
+        carrier = SlowCarrier()
+        outbox = ShipmentOutbox(path)
+        accepting = OrderService(DefaultInventoryService(), DefaultPackagingService(), carrier, outbox=outbox)
+        rate, p50, p99 = _accept_orders(accepting, orders, threads)
+        print(f"{'outbox append':<16} {rate:>11,.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f}"
+              f"   ({outbox.commits} fsyncs for {orders} orders)")
+
+        # The dispatcher ships 300 parcels, then the process "dies"
+        dispatcher = ShipmentDispatcher(outbox, carrier, batch_size=100)
+        for _ in range(3):
+            dispatcher.run_once()
+        dispatcher.stop()
+        outbox.close()
+        print(f"before restart: {carrier.booked} of {orders} shipped")
+
+        outbox = ShipmentOutbox(path)
+        dispatcher = ShipmentDispatcher(outbox, carrier, batch_size=100)
+        dispatcher.drain()
+        dispatcher.stop()
+        outbox.close()
+        print(f"after restart:  {carrier.booked} of {orders} shipped, lag {dispatcher.lag} bytes")
+
+
+if __name__ == "__main__":
+    main()
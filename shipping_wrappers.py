@@ -0,0 +1,82 @@
+import threading
+
+from composition_ex_oop import _ETA, _TRACKING, ETAChecker, ShippingService, Trackable
+
+"""
+A wrapper around a carrier (concurrency limit, manifests, ETA cache, failover ...) must claim exactly
+the capabilities of the carrier it wraps, and claim them on its CLASS since that is what
+capabilities_of and CarrierRegistry.carriers_with look at.
+
+DelegatingShippingService does that the way async_order_service picks its adapters: an instance is
+made of the VARIANT of the wrapper class that also has the carrier's Trackable / ETAChecker bases,
+built once per (wrapper class, capabilities). Every call is forwarded to self.carrier, subclasses
+override what they change.
+
+    class LimitedShippingService(DelegatingShippingService):
+        def ship_item(self): ...
+
+    LimitedShippingService(DelhiveryShippingService(), limiter)   # a LimitedShippingServiceTrackableETAChecker
+
+A variant is not a module attribute, copy / pickle rebuild it through variant_for.
+"""
+
+_VARIANTS = {}
+_VARIANTS_LOCK = threading.Lock()
+
+
+def _new_variant(wrapper_class, capabilities):
+    # Unpickling / copying, the instance state is set afterwards
+    return ShippingService.__new__(wrapper_class.variant_for(capabilities))
+
+
+class DelegatingShippingService(ShippingService):
+
+    def __new__(cls, *args, **kwargs):
+        return super().__new__(cls.variant_for(cls._delegate(*args, **kwargs).capabilities))
+
+    @staticmethod
+    def _delegate(carrier, *args, **kwargs):
+        # Gets the constructor arguments, returns the carrier whose capabilities the wrapper claims
+        return carrier
+
+    @classmethod
+    def variant_for(cls, capabilities):
+        base = cls.__dict__.get("_variant_of", cls)
+        key = (base, capabilities)
+        variant = _VARIANTS.get(key)
+        if variant is None:
+            with _VARIANTS_LOCK:
+                variant = _VARIANTS.get(key)
+                if variant is None:
+                    mixins = []
+                    if capabilities & _TRACKING and not issubclass(base, Trackable):
+                        mixins.append(Trackable)
+                    if capabilities & _ETA and not issubclass(base, ETAChecker):
+                        mixins.append(ETAChecker)
+                    if not mixins:
+                        variant = base
+                    else:
+                        name = base.__name__ + "".join(mixin.__name__ for mixin in mixins)
+                        variant = type(base)(name, (base, *mixins), {"__module__": base.__module__,
+                                                                    "__qualname__": name, "_variant_of": base})
+                    _VARIANTS[key] = variant
+        return variant
+
+    def __reduce__(self):
+        wrapper_class = type(self).__dict__.get("_variant_of", type(self))
+        return _new_variant, (wrapper_class, type(self).capabilities), self.__dict__
+
+    def ship_item(self):
+        return self.carrier.ship_item()
+
+    def ship_items(self, item_names):
+        return self.carrier.ship_items(item_names)
+
+    def track_service(self, shipment_id=None):
+        return self.carrier.track_service(shipment_id)
+
+    def track_shipments(self, shipment_ids):
+        return self.carrier.track_shipments(shipment_ids)
+
+    def eta_service(self, origin=None, destination=None):
+        return self.carrier.eta_service(origin, destination)
@@ -0,0 +1,200 @@
+import os
+import queue
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+from composition_ex_oop import InventoryService, OutOfStockError
+
+"""
+SingleResponsibilityBadExample.connect_to_inventory_db_and_check_for_item "connects" on EVERY call.
+SQLiteInventoryService is a persistent InventoryService that runs locally with no external DB.
+
+    Connections are opened ONCE and reused from a small pool
+    check / reserve always run the same parameterised SQL, sqlite3 keeps the compiled
+    statement in each connection's statement cache so it is prepared only once per connection
+    reserve_items reserves the whole batch inside ONE transaction (group commit),
+    so many reservations share one fsync instead of paying one each
+
+Durability is configurable:
+    journal_mode  "WAL" lets readers run while a reservation commits, "DELETE" is SQLite's default
+    synchronous   "FULL" fsyncs every commit, "NORMAL" in WAL mode only fsyncs on checkpoint
+                  (a crash may lose the last commits but never corrupts the db), "OFF" never fsyncs
+"""
+
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+class SQLiteConnectionPool:
+
+    def __init__(self, path, size=4, journal_mode="WAL", synchronous="NORMAL"):
+        journal_mode = journal_mode.upper()
+        synchronous = synchronous.upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unknown journal_mode {journal_mode!r}, expected one of {JOURNAL_MODES}")
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Unknown synchronous {synchronous!r}, expected one of {SYNCHRONOUS_LEVELS}")
+
+        self.path = path
+        self._connections = queue.Queue()
+        self._all = []
+        for _ in range(size):
+            # isolation_level=None -> we open and commit transactions ourselves
+            # check_same_thread=False -> a pooled connection may be used by a different thread
+            # than the one that opened it, but only by ONE thread at a time
+            connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False,
+                                         cached_statements=256)
+            connection.execute(f"PRAGMA journal_mode={journal_mode}")
+            connection.execute(f"PRAGMA synchronous={synchronous}")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._all.append(connection)
+            self._connections.put(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self._connections.get()
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so check-and-reserve cannot interleave
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            try:
+                connection.execute("COMMIT")
+            except BaseException:
+                # eg SQLITE_BUSY, the transaction is still open and the next user of this
+                # pooled connection would carry on inside it
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        for connection in self._all:
+            connection.close()
+        self._all = []
+
+
+class SQLiteInventoryService(InventoryService):
+    CREATE_SQL = ("CREATE TABLE IF NOT EXISTS inventory ("
+                  "item_name TEXT PRIMARY KEY, quantity INTEGER NOT NULL CHECK (quantity >= 0))")
+    CHECK_SQL = "SELECT quantity FROM inventory WHERE item_name = ?"
+    RESERVE_SQL = "UPDATE inventory SET quantity = quantity - ? WHERE item_name = ? AND quantity >= ?"
+    ADD_STOCK_SQL = ("INSERT INTO inventory (item_name, quantity) VALUES (?, ?) "
+                     "ON CONFLICT(item_name) DO UPDATE SET quantity = quantity + excluded.quantity")
+
+    def __init__(self, path, pool_size=4, journal_mode="WAL", synchronous="NORMAL"):
+        # path must be a file, every ":memory:" connection would be its own separate database
+        self.pool = SQLiteConnectionPool(path, pool_size, journal_mode, synchronous)
+        with self.pool.connection() as connection:
+            connection.execute(self.CREATE_SQL)
+
+    def close(self):
+        self.pool.close()
+
+    def add_stock(self, item_name, quantity):
+        with self.pool.transaction() as connection:
+            connection.execute(self.ADD_STOCK_SQL, (item_name, quantity))
+
+    def add_stocks(self, stock):
+        with self.pool.transaction() as connection:
+            connection.executemany(self.ADD_STOCK_SQL, stock.items())
+
+    def stock_of(self, item_name):
+        with self.pool.connection() as connection:
+            row = connection.execute(self.CHECK_SQL, (item_name,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def check_item(self, item_name, quantity=1):
+        return self.stock_of(item_name) >= quantity
+
+    def reserve_item(self, item_name, quantity=1):
+        # One reservation, one transaction, one commit
+        with self.pool.transaction() as connection:
+            cursor = connection.execute(self.RESERVE_SQL, (quantity, item_name, quantity))
+        if cursor.rowcount != 1:
+            raise OutOfStockError(f"{item_name} does not have {quantity} in stock")
+
+    def try_reserve(self, item_name, quantity=1):
+        # The conditional UPDATE checks and reserves in one statement, atomic across connections
+        with self.pool.transaction() as connection:
+            cursor = connection.execute(self.RESERVE_SQL, (quantity, item_name, quantity))
+        return cursor.rowcount == 1
+
+    def release_item(self, item_name, quantity=1):
+        self.add_stock(item_name, quantity)
+
+    def check_items(self, item_names, quantities=None):
+        if quantities is None:
+            quantities = [1] * len(item_names)
+        with self.pool.connection() as connection:
+            results = []
+            for item_name, quantity in zip(item_names, quantities):
+                row = connection.execute(self.CHECK_SQL, (item_name,)).fetchone()
+                results.append(row is not None and row[0] >= quantity)
+        return results
+
+    def reserve_items(self, item_names, quantities=None):
+        # GROUP COMMIT: every reservation of the batch goes into ONE transaction
+        # an item without enough stock only fails itself, the others still commit
+        if quantities is None:
+            quantities = [1] * len(item_names)
+        reserved = self.try_reserve_items(item_names, quantities)
+        return [None if ok else OutOfStockError(f"{item_name} does not have {quantity} in stock")
+                for item_name, quantity, ok in zip(item_names, quantities, reserved)]
+
+    def try_reserve_items(self, item_names, quantities=None):
+        # Same ONE transaction, the conditional UPDATE is the atomic check and reserve of every item
+        if quantities is None:
+            quantities = [1] * len(item_names)
+        results = []
+        with self.pool.transaction() as connection:
+            for item_name, quantity in zip(item_names, quantities):
+                cursor = connection.execute(self.RESERVE_SQL, (quantity, item_name, quantity))
+                results.append(cursor.rowcount == 1)
+        return results
+
+
+# =========================
+# MAIN (BENCHMARK)
+# =========================
+def _benchmark(journal_mode, synchronous, reservations, group_size):
+    with tempfile.TemporaryDirectory() as directory:
+        inventory = SQLiteInventoryService(os.path.join(directory, "inventory.db"),
+                                           journal_mode=journal_mode, synchronous=synchronous)
+        item_names = [f"SKU-{number % 100}" for number in range(reservations)]
+        inventory.add_stocks({f"SKU-{number}": reservations for number in range(100)})
+
+        started = time.perf_counter()
+        if group_size == 1:
+            for item_name in item_names:
+                inventory.reserve_item(item_name)
+        else:
+            for start in range(0, reservations, group_size):
+                inventory.reserve_items(item_names[start:start + group_size])
+        elapsed = time.perf_counter() - started
+        inventory.close()
+    return reservations / elapsed
+
+
+def main():
+    reservations = 2000
+    print(f"{'journal':<8} {'synchronous':<12} {'group size':>10} {'reservations/sec':>18}")
+    for journal_mode, synchronous in (("DELETE", "FULL"), ("WAL", "FULL"), ("WAL", "NORMAL")):
+        for group_size in (1, 100):
+            rate = _benchmark(journal_mode, synchronous, reservations, group_size)
+            print(f"{journal_mode:<8} {synchronous:<12} {group_size:>10} {rate:>18,.0f}")
+
+
+if __name__ == "__main__":
+    main()
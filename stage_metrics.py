@@ -0,0 +1,120 @@
+import threading
+from array import array
+
+"""
+When an order is slow we could not tell WHICH stage was slow.
+OrderService(..., metrics=StageMetrics()) times every stage of process_order with
+time.perf_counter_ns (monotonic, high resolution) and records it into a histogram
+per (stage, carrier class).
+
+Stages: reserve (the atomic try_reserve, stock check included), packaging, shipping, tracking, eta
+        outbox_append instead of shipping / tracking / eta when OrderService runs with an outbox
+
+LogHistogram is log-bucketed like HdrHistogram:
+    every power of two is split into 8 sub-buckets -> about 12% worst case error
+    a FIXED array of counters, memory does not grow with the number of samples
+    values up to 2**40 ns (~18 minutes), bigger ones land in the last bucket
+
+With metrics=None (the default) process_order does one attribute check and runs
+the same code as before, so it can stay compiled in for production.
+"""
+
+STAGES = ("reserve", "packaging", "shipping", "tracking", "eta", "outbox_append")
+
+
+class LogHistogram:
+    SUB_BUCKET_BITS = 3
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    MAX_VALUE_BITS = 40
+
+    def __init__(self):
+        bucket_count = (self.MAX_VALUE_BITS - self.SUB_BUCKET_BITS + 1) * self.SUB_BUCKETS
+        self._counts = array("Q", bytes(8 * bucket_count))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        shift = value.bit_length() - (self.SUB_BUCKET_BITS + 1)
+        if shift <= 0:
+            return value
+        return min(shift * self.SUB_BUCKETS + (value >> shift), len(self._counts) - 1)
+
+    def _lowest_value(self, index):
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        return (index - shift * self.SUB_BUCKETS) << shift
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        # Lowest value of the bucket holding the requested rank, never above the recorded max
+        if not self.count:
+            return 0
+        rank = max(1, int(fraction * self.count + 0.5))
+        seen = 0
+        for index, bucket_count in enumerate(self._counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self._lowest_value(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ns": self.total / self.count if self.count else 0,
+            "min_ns": self.min or 0,
+            "p50_ns": self.percentile(0.50),
+            "p90_ns": self.percentile(0.90),
+            "p99_ns": self.percentile(0.99),
+            "p999_ns": self.percentile(0.999),
+            "max_ns": self.max,
+        }
+
+
+class StageMetrics:
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, carrier, nanoseconds):
+        key = (stage, carrier)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LogHistogram()
+            histogram.record(nanoseconds)
+
+    def snapshot(self, reset=False):
+        # {stage: {carrier class name: histogram summary}}, reset=True starts a fresh window atomically
+        with self._lock:
+            if not reset:
+                # The live histograms, record() keeps adding to them, so they are read under the lock
+                return self._report(self._histograms)
+            histograms = self._histograms
+            self._histograms = {}
+        # Detached from record(), nobody else touches them anymore
+        return self._report(histograms)
+
+    @staticmethod
+    def _report(histograms):
+        report = {}
+        for (stage, carrier), histogram in histograms.items():
+            report.setdefault(stage, {})[carrier] = histogram.snapshot()
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
@@ -0,0 +1,178 @@
+import random
+import sys
+import threading
+import time
+
+from composition_ex_oop import InventoryService, OutOfStockError
+
+"""
+process_order used to call check_item and then reserve_item, two separate steps:
+two orders running at the same time could BOTH pass the check for the last unit -> oversold.
+
+InventoryService.try_reserve checks and reserves as ONE step.
+StripedInventoryService makes it safe to share between threads WITHOUT one global lock:
+
+    the stock is split into `stripes` dicts, each with its own lock
+    a SKU always lives in stripe hash(item_name) & (stripes - 1)
+    -> orders for unrelated SKUs take different locks and never wait on each other
+    -> orders for the same SKU take the same lock, so its count can never go below zero
+
+On a GIL build the threads still take turns running Python code, striping pays off when
+the lock is held across I/O or on a free-threaded interpreter, a global lock never does.
+
+Run this module for the stress test: many threads hammer try_reserve, the total reserved must
+equal the stock that was there, and reservations/sec is reported per thread count.
+"""
+
+
+class StripedInventoryService(InventoryService):
+
+    def __init__(self, stock=None, stripes=64):
+        if stripes < 1 or stripes & (stripes - 1):
+            raise ValueError("stripes must be a power of two")
+        self._mask = stripes - 1
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stocks = [{} for _ in range(stripes)]
+        if stock:
+            for item_name, quantity in stock.items():
+                self.add_stock(item_name, quantity)
+
+    def _stripe(self, item_name):
+        return hash(item_name) & self._mask
+
+    def add_stock(self, item_name, quantity):
+        stripe = self._stripe(item_name)
+        with self._locks[stripe]:
+            stock = self._stocks[stripe]
+            stock[sys.intern(item_name)] = stock.get(item_name, 0) + quantity
+
+    def stock_of(self, item_name):
+        stripe = self._stripe(item_name)
+        with self._locks[stripe]:
+            return self._stocks[stripe].get(item_name, 0)
+
+    def check_item(self, item_name, quantity=1):
+        # Only a snapshot, use try_reserve to act on it
+        return self.stock_of(item_name) >= quantity
+
+    def reserve_item(self, item_name, quantity=1):
+        if not self.try_reserve(item_name, quantity):
+            raise OutOfStockError(f"{item_name} does not have {quantity} in stock")
+
+    def try_reserve(self, item_name, quantity=1):
+        stripe = self._stripe(item_name)
+        with self._locks[stripe]:
+            stock = self._stocks[stripe]
+            available = stock.get(item_name, 0)
+            if available < quantity:
+                return False
+            stock[item_name] = available - quantity
+            return True
+
+    def release_item(self, item_name, quantity=1):
+        self.add_stock(item_name, quantity)
+
+    def reserve_items(self, item_names, quantities=None):
+        if quantities is None:
+            quantities = [1] * len(item_names)
+        reserved = self.try_reserve_items(item_names, quantities)
+        return [None if ok else OutOfStockError(f"{item_name} does not have {quantity} in stock")
+                for item_name, quantity, ok in zip(item_names, quantities, reserved)]
+
+    def try_reserve_items(self, item_names, quantities=None):
+        # Every stripe is locked ONCE for all of its items in the batch, items keep their batch
+        # order inside a stripe so orders for the same SKU are served first come first served
+        if quantities is None:
+            quantities = [1] * len(item_names)
+        by_stripe = {}
+        for index, item_name in enumerate(item_names):
+            by_stripe.setdefault(self._stripe(item_name), []).append(index)
+
+        results = [False] * len(item_names)
+        for stripe, indexes in by_stripe.items():
+            with self._locks[stripe]:
+                stock = self._stocks[stripe]
+                for index in indexes:
+                    item_name, quantity = item_names[index], quantities[index]
+                    available = stock.get(item_name, 0)
+                    if available >= quantity:
+                        stock[item_name] = available - quantity
+                        results[index] = True
+        return results
+
+
+# =========================
+# MAIN (STRESS TEST)
+# =========================
+class UnsafeInventoryService(InventoryService):
+    # check and reserve with nothing in between to stop another thread, what we had before
+    def __init__(self, stock):
+        self._stock = dict(stock)
+
+    def stock_of(self, item_name):
+        return self._stock.get(item_name, 0)
+
+    def check_item(self, item_name, quantity=1):
+        available = self._stock.get(item_name, 0) >= quantity
+        # A real store is a network round trip away, other threads run meanwhile
+        time.sleep(0)
+        return available
+
+    def reserve_item(self, item_name, quantity=1):
+        self._stock[item_name] = self._stock.get(item_name, 0) - quantity
+
+
+def _stress(inventory, item_names, threads, attempts):
+    # Every thread tries to reserve random SKUs, returns reservations/sec and how many succeeded
+    reserved = [0] * threads
+    start = threading.Barrier(threads + 1)
+
+    def worker(number):
+        pick = random.Random(number).choice
+        count = 0
+        start.wait()
+        for _ in range(attempts // threads):
+            if inventory.try_reserve(pick(item_names)):
+                count += 1
+        reserved[number] = count
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return attempts / elapsed, sum(reserved)
+
+
+def main():
+    sku_count = 1000
+    units = 50
+    attempts = 80_000
+    item_names = [f"SKU-{number}" for number in range(sku_count)]
+    total_stock = sku_count * units
+
+    print(f"{sku_count} SKUs x {units} units = {total_stock} units, {attempts} reservation attempts")
+    print(f"{'inventory':<22} {'threads':>7} {'attempts/sec':>13} {'reserved':>9} {'oversold':>9}")
+
+    def report(name, inventory, threads):
+        rate, reserved = _stress(inventory, item_names, threads, attempts)
+        left = [inventory.stock_of(item_name) for item_name in item_names]
+        # A count below zero is a unit sold that was not there
+        oversold = -sum(count for count in left if count < 0)
+        print(f"{name:<22} {threads:>7} {rate:>13,.0f} {reserved:>9} {oversold:>9}")
+        # Reserved units plus what is left must add up to the stock we started with
+        return oversold == 0 and reserved + sum(left) == total_stock
+
+    stock = {item_name: units for item_name in item_names}
+    report("check then reserve", UnsafeInventoryService(stock), 8)
+    for threads in (1, 2, 4, 8, 16):
+        for name, stripes in (("global lock", 1), ("striped, 64 stripes", 64)):
+            if not report(name, StripedInventoryService(stock, stripes=stripes), threads):
+                raise AssertionError(f"StripedInventoryService with {stripes} stripe(s) oversold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import threading
+import unittest
+
+from order_events import EventSource, NullEventSink
+from striped_inventory import StripedInventoryService, _stress
+
+
+class StripedInventoryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        EventSource.event_sink = NullEventSink()
+
+    def assert_not_oversold(self, inventory, item_names, reserved, total_stock):
+        left = [inventory.stock_of(item_name) for item_name in item_names]
+        self.assertTrue(all(count >= 0 for count in left), left)
+        self.assertEqual(reserved + sum(left), total_stock)
+
+    def test_try_reserve_never_oversells(self):
+        item_names = [f"SKU-{number}" for number in range(20)]
+        for stripes in (1, 4):
+            inventory = StripedInventoryService({item_name: 5 for item_name in item_names}, stripes=stripes)
+            _, reserved = _stress(inventory, item_names, threads=8, attempts=4000)
+            self.assertEqual(reserved, 100)
+            self.assert_not_oversold(inventory, item_names, reserved, 100)
+
+    def test_try_reserve_items_never_oversells(self):
+        item_names = [f"SKU-{number}" for number in range(10)]
+        inventory = StripedInventoryService({item_name: 7 for item_name in item_names}, stripes=4)
+        reserved = [0] * 8
+        start = threading.Barrier(8)
+
+        def worker(number):
+            batch = [item_names[(number + offset) % len(item_names)] for offset in range(25)]
+            start.wait()
+            for _ in range(10):
+                reserved[number] += sum(inventory.try_reserve_items(batch))
+
+        workers = [threading.Thread(target=worker, args=(number,)) for number in range(8)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(sum(reserved), 70)
+        self.assert_not_oversold(inventory, item_names, sum(reserved), 70)
+
+    def test_try_reserve_items_serves_a_batch_in_order(self):
+        inventory = StripedInventoryService({"iPhone 16": 3})
+        self.assertEqual(inventory.try_reserve_items(["iPhone 16", "iPhone 16", "Pixel"], [2, 2, 1]),
+                         [True, False, False])
+        self.assertEqual(inventory.stock_of("iPhone 16"), 1)
+
+    def test_one_batch_cannot_sell_the_last_unit_twice(self):
+        from composition_ex_oop import DefaultPackagingService, EkartShippingService, OrderService
+
+        inventory = StripedInventoryService({"iPhone 16": 1})
+        order_service = OrderService(inventory, DefaultPackagingService(), EkartShippingService())
+        results = order_service.process_orders([
+            {"item_name": "iPhone 16", "packaging_type": "NORMAL"},
+            {"item_name": "iPhone 16", "packaging_type": "GIFT"},
+        ])
+        self.assertEqual([result.processed for result in results], [True, False])
+        self.assertEqual(inventory.stock_of("iPhone 16"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
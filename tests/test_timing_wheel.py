@@ -0,0 +1,55 @@
+import random
+import unittest
+
+from timing_wheel import HierarchicalTimingWheel
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class HierarchicalTimingWheelTest(unittest.TestCase):
+
+    def test_rejects_a_single_level(self):
+        with self.assertRaises(ValueError):
+            HierarchicalTimingWheel(levels=1)
+
+    def test_fires_every_timer_in_its_own_tick(self):
+        # Tiny wheels so timers cascade and overflow the top level all the time
+        for slot_bits, levels in ((1, 2), (2, 2), (2, 3), (3, 4)):
+            with self.subTest(slot_bits=slot_bits, levels=levels):
+                self.check_against_model(random.Random(slot_bits * 10 + levels), slot_bits, levels)
+
+    def check_against_model(self, rng, slot_bits, levels):
+        clock = FakeClock()
+        wheel = HierarchicalTimingWheel(tick=1.0, slot_bits=slot_bits, levels=levels, clock=clock)
+        span = 1 << (slot_bits * levels)
+        pending = {}
+        next_id = 0
+        for _ in range(3000):
+            if rng.random() < 0.6:
+                # Delays well past the whole wheel too
+                delay = rng.choice((rng.uniform(0, 4), rng.uniform(0, span), rng.uniform(0, 3 * span)))
+                pending[next_id] = wheel.schedule(next_id, delay)
+                next_id += 1
+            else:
+                clock.now += rng.choice((1, 1, 2, rng.randint(1, span)))
+                expired = wheel.advance()
+                due = {timer_id for timer_id, expire_tick in pending.items() if expire_tick <= wheel.current_tick}
+                self.assertEqual(sorted(expired), sorted(due))
+                for timer_id in expired:
+                    del pending[timer_id]
+                self.assertEqual(wheel.size, len(pending))
+
+        clock.now += 4 * span
+        self.assertEqual(sorted(wheel.advance()), sorted(pending))
+        self.assertEqual(wheel.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
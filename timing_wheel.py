@@ -0,0 +1,105 @@
+import time
+from array import array
+
+"""
+Hierarchical timing wheel (Varghese & Lauck, the same structure Kafka and Netty use for timeouts).
+
+Time is cut into ticks of `tick` seconds. Level 0 has one slot per tick for the next 2**slot_bits
+ticks, every level above covers 2**slot_bits times the span of the one below:
+
+    slot_bits=8, levels=4, tick=0.05s -> 12.8s / 54min / 9.7 days / 6.8 years
+
+    schedule(timer_id, delay)   O(1), the id is appended to the slot of its expiry tick
+                                on the lowest level that can hold it
+    advance(now)                moves the wheel tick by tick and returns the ids that expired,
+                                when a level-0 rotation completes the next slot of the level above is
+                                CASCADED down, so every timer moves down at most `levels` times
+                                -> O(1) amortized per timer, no per-timer thread or Timer object,
+                                   no scan over every pending timer
+
+Slots are typed arrays, a pending timer costs 16 bytes (id + expiry tick, both "Q").
+There is no cancel: a cancelled timer still fires and the caller ignores ids it no longer knows.
+Timer ids are unsigned 64 bit ints.
+"""
+
+
+class HierarchicalTimingWheel:
+
+    def __init__(self, tick=0.05, slot_bits=8, levels=4, clock=time.monotonic):
+        # A timer beyond the top level is parked in a top level slot and placed again when it cascades,
+        # with ONE level that slot is level 0 and would fire it early
+        if levels < 2:
+            raise ValueError("levels must be at least 2")
+        if slot_bits < 1:
+            raise ValueError("slot_bits must be at least 1")
+        self.tick = tick
+        self.levels = levels
+        self._clock = clock
+        self._bits = slot_bits
+        self._mask = (1 << slot_bits) - 1
+        self._ids = [[array("Q") for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self._ticks = [[array("Q") for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self.current_tick = self._tick_of(clock())
+        self.size = 0
+
+    def _tick_of(self, seconds):
+        return int(seconds / self.tick)
+
+    def schedule(self, timer_id, delay):
+        # Never in the current tick, it was already fired
+        expire_tick = max(self._tick_of(self._clock() + delay), self.current_tick + 1)
+        self._insert(timer_id, expire_tick)
+        self.size += 1
+        return expire_tick
+
+    def _insert(self, timer_id, expire_tick):
+        bits = self._bits
+        current_tick = self.current_tick
+        # Lowest level where the timer is less than one rotation of slots ahead, the slot on that
+        # level is then reached (fired or cascaded) before the timer is due and never aliases
+        level = 0
+        while level < self.levels and (expire_tick >> (bits * level)) - (current_tick >> (bits * level)) > self._mask:
+            level += 1
+        if level == self.levels:
+            # Further out than the whole wheel, park it in the top level slot that cascades LAST,
+            # it is placed again from there
+            level = self.levels - 1
+            slot = ((current_tick >> (bits * level)) - 1) & self._mask
+        else:
+            slot = (expire_tick >> (bits * level)) & self._mask
+        self._ids[level][slot].append(timer_id)
+        self._ticks[level][slot].append(expire_tick)
+
+    def advance(self, now=None):
+        target_tick = self._tick_of(self._clock() if now is None else now)
+        bits = self._bits
+        mask = self._mask
+        expired = []
+        while self.current_tick < target_tick:
+            if not self.size:
+                self.current_tick = target_tick
+                break
+            self.current_tick += 1
+            tick = self.current_tick
+
+            # CASCADE, from the top down so a slot cascaded into a lower level is itself cascaded in time
+            for level in range(self.levels - 1, 0, -1):
+                if (tick & ((1 << (bits * level)) - 1)) == 0:
+                    slot = (tick >> (bits * level)) & mask
+                    ids, ticks = self._ids[level][slot], self._ticks[level][slot]
+                    if ids:
+                        self._ids[level][slot], self._ticks[level][slot] = array("Q"), array("Q")
+                        for timer_id, expire_tick in zip(ids, ticks):
+                            self._insert(timer_id, expire_tick)
+
+            slot = tick & mask
+            ids = self._ids[0][slot]
+            if ids:
+                self._ids[0][slot], self._ticks[0][slot] = array("Q"), array("Q")
+                expired.extend(ids)
+                self.size -= len(ids)
+        return expired
+
+    def memory_usage(self):
+        # Bytes held by the slot arrays
+        return sum(slot.itemsize * len(slot) for wheel in (self._ids, self._ticks) for level in wheel for slot in level)
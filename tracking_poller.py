@@ -0,0 +1,216 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from composition_ex_oop import ShippingService, Trackable
+
+"""
+track_service is called once per parcel, and dashboards re-poll every in-flight shipment,
+so a carrier gets N separate calls for N parcels.
+
+TrackingPoller:
+    register(shipment_id, carrier)  remembers which carrier has the parcel
+    poll(shipment_id)               returns a Future with the parcel's status
+        requests are grouped BY CARRIER into ONE Trackable.track_shipments call per batch
+        concurrent requests for the same shipment share ONE Future (singleflight),
+        the carrier is only asked once
+    poll_all()                      polls every registered shipment, one call per carrier
+    subscribe(callback)             callback(shipment_id, status) for every fresh status
+    start() / stop()                background re-poll of everything every `interval` seconds
+
+So polling cost grows with the number of CARRIERS, not the number of parcels.
+"""
+
+
+class TrackingPoller:
+
+    def __init__(self, interval=5.0, max_batch_size=500):
+        self.interval = interval
+        self.max_batch_size = max_batch_size
+        self._carriers = {}
+        self._subscribers = []
+        self._in_flight = {}
+        self._queued = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="tracking-dispatcher", daemon=True)
+        self._dispatcher.start()
+        self._ticker = None
+        self.carrier_calls = 0
+
+    def register(self, shipment_id, carrier: Trackable):
+        if not isinstance(carrier, Trackable):
+            raise TypeError(f"{type(carrier).__name__} does not support tracking")
+        with self._condition:
+            self._carriers[shipment_id] = carrier
+
+    def unregister(self, shipment_id):
+        with self._condition:
+            self._carriers.pop(shipment_id, None)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def poll(self, shipment_id):
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("TrackingPoller is stopped")
+            future = self._in_flight.get(shipment_id)
+            if future is not None:
+                if not future.cancelled():
+                    # SINGLEFLIGHT, someone already asked, share their answer
+                    return future
+                # Its caller gave up but the shipment is still queued, a fresh Future takes its place
+                future = self._in_flight[shipment_id] = Future()
+                return future
+            carrier = self._carriers.get(shipment_id)
+            if carrier is None:
+                raise KeyError(f"Shipment {shipment_id!r} is not registered")
+            future = Future()
+            self._in_flight[shipment_id] = future
+            self._queued.setdefault(carrier, []).append(shipment_id)
+            self._condition.notify()
+        return future
+
+    def poll_all(self):
+        with self._condition:
+            shipment_ids = list(self._carriers)
+        return {shipment_id: self.poll(shipment_id) for shipment_id in shipment_ids}
+
+    def start(self):
+        self._ticker = threading.Thread(target=self._tick_loop, name="tracking-ticker", daemon=True)
+        self._ticker.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._dispatcher.join()
+        if self._ticker is not None:
+            self._ticker.join()
+
+    # =========================
+    # BACKGROUND THREADS
+    # =========================
+    def _tick_loop(self):
+        while True:
+            with self._condition:
+                if self._condition.wait_for(lambda: self._stopped, timeout=self.interval):
+                    return
+            try:
+                self.poll_all()
+            except RuntimeError:
+                # stop() came in while polling
+                return
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queued or self._stopped)
+                if self._stopped and not self._queued:
+                    return
+                queued = self._queued
+                self._queued = {}
+            for carrier, shipment_ids in queued.items():
+                for start in range(0, len(shipment_ids), self.max_batch_size):
+                    self._poll_carrier(carrier, shipment_ids[start:start + self.max_batch_size])
+
+    def _poll_carrier(self, carrier, shipment_ids):
+        with self._condition:
+            # Cancelled polls are dropped, the ones left can no longer be cancelled
+            live = []
+            for shipment_id in shipment_ids:
+                if self._in_flight[shipment_id].set_running_or_notify_cancel():
+                    live.append(shipment_id)
+                else:
+                    del self._in_flight[shipment_id]
+        shipment_ids = live
+        if not shipment_ids:
+            return
+        try:
+            self.carrier_calls += 1
+            statuses = carrier.track_shipments(shipment_ids)
+        except Exception as error:
+            with self._condition:
+                futures = [self._in_flight.pop(shipment_id) for shipment_id in shipment_ids]
+            for future in futures:
+                future.set_exception(error)
+            return
+
+        with self._condition:
+            futures = [self._in_flight.pop(shipment_id) for shipment_id in shipment_ids]
+        for shipment_id, future in zip(shipment_ids, futures):
+            status = statuses.get(shipment_id)
+            future.set_result(status)
+            for callback in self._subscribers:
+                try:
+                    callback(shipment_id, status)
+                except Exception:
+                    # A broken subscriber must not stop the others or the poller
+                    pass
+
+
+# =========================
+# LOCAL SIMULATED CARRIER
+# =========================
+class SimulatedTrackingCarrier(ShippingService, Trackable):
+    # Every CALL costs `call_latency` seconds however many parcels it asks about, like a real bulk API
+    STATUSES = ("BOOKED", "PICKED_UP", "IN_TRANSIT", "OUT_FOR_DELIVERY", "DELIVERED")
+
+    def __init__(self, name, call_latency=0.01):
+        self.name = name
+        self.call_latency = call_latency
+        self.calls = 0
+        self._polls = {}
+        self._lock = threading.Lock()
+
+    def ship_item(self):
+        self.event_sink.emit("shipped", carrier=self.name)
+
+    def track_service(self, shipment_id=None):
+        return self.track_shipments([shipment_id])[shipment_id]
+
+    def track_shipments(self, shipment_ids):
+        time.sleep(self.call_latency)
+        with self._lock:
+            self.calls += 1
+            statuses = {}
+            for shipment_id in shipment_ids:
+                polls = self._polls.get(shipment_id, 0)
+                self._polls[shipment_id] = polls + 1
+                statuses[shipment_id] = self.STATUSES[min(polls, len(self.STATUSES) - 1)]
+        return statuses
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    carriers = [SimulatedTrackingCarrier(name) for name in ("Delhivery", "Ekart", "BlueDart")]
+    poller = TrackingPoller()
+    delivered = set()
+    poller.subscribe(lambda shipment_id, status: status == "DELIVERED" and delivered.add(shipment_id))
+
+    parcels = 3000
+    for number in range(parcels):
+        poller.register(f"SHIP-{number}", carriers[number % len(carriers)])
+
+    started = time.perf_counter()
+    for _ in range(len(SimulatedTrackingCarrier.STATUSES)):
+        futures = poller.poll_all()
+        # a dashboard asking for the same parcels again at the same time shares the in-flight polls
+        duplicates = [poller.poll(f"SHIP-{number}") for number in range(0, parcels, 7)]
+        for future in list(futures.values()) + duplicates:
+            future.result()
+    elapsed = time.perf_counter() - started
+    poller.stop()
+
+    per_parcel_calls = parcels * len(SimulatedTrackingCarrier.STATUSES)
+    print(f"{parcels} parcels polled {len(SimulatedTrackingCarrier.STATUSES)} times in {elapsed:.2f}s")
+    print(f"carrier calls: {sum(carrier.calls for carrier in carriers)} "
+          f"(one call per parcel would be {per_parcel_calls})")
+    print(f"{len(delivered)} parcels reported DELIVERED")
+
+
+if __name__ == "__main__":
+    main()